@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image
+
+from variety import DominantColors as dominant_colors_module
+from variety.DominantColors import DominantColors
+
+
+@unittest.skipIf(dominant_colors_module.numpy is None, "numpy is not installed")
+class TestDominantColors(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Chdir to the tests directory so that we can find our test images
+        curdir = os.path.dirname(os.path.abspath(__file__))
+        if curdir:
+            os.chdir(curdir)
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def assertEnginesMatch(self, image_name):
+        python = DominantColors(image_name, only_size_needed=False, use_numpy=False)
+        vectorized = DominantColors(image_name, only_size_needed=False, use_numpy=True)
+        self.assertEqual(python.get_dominant_colors(), vectorized.get_dominant_colors())
+        self.assertEqual(python.get_lightness(), vectorized.get_lightness())
+
+    def test_test_image(self):
+        self.assertEnginesMatch("test.jpg")
+
+    def test_image_modes(self):
+        rnd = random.Random(42)
+        for mode in ("RGB", "RGBA", "L", "P", "CMYK"):
+            # coarse random values, so that there are plenty of ties between palette colors
+            image = Image.new("RGB", (64, 48))
+            image.putdata(
+                [
+                    tuple(rnd.choice((0, 64, 96, 128, 160, 192, 255)) for _ in range(3))
+                    for _ in range(64 * 48)
+                ]
+            )
+            image = image.convert(mode)
+            path = os.path.join(
+                self.tmp, "image_%s.%s" % (mode, "png" if mode != "CMYK" else "tif")
+            )
+            image.save(path)
+            self.assertEnginesMatch(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+
+import threading
+import time
+import unittest
+
+from variety.DownloadEngine import BandwidthLimiter, DownloadEngine
+
+
+class FakeSource:
+    def __init__(self, allowed=True):
+        self.allowed = allowed
+
+    def is_download_allowed(self):
+        return self.allowed
+
+    def get_next_download_time(self):
+        return time.time() if self.allowed else time.time() + 120
+
+
+class FakeDownloader:
+    def __init__(self, source):
+        self.source = source
+        self.config = None
+
+
+class TestDownloadEngine(unittest.TestCase):
+    def test_pick(self):
+        a, b, throttled = FakeSource(), FakeSource(), FakeSource(allowed=False)
+        a1, a2, b1, t1 = (
+            FakeDownloader(a),
+            FakeDownloader(a),
+            FakeDownloader(b),
+            FakeDownloader(throttled),
+        )
+        engine = DownloadEngine(None, None, max_concurrent=4)
+        # one download per source at a time, throttled sources are skipped
+        self.assertEqual([a1, b1], engine.pick([a1, a2, t1, b1]))
+
+        engine.configure(1, 0)
+        self.assertEqual([a2], engine.pick([a2, b1]))
+        engine.busy_lanes.add(b)
+        self.assertEqual([], engine.pick([a2, b1]))
+
+    def test_wait_time(self):
+        a, throttled = FakeSource(), FakeSource(allowed=False)
+        engine = DownloadEngine(None, None, max_concurrent=2)
+        self.assertEqual(DownloadEngine.MAX_WAIT, engine.get_wait_time([]))
+        self.assertAlmostEqual(120, engine.get_wait_time([FakeDownloader(throttled)]), delta=1)
+
+        # a lane that just completed a download is paused for a moment
+        engine.paused_lanes[a] = time.time() + DownloadEngine.LANE_PAUSE
+        self.assertAlmostEqual(
+            DownloadEngine.LANE_PAUSE,
+            engine.get_wait_time([FakeDownloader(a), FakeDownloader(throttled)]),
+            delta=0.1,
+        )
+
+        # busy lanes wake the engine up themselves when their download completes
+        engine.busy_lanes.add(a)
+        self.assertAlmostEqual(
+            120, engine.get_wait_time([FakeDownloader(a), FakeDownloader(throttled)]), delta=1
+        )
+        engine.busy_lanes.add(throttled)
+        self.assertEqual(DownloadEngine.MAX_WAIT, engine.get_wait_time([FakeDownloader(a)]))
+
+    def test_sources_download_in_parallel(self):
+        sources = [FakeSource() for _ in range(10)]
+        downloaders = [FakeDownloader(s) for s in sources]
+        lock = threading.Lock()
+        active = []
+        done = []
+
+        def download(dl):
+            with lock:
+                active.append(dl)
+                max_active.append(len(active))
+            time.sleep(0.2)
+            with lock:
+                active.remove(dl)
+                done.append(dl)
+
+        max_active = []
+        engine = DownloadEngine(
+            lambda: [dl for dl in downloaders if dl not in done], download, max_concurrent=5
+        )
+        thread = threading.Thread(target=engine.run, daemon=True)
+        thread.start()
+        deadline = time.time() + 5
+        while len(done) < 10 and time.time() < deadline:
+            time.sleep(0.05)
+        engine.stop()
+        thread.join(5)
+
+        self.assertEqual(set(downloaders), set(done))
+        self.assertEqual(5, max(max_active))
+
+    def test_bandwidth_limiter(self):
+        limiter = BandwidthLimiter(max_kbps=100)
+        start = time.monotonic()
+        for _ in range(30):
+            limiter.consume(10 * 1024)
+        # the first 100 KB are the burst, the other 200 KB take two seconds
+        self.assertAlmostEqual(2, time.monotonic() - start, delta=0.3)
+
+        limiter.set_max_kbps(0)
+        start = time.monotonic()
+        limiter.consume(10 * 1024 * 1024)
+        self.assertTrue(time.monotonic() - start < 0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
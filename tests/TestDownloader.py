@@ -14,14 +14,20 @@
 # You should have received a copy of the GNU General Public License along
 # with this program.  If not, see <http://www.gnu.org/licenses/>.
 ### END LICENSE
+import json
 import os
 import shutil
+import tempfile
+import time
 import unittest
 
 from jumble.Jumble import Jumble
 from tests import setup_test_logging
 from variety import Util
 from variety.AttrDict import AttrDict
+from variety.plugins.downloaders.DefaultDownloader import DefaultDownloader, QueueItem
+from variety.plugins.downloaders.ImageSource import ImageSource
+from variety.ResumableDownload import DownloadInterrupted
 
 setup_test_logging()
 
@@ -46,5 +52,115 @@ def test_download_one_for(test_case, dl):
     test_case.fail("Tried download_one 5 times, all failed")
 
 
+class _Source(ImageSource):
+    @classmethod
+    def get_info(cls):
+        return {"name": "Test", "description": "Test", "author": "Test", "version": "0.1"}
+
+    def get_source_type(self):
+        return "test"
+
+    def get_server_options(self):
+        raise KeyError("no server options")
+
+
+class _Downloader(DefaultDownloader):
+    def __init__(self, source, config):
+        super().__init__(source, config)
+        self.fills = 0
+        self.interrupted = set()
+
+    def get_folder_name(self):
+        return "test_" + self.config
+
+    def get_description(self):
+        return self.config
+
+    def fill_queue(self):
+        self.fills += 1
+        return [
+            QueueItem("https://example.com/%d" % i, "https://example.com/%d.jpg" % i, {})
+            for i in range(3)
+        ]
+
+    def download_queue_item(self, queue_item):
+        if queue_item[1] in self.interrupted:
+            raise DownloadInterrupted(queue_item.image_url)
+        return queue_item
+
+
+class TestDefaultDownloader(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def create(self):
+        dl = _Downloader(_Source(), "a")
+        os.makedirs(dl.update_download_folder(self.folder), exist_ok=True)
+        return dl
+
+    def test_queue_survives_restarts(self):
+        dl = self.create()
+        first = dl.download_one()
+        self.assertEqual(1, dl.fills)
+
+        # after a restart, the remaining items are downloaded without filling the queue again
+        dl = self.create()
+        second = dl.download_one()
+        third = dl.download_one()
+        self.assertEqual(0, dl.fills)
+        self.assertEqual(
+            {"https://example.com/%d.jpg" % i for i in range(3)},
+            {first.image_url, second[1], third[1]},
+        )
+        self.assertFalse(os.path.exists(os.path.join(dl.target_folder, "queue.json")))
+
+        dl = self.create()
+        dl.download_one()
+        self.assertEqual(1, dl.fills)
+
+    def test_interrupted_download_is_retried_after_the_rest(self):
+        dl = self.create()
+        dl.interrupted.add("https://example.com/2.jpg")
+        with self.assertRaises(DownloadInterrupted):
+            dl.download_one()
+        dl.interrupted.clear()
+        self.assertEqual("https://example.com/1.jpg", dl.download_one()[1])
+        self.assertEqual("https://example.com/0.jpg", dl.download_one()[1])
+        self.assertEqual("https://example.com/2.jpg", dl.download_one()[1])
+
+    def test_items_that_cannot_be_saved_are_skipped(self):
+        dl = self.create()
+        dl.download_one()
+        dl.queue.append(QueueItem("https://example.com/x", "https://example.com/x.jpg", object()))
+        with self.assertLogs("variety", level="WARNING") as logs:
+            dl.save_queue()
+            dl.save_queue()
+        self.assertEqual(1, len(logs.records))
+        self.assertEqual(
+            ["https://example.com/0.jpg", "https://example.com/1.jpg"],
+            [item[1] for item in self.create().queue],
+        )
+
+    def test_outdated_or_invalid_queue_is_ignored(self):
+        dl = self.create()
+        dl.download_one()
+        queue_file = os.path.join(dl.target_folder, "queue.json")
+        with open(queue_file) as f:
+            saved = json.load(f)
+
+        saved["filled_at"] = time.time() - DefaultDownloader.MAX_QUEUE_AGE - 1
+        with open(queue_file, "w") as f:
+            json.dump(saved, f)
+        self.assertEqual([], self.create().queue)
+
+        for content in ("not json", json.dumps({"items": []}), json.dumps([1, 2])):
+            with open(queue_file, "w") as f:
+                f.write(content)
+            self.assertEqual([], self.create().queue)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from variety.FontPaths import FontPaths
+
+
+class TestFontPaths(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.tmp, "font_paths.json")
+        self.font_file = os.path.join(self.tmp, "Serif.ttf")
+        with open(self.font_file, "w") as f:
+            f.write("not really a font")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_remembered_paths(self):
+        with open(self.cache_file, "w") as f:
+            json.dump({"Serif:Bold": [self.font_file, time.time()]}, f)
+
+        font_paths = FontPaths(self.cache_file)
+        font_paths._fc_match = lambda font_name: self.fail("fc-match should not run")
+        self.assertEqual(self.font_file, font_paths.resolve("Serif:Bold"))
+
+    def test_outdated_paths(self):
+        with open(self.cache_file, "w") as f:
+            json.dump(
+                {
+                    "Old": [self.font_file, time.time() - 30 * 24 * 3600],
+                    "Missing": [os.path.join(self.tmp, "missing.ttf"), time.time()],
+                },
+                f,
+            )
+
+        font_paths = FontPaths(self.cache_file)
+        font_paths._fc_match = lambda font_name: self.font_file
+        self.assertEqual(self.font_file, font_paths.resolve("Old"))
+        self.assertEqual(self.font_file, font_paths.resolve("Missing"))
+
+        # the new results are saved
+        with open(self.cache_file) as f:
+            saved = json.load(f)
+        self.assertEqual(self.font_file, saved["Missing"][0])
+        self.assertTrue(saved["Old"][1] > time.time() - 60)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+
+import http.server
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from variety import HttpSession
+from variety.HttpCache import HttpCache
+
+
+class _FeedHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    body = b"<rss>feed</rss>"
+    requests = []
+
+    def do_GET(self):
+        etag = '"%d"' % hash(_FeedHandler.body)
+        _FeedHandler.requests.append(self.headers.get("If-None-Match"))
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/rss+xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(_FeedHandler.body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(_FeedHandler.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHttpCache(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _FeedHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:%d/feed" % self.server.server_port
+        _FeedHandler.requests = []
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.folder)
+
+    def send(self, headers):
+        return HttpSession.get_session().get(self.url, headers=headers, timeout=5)
+
+    def test_conditional_requests(self):
+        cache = HttpCache(self.folder)
+        _FeedHandler.body = b"<rss>feed</rss>"
+        self.assertEqual("<rss>feed</rss>", cache.request(self.url, 0, self.send).text)
+        # unchanged - the server answers 304 and the stored body is used
+        r = cache.request(self.url, 0, self.send)
+        self.assertEqual(200, r.status_code)
+        self.assertEqual("<rss>feed</rss>", r.text)
+        self.assertEqual("application/rss+xml; charset=utf-8", r.headers["content-type"])
+        self.assertEqual([None, '"%d"' % hash(b"<rss>feed</rss>")], _FeedHandler.requests)
+
+        # changed - downloaded again
+        _FeedHandler.body = b"<rss>new</rss>"
+        self.assertEqual(
+            "<rss>new</rss>", HttpCache(self.folder).request(self.url, 0, self.send).text
+        )
+        self.assertEqual(3, len(_FeedHandler.requests))
+
+    def test_ttl(self):
+        cache = HttpCache(self.folder)
+        _FeedHandler.body = b"<rss>feed</rss>"
+        cache.request(self.url, 3600, self.send)
+        _FeedHandler.body = b"<rss>new</rss>"
+        # still fresh, no request at all
+        self.assertEqual("<rss>feed</rss>", cache.request(self.url, 3600, self.send).text)
+        self.assertEqual(1, len(_FeedHandler.requests))
+        self.assertEqual("<rss>new</rss>", cache.request(self.url, 0, self.send).text)
+
+    def test_eviction(self):
+        cache = HttpCache(self.folder, max_entries=2)
+        for i in range(4):
+            cache.request(self.url + "?%d" % i, 0, self.send)
+        self.assertEqual(4, len(os.listdir(self.folder)))
+
+
+if __name__ == "__main__":
+    unittest.main()
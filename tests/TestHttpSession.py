@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+
+import http.server
+import threading
+import unittest
+
+from variety import HttpSession
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Set-Cookie", "session=1")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHttpSession(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:%d/" % self.server.server_port
+        self.host = "http://127.0.0.1"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get(self):
+        r = HttpSession.get_session().get(self.url, timeout=5)
+        self.assertEqual("ok", r.text)
+
+    def test_connections_are_reused(self):
+        before = HttpSession.get_stats()["hosts"].get(self.host, {"requests": 0, "connections": 0})
+        for _ in range(4):
+            self.get()
+        thread = threading.Thread(target=self.get)
+        thread.start()
+        thread.join()
+
+        stats = HttpSession.get_stats()["hosts"][self.host]
+        self.assertEqual(5, stats["requests"] - before["requests"])
+        # the other thread uses the same pool, the connection is idle by then
+        self.assertEqual(1, stats["connections"] - before["connections"])
+        self.assertEqual(0, len(HttpSession.get_session().cookies))
+
+    def test_configure_keeps_stats(self):
+        self.get()
+        before = HttpSession.get_stats()["hosts"][self.host]
+        HttpSession.configure(5, 2)
+        self.get()
+        HttpSession.configure(10, 4)
+        stats = HttpSession.get_stats()["hosts"][self.host]
+        # the pools were replaced, so the second request needed a new connection
+        self.assertEqual(before["requests"] + 1, stats["requests"])
+        self.assertEqual(before["connections"] + 1, stats["connections"])
+
+    def test_replaced_adapters_share_the_totals_lock(self):
+        old = HttpSession.PoolStatsAdapter()
+        new = HttpSession.PoolStatsAdapter(previous=old)
+        self.assertIs(old.totals, new.totals)
+        self.assertIs(old.totals_lock, new.totals_lock)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from variety.ImageCatalog import ImageCatalog
+
+
+def is_jpg(path):
+    return path.endswith(".jpg")
+
+
+class TestImageCatalog(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.folder = os.path.join(self.tmp, "images")
+        os.makedirs(os.path.join(self.folder, "sub"))
+        for name in ("a.jpg", "b.jpg", "notes.txt", os.path.join("sub", "c.jpg")):
+            with open(os.path.join(self.folder, name), "w") as f:
+                f.write(name)
+        self.catalog = ImageCatalog(os.path.join(self.tmp, "catalog.db"))
+
+    def tearDown(self):
+        self.catalog.close()
+        shutil.rmtree(self.tmp)
+
+    def test_scan_and_random_images(self):
+        self.assertFalse(self.catalog.is_scanned([self.folder]))
+        self.catalog.scan_folder(self.folder, is_jpg)
+        self.assertTrue(self.catalog.is_scanned([self.folder + "/"]))
+        self.assertEqual(3, self.catalog.count([self.folder]))
+
+        images = self.catalog.random_images([self.folder], 10)
+        self.assertTrue(0 < len(images) <= 3)
+        self.assertTrue(all(is_jpg(f) for f in images))
+
+    def test_rescan_picks_up_changes(self):
+        self.catalog.scan_folder(self.folder, is_jpg)
+        os.unlink(os.path.join(self.folder, "a.jpg"))
+        with open(os.path.join(self.folder, "d.jpg"), "w") as f:
+            f.write("d")
+        self.catalog.scan_folder(self.folder, is_jpg)
+        images = set(self.catalog.random_images([self.folder], 100))
+        self.assertNotIn(os.path.join(self.folder, "a.jpg"), images)
+        self.assertEqual(3, self.catalog.count([self.folder]))
+
+    def test_quick_scan(self):
+        sub = os.path.join(self.folder, "sub")
+        self.assertEqual(
+            sorted([self.folder, sub]), sorted(self.catalog.scan_folder(self.folder, is_jpg))
+        )
+        self.assertEqual(
+            sorted([self.folder, sub]), sorted(self.catalog.get_subfolders(self.folder))
+        )
+
+        # move the folders' mtimes back, so that the changes below are seen even on coarse clocks
+        for folder in (self.folder, sub):
+            os.utime(folder, (0, 0))
+        self.catalog.scan_folder(self.folder, is_jpg)
+
+        os.unlink(os.path.join(sub, "c.jpg"))
+        new_sub = os.path.join(self.folder, "new")
+        os.makedirs(new_sub)
+        with open(os.path.join(new_sub, "d.jpg"), "w") as f:
+            f.write("d")
+        subfolders = self.catalog.quick_scan_folder(self.folder, is_jpg)
+        self.assertEqual(sorted([self.folder, sub, new_sub]), sorted(subfolders))
+        self.assertEqual(
+            sorted(os.path.join(self.folder, f) for f in ("a.jpg", "b.jpg", "new/d.jpg")),
+            self.catalog.list_images(self.folder),
+        )
+
+        shutil.rmtree(sub)
+        self.catalog.quick_scan_folder(self.folder, is_jpg)
+        self.assertEqual(
+            sorted([self.folder, new_sub]), sorted(self.catalog.get_subfolders(self.folder))
+        )
+
+    def test_rescan_after_restart(self):
+        self.catalog.scan_folder(self.folder, is_jpg)
+        self.catalog.close()
+        self.catalog = ImageCatalog(os.path.join(self.tmp, "catalog.db"))
+        scanned = []
+        self.catalog.add_scan_listener(scanned.append)
+
+        # recently scanned, but possibly changed while not running
+        self.catalog.refresh([self.folder], is_jpg, live_folders=[self.folder])
+        self.catalog.refresh_thread.join()
+        self.assertEqual([self.folder], scanned)
+
+        self.catalog.refresh([self.folder], is_jpg, live_folders=[self.folder])
+        self.assertEqual([self.folder], scanned)
+
+    def test_random_images_from_overlapping_folders(self):
+        sub = os.path.join(self.folder, "sub")
+        self.catalog.scan_folder(self.folder, is_jpg)
+        self.catalog.scan_folder(sub, is_jpg)
+        for _ in range(20):
+            images = self.catalog.random_images([self.folder, sub], 10)
+            self.assertEqual(len(images), len(set(images)))
+        self.assertEqual(3, self.catalog.count([self.folder, sub]))
+
+    def test_add_and_remove(self):
+        self.catalog.scan_folder(self.folder, is_jpg)
+        added = os.path.join(self.folder, "sub", "e.jpg")
+        with open(added, "w") as f:
+            f.write("e")
+        self.catalog.add_file(added)
+        self.assertEqual(4, self.catalog.count([self.folder]))
+
+        self.catalog.remove_file(added)
+        self.assertEqual(3, self.catalog.count([self.folder]))
+
+        self.catalog.remove_folder(os.path.join(self.folder, "sub"))
+        self.assertEqual(2, self.catalog.count([self.folder]))
+
+    def test_dimensions(self):
+        self.catalog.scan_folder(self.folder, is_jpg)
+        path = os.path.join(self.folder, "a.jpg")
+        self.assertIsNone(self.catalog.get_dimensions(path))
+        self.catalog.set_dimensions(path, 1920, 1080)
+        self.assertEqual((1920, 1080), self.catalog.get_dimensions(path))
+
+        # changing the file invalidates the recorded dimensions
+        with open(path, "a") as f:
+            f.write("changed")
+        self.assertIsNone(self.catalog.get_dimensions(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+
+import io
+import types
+import unittest
+
+from PIL import Image
+
+from variety import ImageEncoders
+
+
+class TestImageEncoders(unittest.TestCase):
+    def test_output_encoder(self):
+        image = Image.new("RGB", (64, 48), (10, 200, 30))
+        options = types.SimpleNamespace(
+            render_output_format="jpeg",
+            render_jpeg_quality=80,
+            render_jpeg_subsampling="4:4:4",
+            render_png_compression=1,
+        )
+        for output_format, expected in (("jpeg", ("JPEG", ".jpg")), ("png", ("PNG", ".png"))):
+            options.render_output_format = output_format
+            extension, params = ImageEncoders.get_output_encoder(options)
+            buffer = io.BytesIO()
+            image.save(buffer, **params)
+            with Image.open(buffer) as saved:
+                self.assertEqual(expected, (saved.format, extension))
+                self.assertEqual((64, 48), saved.size)
+
+    def test_benchmark(self):
+        image = Image.new("RGB", (64, 48))
+        results = list(ImageEncoders.benchmark(image, repeat=1))
+        self.assertEqual(len(ImageEncoders.BENCHMARK_CANDIDATES), len(results))
+        for description, encode_time, decode_time, size in results:
+            self.assertTrue(encode_time >= 0 and decode_time >= 0 and size > 0, description)
+
+
+if __name__ == "__main__":
+    unittest.main()
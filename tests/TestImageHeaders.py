@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image, features
+
+from variety import ImageHeaders
+
+
+class TestImageHeaders(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Chdir to the tests directory so that we can find our test images
+        curdir = os.path.dirname(os.path.abspath(__file__))
+        if curdir:
+            os.chdir(curdir)
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def save(self, name, mode="RGB", size=(123, 45), **kwargs):
+        path = os.path.join(self.tmp, name)
+        Image.new(mode, size, "red").save(path, **kwargs)
+        return path
+
+    def test_test_images(self):
+        self.assertEqual(("jpeg", 32, 32), ImageHeaders.get_image_info("test.jpg"))
+        self.assertEqual(("gif", 50, 50), ImageHeaders.get_image_info("animated.gif"))
+        self.assertIsNone(ImageHeaders.get_image_info("fake_image.jpg"))
+        self.assertIsNone(ImageHeaders.get_image_info("test.svg"))
+        self.assertIsNone(ImageHeaders.get_image_info("missing.jpg"))
+
+    def test_jpeg(self):
+        self.assertEqual(("jpeg", 123, 45), ImageHeaders.get_image_info(self.save("a.jpg")))
+        progressive = self.save("p.jpg", progressive=True, exif=b"Exif\x00\x00" + b"\x00" * 5000)
+        self.assertEqual(("jpeg", 123, 45), ImageHeaders.get_image_info(progressive))
+
+    def test_png_gif_bmp(self):
+        self.assertEqual(("png", 123, 45), ImageHeaders.get_image_info(self.save("a.png")))
+        self.assertEqual(("gif", 123, 45), ImageHeaders.get_image_info(self.save("a.gif")))
+        self.assertEqual(("bmp", 123, 45), ImageHeaders.get_image_info(self.save("a.bmp")))
+
+    @unittest.skipUnless(features.check("webp"), "Pillow has no WebP support")
+    def test_webp(self):
+        lossy = self.save("lossy.webp")
+        lossless = self.save("lossless.webp", lossless=True)
+        extended = self.save("extended.webp", mode="RGBA", exif=b"Exif\x00\x00")
+        for path in (lossy, lossless, extended):
+            self.assertEqual(("webp", 123, 45), ImageHeaders.get_image_info(path))
+
+    def test_gif_frame_count(self):
+        self.assertEqual(0, ImageHeaders.get_gif_frame_count("test.jpg"))
+        self.assertEqual(1, ImageHeaders.get_gif_frame_count("not-animated.gif"))
+        self.assertEqual(2, ImageHeaders.get_gif_frame_count("animated.gif", max_frames=2))
+
+        path = os.path.join(self.tmp, "frames.gif")
+        frames = [Image.new("RGB", (20, 10), (50 * i, 0, 0)) for i in range(5)]
+        frames[0].save(path, save_all=True, append_images=frames[1:])
+        self.assertEqual(5, ImageHeaders.get_gif_frame_count(path))
+
+    @unittest.skipUnless(features.check("avif"), "Pillow has no AVIF support")
+    def test_avif(self):
+        self.assertEqual(("avif", 123, 45), ImageHeaders.get_image_info(self.save("a.avif")))
+
+
+if __name__ == "__main__":
+    unittest.main()
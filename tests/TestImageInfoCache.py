@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from variety.ImageInfoCache import ImageInfoCache
+
+
+class TestImageInfoCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.files = []
+        for i in range(5):
+            path = os.path.join(self.tmp, "%d.jpg" % i)
+            with open(path, "w") as f:
+                f.write(str(i))
+            self.files.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_get_put(self):
+        cache = ImageInfoCache(os.path.join(self.tmp, "cache.db"))
+        self.assertIsNone(cache.get(self.files[0]))
+        cache.put(self.files[0], (100, [(3, (1, 2, 3))], 127.0, 1920, 1080))
+        self.assertEqual([100, [[3, [1, 2, 3]]], 127.0, 1920, 1080], cache.get(self.files[0]))
+        cache.close()
+
+        # survives restarts
+        cache = ImageInfoCache(os.path.join(self.tmp, "cache.db"))
+        self.assertEqual(1920, cache.get(self.files[0])[3])
+
+        # but not changes to the file
+        with open(self.files[0], "a") as f:
+            f.write("changed")
+        self.assertIsNone(cache.get(self.files[0]))
+        cache.close()
+
+    def test_lru_eviction(self):
+        cache = ImageInfoCache(os.path.join(self.tmp, "cache.db"), max_entries=3)
+        for f in self.files[:3]:
+            cache.put(f, f)
+            time.sleep(0.01)
+        cache.get(self.files[0])  # make it the most recently used one
+        time.sleep(0.01)
+        cache.put(self.files[3], self.files[3])
+
+        self.assertIsNone(cache.get(self.files[1]))
+        self.assertEqual(self.files[0], cache.get(self.files[0]))
+        self.assertEqual(self.files[3], cache.get(self.files[3]))
+        cache.close()
+
+    def test_get_does_not_write(self):
+        cache = ImageInfoCache(os.path.join(self.tmp, "cache.db"))
+        cache.put(self.files[0], 1)
+        changes = cache.db.total_changes
+        for _ in range(10):
+            self.assertEqual(1, cache.get(self.files[0]))
+        self.assertEqual(changes, cache.db.total_changes)
+
+        # the access times are written with the next put, or when closing
+        cache.put(self.files[1], 2)
+        self.assertEqual(changes + 2, cache.db.total_changes)
+        query = "SELECT last_access FROM entries WHERE path = ?"
+        put_at = cache.db.execute(query, (self.files[1],)).fetchone()[0]
+        time.sleep(0.01)
+        cache.get(self.files[1])
+        cache.close()
+        cache = ImageInfoCache(os.path.join(self.tmp, "cache.db"))
+        self.assertGreater(cache.db.execute(query, (self.files[1],)).fetchone()[0], put_at)
+        cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image
+
+from variety.RenderCache import RenderCache
+
+
+class TestRenderCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        # 100x100 RGB bitmaps are 30054 bytes each
+        self.image = Image.new("RGB", (100, 100), (10, 20, 30))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_get_put(self):
+        cache = RenderCache(os.path.join(self.tmp, "cache"))
+        key = ("/some/image.jpg", 1234.5, "zoom", (1920, 1080))
+        self.assertIsNone(cache.get(key))
+        path = cache.put(key, self.image, format="JPEG", quality=90)
+        self.assertEqual(path, cache.get(key))
+        self.assertTrue(cache.contains_file(path))
+        self.assertFalse(cache.contains_file("/some/image.jpg"))
+        with Image.open(path) as image:
+            self.assertEqual((100, 100), image.size)
+
+        # any change in the key is a miss
+        self.assertIsNone(cache.get(("/some/image.jpg", 1234.6, "zoom", (1920, 1080))))
+
+        cache.clear()
+        self.assertIsNone(cache.get(key))
+
+    def test_lru_eviction(self):
+        cache = RenderCache(os.path.join(self.tmp, "cache"), max_mb=0.1)
+        paths = [cache.put(i, self.image, format="BMP") for i in range(3)]
+        for i, path in enumerate(paths):
+            os.utime(path, (1000 + i, 1000 + i))
+
+        cache.get(0)  # now most recently used
+        cache.put(3, self.image, format="BMP")
+        self.assertIsNotNone(cache.get(0))
+        self.assertIsNone(cache.get(1))
+        self.assertIsNotNone(cache.get(2))
+        self.assertIsNotNone(cache.get(3))
+
+        cache.set_max_mb(0.05)
+        self.assertEqual(1, len(os.listdir(cache.folder)))
+
+    def test_disabled(self):
+        cache = RenderCache(os.path.join(self.tmp, "cache"), max_mb=0)
+        self.assertIsNone(cache.put("key", self.image, format="JPEG"))
+        self.assertIsNone(cache.get("key"))
+
+
+if __name__ == "__main__":
+    unittest.main()
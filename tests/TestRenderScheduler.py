@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+
+import threading
+import time
+import unittest
+
+from variety.RenderScheduler import RenderScheduler
+
+
+class TestRenderScheduler(unittest.TestCase):
+    def test_merge(self):
+        merge = RenderScheduler.merge
+        self.assertEqual(("/b.jpg", 0), merge(None, ("/b.jpg", 0)))
+        # a clock tick for the current wallpaper does not replace a pending change
+        self.assertEqual(("/b.jpg", 0), merge(("/b.jpg", 0), ("/a.jpg", 3)))
+        self.assertEqual(("/b.jpg", 0), merge(("/a.jpg", 3), ("/b.jpg", 0)))
+        self.assertEqual(("/c.jpg", 0), merge(("/b.jpg", 0), ("/c.jpg", 0)))
+        self.assertEqual(("/a.jpg", 2), merge(("/a.jpg", 2), ("/a.jpg", 3)))
+
+    def test_coalesce_and_cancel(self):
+        started = threading.Event()
+        release = threading.Event()
+        done = threading.Event()
+        calls = []
+
+        def render(filename, refresh_level, cancelled):
+            if filename == "/a.jpg":
+                started.set()
+                release.wait(5)
+            else:
+                done.set()
+            # assertions here would be swallowed by the worker thread
+            calls.append((filename, refresh_level, cancelled.is_set()))
+
+        scheduler = RenderScheduler(render)
+        scheduler.request("/a.jpg", 0)
+        self.assertTrue(started.wait(5))
+
+        # a burst of requests while /a.jpg renders
+        scheduler.request("/a.jpg", 3)
+        scheduler.request("/b.jpg", 0)
+        scheduler.request("/a.jpg", 2)
+        scheduler.request("/c.jpg", 0)
+        scheduler.request("/c.jpg", 3)
+        release.set()
+
+        self.assertTrue(done.wait(5))
+        scheduler.stop()
+        scheduler.thread.join(5)
+        self.assertEqual([("/a.jpg", 0, True), ("/c.jpg", 0, False)], calls)
+
+    def test_refresh_of_replaced_wallpaper_is_dropped(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def render(filename, refresh_level, cancelled):
+            started.set()
+            release.wait(5)
+            calls.append((filename, refresh_level, cancelled.is_set()))
+
+        scheduler = RenderScheduler(render)
+        # changing from /a.jpg to /b.jpg, when the clock of /a.jpg has to be refreshed
+        scheduler.request("/b.jpg", 0)
+        self.assertTrue(started.wait(5))
+        scheduler.request("/a.jpg", 3)
+        release.set()
+
+        deadline = time.time() + 5
+        while (scheduler.in_flight or scheduler.pending) and time.time() < deadline:
+            time.sleep(0.01)
+        scheduler.stop()
+        scheduler.thread.join(5)
+        self.assertEqual([("/b.jpg", 0, False)], calls)
+
+
+if __name__ == "__main__":
+    unittest.main()
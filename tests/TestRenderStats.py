@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from variety.RenderStats import RenderStats, RenderTrace
+
+
+class TestRenderStats(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.tmp, "render_stats.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_nested_stages(self):
+        trace = RenderTrace("/a.jpg", 0)
+        with trace.stage("filter"):
+            time.sleep(0.02)
+            with trace.stage("decode"):
+                time.sleep(0.05)
+        self.assertEqual({"filter", "decode"}, set(trace.stages))
+        self.assertTrue(0.015 < trace.stages["filter"] < 0.045)
+        self.assertTrue(trace.stages["decode"] >= 0.045)
+        self.assertTrue(trace.to_dict()["total"] >= 0.065)
+
+    def test_summary_and_log(self):
+        stats = RenderStats(self.log_file, max_traces=10)
+        stats.add(RenderTrace())  # nothing timed, not recorded
+        for i in range(20):
+            trace = RenderTrace("/%d.jpg" % i, 0)
+            trace.stages["encode"] = i / 1000.0
+            stats.add(trace)
+
+        summary = stats.get_summary()
+        self.assertEqual(10, summary["changes"])
+        encode = summary["stages"]["encode"]
+        self.assertEqual(10, encode["count"])
+        self.assertEqual(14.0, encode["p50_ms"])
+        self.assertEqual(19.0, encode["p95_ms"])
+        self.assertEqual(19.0, encode["max_ms"])
+        self.assertIn("total", summary["stages"])
+
+        with open(self.log_file) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(20, len(lines))
+        self.assertEqual("/19.jpg", lines[-1]["file"])
+        self.assertEqual({"encode": 0.019}, lines[-1]["stages"])
+
+    def test_log_rotation(self):
+        stats = RenderStats(self.log_file, max_log_bytes=500)
+        for i in range(20):
+            trace = RenderTrace("/%d.jpg" % i, 0)
+            trace.stages["encode"] = 0.01
+            stats.add(trace)
+        self.assertTrue(os.path.exists(self.log_file + ".1"))
+        self.assertTrue(os.path.getsize(self.log_file) < 700)
+
+
+if __name__ == "__main__":
+    unittest.main()
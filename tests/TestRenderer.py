@@ -0,0 +1,210 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+
+import os
+import subprocess
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from PIL import Image, ImageChops
+
+from variety.Renderer import (
+    NATIVE_OPS,
+    ClockFilter,
+    Renderer,
+    compile_filter,
+    cover_size,
+    draw_annotations,
+    fit_size,
+    render_per_monitor,
+    translate_filter,
+)
+from variety.Util import Util
+
+
+class TestRenderer(unittest.TestCase):
+    def test_sizes(self):
+        self.assertEqual((1920, 1280), cover_size((3000, 2000), (1920, 1080)))
+        self.assertEqual((1620, 1080), fit_size((3000, 2000), (1920, 1080)))
+        self.assertEqual((1920, 3840), cover_size((1000, 2000), (1920, 1080)))
+
+    def test_native_ops(self):
+        image = Image.new("RGB", (300, 600), (200, 100, 50))
+        self.assertEqual((100, 200), NATIVE_OPS["zoom"](image, 100, 50).size)
+        for op in ("fit-with-black", "fit-with-blur", "tile"):
+            self.assertEqual((400, 300), NATIVE_OPS[op](image, 400, 300).size)
+
+        fitted = NATIVE_OPS["fit-with-black"](image, 400, 300)
+        self.assertEqual((0, 0, 0), fitted.getpixel((0, 0)))
+        self.assertEqual((200, 100, 50), fitted.getpixel((200, 150)))
+
+    def test_render_per_monitor(self):
+        image = Image.linear_gradient("L").resize((1600, 900)).convert("RGB")
+        rects = [(0, 0, 1920, 1080), (1920, 0, 1080, 1920)]
+        canvas = render_per_monitor(image, (3000, 1920), rects)
+        self.assertEqual((3000, 1920), canvas.size)
+        # the landscape monitor is covered by the image, the portrait one has a blurred background
+        self.assertIsNone(
+            ImageChops.difference(
+                canvas.crop((0, 0, 1920, 1080)),
+                image.resize((1920, 1080), Image.Resampling.LANCZOS),
+            ).getbbox()
+        )
+        self.assertIsNone(
+            ImageChops.difference(
+                canvas.crop((1920, 0, 3000, 1920)), NATIVE_OPS["fit-with-blur"](image, 1080, 1920)
+            ).getbbox()
+        )
+        # the area outside of the monitors stays black
+        self.assertIsNone(canvas.crop((0, 1080, 1920, 1920)).getbbox())
+
+    def test_render_cache_key_per_monitor(self):
+        frame = MagicMock(path=os.path.join(os.path.dirname(__file__), "test.jpg"), orientation=1)
+        mode = MagicMock(id="per-monitor", per_monitor=True)
+        mode_data = MagicMock(native_op=("per-monitor", 1920, 1080), imagemagick_cmd=None)
+        renderer = Renderer(MagicMock(), None)
+
+        def key(layout):
+            with patch.object(Util, "get_primary_display_size", return_value=(1920, 1080)):
+                with patch.object(Util, "get_monitor_layout", return_value=layout):
+                    return renderer.get_render_cache_key(frame, mode, mode_data, {})
+
+        landscape = ((3840, 1080), [(0, 0, 1920, 1080), (1920, 0, 1920, 1080)], 0)
+        with_portrait = ((3840, 1080), [(0, 0, 1920, 1080), (1920, 0, 1080, 1920)], 0)
+        self.assertEqual(key(landscape), key(landscape))
+        self.assertNotEqual(key(landscape), key(with_portrait))
+
+    def test_base_frame_key_per_monitor(self):
+        path = os.path.join(os.path.dirname(__file__), "test.jpg")
+        renderer = Renderer(MagicMock(), None)
+
+        def key(layout, per_monitor=True):
+            mode = MagicMock(per_monitor=per_monitor)
+            with patch.object(renderer, "get_display_mode", return_value=mode):
+                with patch.object(Util, "get_primary_display_size", return_value=(1920, 1080)):
+                    with patch.object(Util, "get_monitor_layout", return_value=layout):
+                        return renderer.get_base_frame_key(path)
+
+        landscape = ((3840, 1080), [(0, 0, 1920, 1080), (1920, 0, 1920, 1080)], 0)
+        with_portrait = ((3000, 1920), [(0, 0, 1920, 1080), (1920, 0, 1080, 1920)], 0)
+        self.assertNotEqual(key(landscape), key(with_portrait))
+        # other modes only depend on the primary monitor
+        self.assertEqual(key(landscape, False), key(with_portrait, False))
+
+    def test_translate_filter(self):
+        image = Image.new("RGB", (100, 50), (255, 0, 0))
+        for f in (
+            "",
+            "-type Grayscale",
+            "-scale 20% -blur 0x10 -resize 500%",
+            "-scale 3% -scale 3333%",
+        ):
+            ops = translate_filter(f)
+            self.assertIsNotNone(ops, f)
+            result = image
+            for op in ops:
+                result = op(result)
+            self.assertEqual("RGB", result.mode)
+            self.assertTrue(abs(result.width - 100) <= 1, f)
+
+        gray = translate_filter("-type Grayscale")[0](image).getpixel((0, 0))
+        self.assertTrue(gray[0] == gray[1] == gray[2])
+
+        self.assertIsNone(translate_filter("-paint 8"))
+        self.assertIsNone(translate_filter("-spread 10 -noise 3"))
+        self.assertIsNone(translate_filter("-scale 20% '%FILEPATH%'"))
+
+    def test_compile_filter(self):
+        self.assertIsNotNone(compile_filter("-type Grayscale").ops)
+        compiled = compile_filter("-paint 8 -fill '%FILENAME%'")
+        self.assertIsNone(compiled.ops)
+        self.assertEqual(("-paint", "8", "-fill", "%FILENAME%"), compiled.args)
+        self.assertIs(compiled, compile_filter("-paint 8 -fill '%FILENAME%'"))
+
+    def test_clock_filter_args(self):
+        clock_filter = ClockFilter(
+            "-swirl 90 -annotate 0x0+[%HOFFSET+60]+[%VOFFSET+110] '%H:%M' -annotate +5+5 x"
+        )
+        self.assertIsNone(clock_filter.annotations)
+        now = time.strptime("2024-02-03 04:05", "%Y-%m-%d %H:%M")
+        self.assertEqual(
+            ["-swirl", "90", "-annotate", "0x0+260+113", "04:05", "-annotate", "+5+5", "x"],
+            clock_filter.get_args(200, 3, now),
+        )
+
+    def test_clock_filter_offsets(self):
+        clock_filter = ClockFilter(
+            "-fill '#DDDDDD' -annotate 0x0+[%HOFFSET+100]+[%VOFFSET+150] '%H:%M' -pointsize 50 "
+            "-annotate 0x0+[%HOFFSET+100]+[%VOFFSET+100] '%A, %B %d'"
+        )
+        now = time.strptime("2024-02-03 04:05", "%Y-%m-%d %H:%M")
+        self.assertEqual(
+            ["-fill", "#DDDDDD", "-annotate", "0x0+300+153", "04:05", "-pointsize", "50"]
+            + ["-annotate", "0x0+300+103", "Saturday, February 03"],
+            clock_filter.get_args(200, 3, now),
+        )
+
+    def test_clock_filter_fallbacks(self):
+        self.assertIsNone(ClockFilter("-font '' -annotate 0x0+10+10 '12:00'").annotations)
+        self.assertIsNone(ClockFilter("-font /nonexistent.ttf -annotate +10+10 'x'").annotations)
+        self.assertIsNone(ClockFilter("-swirl 90").annotations)
+        self.assertIsNone(ClockFilter("-annotate 45x45+10+10 '12:00'").annotations)
+
+    def test_clock(self):
+        try:
+            font = subprocess.run(
+                ["fc-match", "-f", "%{file[0]}", "Sans"], stdout=subprocess.PIPE, text=True
+            ).stdout
+        except OSError:
+            font = None
+        if not font or not font.endswith(".ttf"):
+            self.skipTest("No TrueType font found")
+
+        now = time.strptime("2024-02-03 04:05", "%Y-%m-%d %H:%M")
+        annotations = ClockFilter(
+            "-density 100 -font '%s' -pointsize 30 -gravity SouthEast "
+            "-fill '#00000044' -annotate 0x0+58+58 '12:00' -fill white -annotate 0x0+60+60 '12:00'"
+            % font
+        ).get_annotations(0, 0, now)
+        self.assertEqual(2, len(annotations))
+        self.assertEqual((font, 42, "southeast", "white", 60, 60, "12:00"), annotations[1])
+
+        # the time and the offsets are substituted on every render
+        clock_filter = ClockFilter(
+            "-font '%s' -gravity SouthEast -annotate 0x0+[%%HOFFSET+60]-[%%VOFFSET+10] '%%H:%%M'"
+            % font
+        )
+        self.assertEqual(
+            [(font, 12, "southeast", "black", 260, -13, "04:05")],
+            clock_filter.get_annotations(200, 3, now),
+        )
+        # ImageMagick escapes are left to ImageMagick
+        clock_filter = ClockFilter("-font '%s' -annotate +5+5 '%%[EXIF:Model]'" % font)
+        self.assertIsNone(clock_filter.get_annotations(0, 0, now))
+
+        base = Image.new("RGB", (400, 300))
+        image = draw_annotations(base, annotations)
+        # the base frame is reused for the next clock refreshes, it must stay untouched
+        self.assertIsNone(base.getbbox())
+        # the text is drawn at the bottom right corner
+        self.assertIsNotNone(image.crop((200, 150, 340, 240)).getbbox())
+        self.assertIsNone(image.crop((0, 0, 200, 150)).getbbox())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+
+import http.server
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from variety import ResumableDownload
+from variety.ResumableDownload import DownloadInterrupted
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    body = bytes(range(256)) * 400
+    etag = '"v1"'
+    # the connection is dropped after sending this many bytes of the body
+    fail_after = None
+    ranges = []
+
+    def do_GET(self):
+        cls = _Handler
+        start = 0
+        requested = self.headers.get("Range")
+        cls.ranges.append(requested)
+        if requested and self.headers.get("If-Range") == cls.etag:
+            start = int(requested[len("bytes=") : -1])
+        data = cls.body[start:]
+        self.send_response(206 if start else 200)
+        if start:
+            self.send_header(
+                "Content-Range", "bytes %d-%d/%d" % (start, len(cls.body) - 1, len(cls.body))
+            )
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", cls.etag)
+        self.end_headers()
+        if cls.fail_after is not None:
+            self.wfile.write(data[: cls.fail_after])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestResumableDownload(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.partial = os.path.join(self.folder, "image.jpg.partial")
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:%d/image.jpg" % self.server.server_port
+        _Handler.etag = '"v1"'
+        _Handler.fail_after = None
+        _Handler.ranges = []
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.folder)
+
+    def read(self):
+        with open(self.partial, "rb") as f:
+            return f.read()
+
+    def interrupt(self, after):
+        size = os.path.getsize(self.partial) if os.path.exists(self.partial) else 0
+        _Handler.fail_after = after
+        with self.assertRaises(DownloadInterrupted):
+            ResumableDownload.download(self.url, self.partial, timeout=5)
+        _Handler.fail_after = None
+        # whole chunks are written, so keep after a multiple of the chunk size
+        self.assertEqual(size + after, os.path.getsize(self.partial))
+
+    def test_resume(self):
+        self.interrupt(40960)
+        self.interrupt(30720)  # that many more bytes of the rest
+        ResumableDownload.download(self.url, self.partial, timeout=5)
+        self.assertEqual(_Handler.body, self.read())
+        self.assertEqual([None, "bytes=40960-", "bytes=71680-"], _Handler.ranges)
+        self.assertEqual(["image.jpg.partial"], os.listdir(self.folder))
+
+    def test_changed_file_starts_over(self):
+        self.interrupt(40960)
+        _Handler.etag = '"v2"'
+        ResumableDownload.download(self.url, self.partial, timeout=5)
+        self.assertEqual(_Handler.body, self.read())
+
+    def test_other_url_starts_over(self):
+        self.interrupt(40960)
+        ResumableDownload.download(self.url + "?other", self.partial, timeout=5)
+        self.assertEqual(_Handler.body, self.read())
+        self.assertEqual([None, None], _Handler.ranges)
+
+    def test_gives_up(self):
+        _Handler.fail_after = 1024
+        for _ in range(ResumableDownload.MAX_ATTEMPTS - 1):
+            with self.assertRaises(DownloadInterrupted):
+                ResumableDownload.download(self.url, self.partial, timeout=5)
+            # the file changes every time, starting over does not reset the count
+            _Handler.etag = '"v%d"' % len(_Handler.ranges)
+        with self.assertRaises(Exception) as context:
+            ResumableDownload.download(self.url, self.partial, timeout=5)
+        self.assertNotIsInstance(context.exception, DownloadInterrupted)
+        self.assertEqual([], os.listdir(self.folder))
+
+    def test_discard(self):
+        self.interrupt(40960)
+        ResumableDownload.discard(self.partial)
+        self.assertEqual([], os.listdir(self.folder))
+
+
+if __name__ == "__main__":
+    unittest.main()
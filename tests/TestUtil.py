@@ -111,6 +111,23 @@ class TestUtil(unittest.TestCase):
             Util.gtk_to_fcmatch_font("Bitstream Charter Bold Italic 10"),
         )
 
+    def test_layout_monitors(self):
+        # a 4K monitor at 2x scaling to the right of a Full HD one, which is the primary
+        canvas_size, rects, primary = Util.layout_monitors(
+            [(0, 0, 1920, 1080, 1, True), (1920, 0, 1920, 1080, 2, False)]
+        )
+        self.assertEqual((7680, 2160), canvas_size)
+        self.assertEqual([(0, 0, 3840, 2160), (3840, 0, 3840, 2160)], rects)
+        self.assertEqual(0, primary)
+
+        # a portrait monitor to the left of the primary one, starting at negative coordinates
+        canvas_size, rects, primary = Util.layout_monitors(
+            [(-1080, -400, 1080, 1920, 1, False), (0, 0, 2560, 1440, 1, True)]
+        )
+        self.assertEqual((3640, 1920), canvas_size)
+        self.assertEqual([(0, 0, 1080, 1920), (1080, 400, 2560, 1440)], rects)
+        self.assertEqual(1, primary)
+
     def test_file_in(self):
         self.assertTrue(Util.file_in("/a/b/a.txt", "/a/"))
         self.assertTrue(Util.file_in("/a/b/a.txt", "/a/b/"))
@@ -0,0 +1,44 @@
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+
+from PIL import Image
+
+
+class AnalysisThumbnail:
+    """
+    A small decoded copy of an image, together with the image's original dimensions,
+    for color, lightness and any other analyses that do not need the full resolution.
+
+    The codec is asked for a reduced-resolution decode where it supports one (JPEG decodes at
+    1/2, 1/4 or 1/8 scale via DCT scaling), so a 40-megapixel photo is never fully decoded.
+    Other formats are decoded fully, but shrunk with a fast integer reduction step before resampling.
+    """
+
+    SIZE = (50, 50)
+
+    def __init__(self, image_name, size=SIZE):
+        self.image_name = image_name
+        with Image.open(image_name) as original:
+            self.original_size = original.size
+            self.format = original.format
+            original.draft(None, size)
+            self.image = original.resize(size, reducing_gap=3.0)
+
+    def get_width(self):
+        return self.original_size[0]
+
+    def get_height(self):
+        return self.original_size[1]
@@ -15,29 +15,82 @@
 ### END LICENSE
 
 import sys
+import time
 
 from PIL import Image, ImageFilter
 
+from variety.AnalysisThumbnail import AnalysisThumbnail
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class DominantColors:
-    def __init__(self, image_name, only_size_needed=True):
+    PALETTE = [
+        (0, 0, 0),
+        (128, 128, 128),
+        (192, 192, 192),
+        (255, 255, 255),
+        (128, 0, 0),
+        (255, 0, 0),
+        (128, 128, 0),
+        (255, 255, 0),
+        (0, 128, 0),
+        (0, 255, 0),
+        (0, 128, 128),
+        (0, 255, 255),
+        (0, 0, 128),
+        (0, 0, 255),
+        (128, 0, 128),
+        (255, 0, 255),
+    ]
+
+    def __init__(self, image_name, only_size_needed=True, use_numpy=True, thumbnail=None):
         self.imageName = image_name
-        self.original = Image.open(image_name)
+        self.use_numpy = use_numpy and numpy is not None
 
-        if not only_size_needed:
-            self.resized = self.original.resize((50, 50))
+        if only_size_needed:
+            with Image.open(image_name) as original:
+                self.original_size = original.size
+        else:
+            self.thumbnail = thumbnail or AnalysisThumbnail(image_name)
+            self.original_size = self.thumbnail.original_size
+            self.resized = self.thumbnail.image
             # self.resized = self.resized.filter(ImageFilter.BLUR)
 
             # load image data
             self.img_data = self.resized.load()
 
     def get_width(self):
-        return self.original.size[0]
+        return self.original_size[0]
 
     def get_height(self):
-        return self.original.size[1]
+        return self.original_size[1]
+
+    def _pixel_array(self):
+        """
+        Returns the resized image as a numpy array of shape (width, height) or (width, height, bands),
+        i.e. indexed in the same [x, y] order as the pixel access object,
+        or None if numpy is not available or the image mode is not one the numpy engine handles.
+        """
+        if not self.use_numpy:
+            return None
+        pixels = numpy.asarray(self.resized)
+        if pixels.dtype.kind not in "ui":
+            return None  # e.g. bilevel or floating point images
+        if pixels.ndim == 3 and pixels.shape[2] < 3:
+            return None  # e.g. LA images, the Python engine would fail on those anyway
+        if pixels.ndim not in (2, 3):
+            return None
+        return numpy.swapaxes(pixels, 0, 1).astype(numpy.int64)
 
     def get_lightness(self):
+        pixels = self._pixel_array()
+        if pixels is not None:
+            return self._get_lightness_numpy(pixels)
+
         count = 0
         pixel_sum = 0
         for x in range(0, self.resized.size[0]):
@@ -50,25 +103,23 @@ class DominantColors:
                     pixel_sum += sum(pixel) / 3
         return pixel_sum // count
 
+    @staticmethod
+    def _get_lightness_numpy(pixels):
+        count = pixels.shape[0] * pixels.shape[1]
+        if pixels.ndim == 2:
+            return int(pixels.sum()) // count
+        else:
+            # accumulate sequentially in the same order as the Python engine does,
+            # so that the floating point result is exactly the same
+            pixel_sum = float(numpy.cumsum(pixels.sum(axis=2).reshape(-1) / 3)[-1])
+            return pixel_sum // count
+
     def get_dominant_colors(self):
-        colors = [
-            (0, 0, 0),
-            (128, 128, 128),
-            (192, 192, 192),
-            (255, 255, 255),
-            (128, 0, 0),
-            (255, 0, 0),
-            (128, 128, 0),
-            (255, 255, 0),
-            (0, 128, 0),
-            (0, 255, 0),
-            (0, 128, 128),
-            (0, 255, 255),
-            (0, 0, 128),
-            (0, 0, 255),
-            (128, 0, 128),
-            (255, 0, 255),
-        ]
+        pixels = self._pixel_array()
+        if pixels is not None:
+            return self._get_dominant_colors_numpy(pixels)
+
+        colors = list(DominantColors.PALETTE)
         total = 0
         pixel_sum = 0
 
@@ -123,6 +174,61 @@ class DominantColors:
         s = sorted(colors, key=lambda x: x[0], reverse=True)
         return total, s, pixel_sum * 4 // total, self.get_width(), self.get_height()
 
+    def _get_dominant_colors_numpy(self, pixels):
+        """
+        Vectorized equivalent of the pure-Python clustering in get_dominant_colors,
+        producing exactly the same result.
+        """
+        sampled = pixels[::2, ::2].reshape((-1,) + pixels.shape[2:])
+        if sampled.ndim == 1:
+            rgb = numpy.repeat(sampled[:, None], 3, axis=1)
+            pixel_values = sampled * 3
+        else:
+            rgb = sampled[:, :3]
+            pixel_values = sampled.sum(axis=1)  # like sum(pixel), this includes e.g. alpha
+        total = 4 * len(sampled)
+        # sequential accumulation, so that the floating point result is exactly the same
+        pixel_sum = float(numpy.cumsum(pixel_values / 3)[-1])
+
+        colors = list(DominantColors.PALETTE)
+        iterations = 1
+        for counter in range(iterations):
+            # min() over (diff, color) tuples breaks ties by the smaller color,
+            # so look the colors up in sorted order and take the first minimum
+            order = sorted(range(len(colors)), key=lambda i: colors[i])
+            palette = numpy.array([colors[i] for i in order], dtype=numpy.int64)
+            diffs = ((rgb[:, None, :] - palette[None, :, :]) ** 2).sum(axis=2)
+            nearest = numpy.argmin(diffs, axis=1)
+            if len(colors) > 1:
+                diffs[numpy.arange(len(diffs)), nearest] = numpy.iinfo(numpy.int64).max
+                second = numpy.argmin(diffs, axis=1)
+            else:
+                second = nearest
+
+            n = len(colors)
+            counts = 3 * numpy.bincount(nearest, minlength=n) + numpy.bincount(second, minlength=n)
+            sums = [
+                3 * numpy.bincount(nearest, weights=rgb[:, i], minlength=n)
+                + numpy.bincount(second, weights=rgb[:, i], minlength=n)
+                for i in (0, 1, 2)
+            ]
+
+            # back to the original palette order
+            counts_of = {colors[order[j]]: int(counts[j]) for j in range(n)}
+            sums_of = {colors[order[j]]: [int(sums[i][j]) for i in (0, 1, 2)] for j in range(n)}
+
+            colors = [c for c in colors if counts_of[c] > 0]
+            if counter == iterations - 1:
+                colors = [
+                    (counts_of[c], tuple(sums_of[c][i] // counts_of[c] for i in (0, 1, 2)))
+                    for c in colors
+                ]
+            else:
+                colors = [tuple(sums_of[c][i] // counts_of[c] for i in (0, 1, 2)) for c in colors]
+
+        s = sorted(colors, key=lambda x: x[0], reverse=True)
+        return total, s, pixel_sum * 4 // total, self.get_width(), self.get_height()
+
     @staticmethod
     def contains_color(dominant_colors, color, fuzziness):
         total, colors, _, _, _ = dominant_colors
@@ -144,6 +250,40 @@ class DominantColors:
         return sum((c1[i] - c2[i]) ** 2 for i in [0, 1, 2])
 
 
+def benchmark(image_names, runs=20):
+    """
+    Compares the per-image time of the numpy and pure-Python engines
+    for the resized-image analysis that image_ok runs for every candidate.
+    """
+    for image_name in image_names:
+        timings = {}
+        for use_numpy in (False, True):
+            dc = DominantColors(image_name, only_size_needed=False, use_numpy=use_numpy)
+            start = time.perf_counter()
+            for _ in range(runs):
+                result = dc.get_dominant_colors(), dc.get_lightness()
+            timings[use_numpy] = (time.perf_counter() - start) / runs
+            if use_numpy and result != python_result:
+                print("%s: RESULTS DIFFER: %s vs %s" % (image_name, result, python_result))
+            python_result = result
+
+        print(
+            "%s: python %.2f ms, numpy %.2f ms, speedup %.1fx"
+            % (
+                image_name,
+                timings[False] * 1000,
+                timings[True] * 1000,
+                timings[False] / timings[True],
+            )
+        )
+
+
 if __name__ == "__main__":
-    pc = DominantColors(sys.argv[1])
-    print(pc.get_dominant_colors())
+    if sys.argv[1] == "--benchmark":
+        if numpy is None:
+            print("numpy is not installed")
+            sys.exit(1)
+        benchmark(sys.argv[2:])
+    else:
+        pc = DominantColors(sys.argv[1], only_size_needed=False)
+        print(pc.get_dominant_colors())
@@ -0,0 +1,170 @@
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+import logging
+import threading
+import time
+
+from variety.Util import Util
+
+logger = logging.getLogger("variety")
+
+
+class BandwidthLimiter:
+    """
+    Token bucket shared by all downloads. consume() blocks the calling thread for as long as needed
+    to keep the combined rate under max_kbps kilobytes per second, with bursts of up to a second's
+    worth of data. A max_kbps of 0 means no limit.
+    """
+
+    def __init__(self, max_kbps=0):
+        self.lock = threading.Lock()
+        self.rate = 0
+        self.tokens = 0.0
+        self.last = time.monotonic()
+        self.set_max_kbps(max_kbps)
+
+    def set_max_kbps(self, max_kbps):
+        with self.lock:
+            self.rate = max(0, max_kbps) * 1024
+            self.tokens = float(self.rate)
+            self.last = time.monotonic()
+
+    def consume(self, nbytes):
+        with self.lock:
+            if self.rate <= 0:
+                return
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            # the balance may go negative, later callers then wait for this one's debt too
+            self.tokens -= nbytes
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class DownloadEngine:
+    """
+    Downloads from the configured image sources concurrently.
+
+    Every image source gets its own lane: downloads from the same source (i.e. the same host and
+    throttling limits) run one at a time, with a short pause between them, and a lane is skipped
+    while the source's max_downloads_per_hour (see ImageSource.get_throttling) is reached.
+    Different lanes run in parallel, at most max_concurrent at a time, so a slow source does not
+    hold back the others.
+
+    get_downloaders should return the downloaders that need a download, the most needy first.
+    download_fn(downloader) downloads one image with it.
+    """
+
+    LANE_PAUSE = 1  # seconds between the downloads of the same lane
+    MAX_WAIT = 180  # seconds between checks for downloaders that need a download
+
+    def __init__(self, get_downloaders, download_fn, max_concurrent=4, max_kbps=0):
+        self.get_downloaders = get_downloaders
+        self.download_fn = download_fn
+        self.max_concurrent = max_concurrent
+        self.bandwidth_limiter = BandwidthLimiter(max_kbps)
+        # set to wake the engine up, e.g. when the options change or a download completes
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.busy_lanes = set()
+        # lane -> time until which it is paused
+        self.paused_lanes = {}
+        self.running = True
+
+    def configure(self, max_concurrent, max_kbps):
+        self.max_concurrent = max(1, max_concurrent)
+        self.bandwidth_limiter.set_max_kbps(max_kbps)
+        self.event.set()
+
+    @staticmethod
+    def get_lane(downloader):
+        return downloader.source
+
+    def pick(self, downloaders):
+        """Selects which of the downloaders to start now, at most one per free lane"""
+        now = time.time()
+        picked = []
+        with self.lock:
+            lanes = set(self.busy_lanes)
+            free_slots = self.max_concurrent - len(self.busy_lanes)
+            for dl in downloaders:
+                if len(picked) >= free_slots:
+                    break
+                lane = self.get_lane(dl)
+                if lane in lanes or self.paused_lanes.get(lane, 0) > now:
+                    continue
+                if not dl.source.is_download_allowed():
+                    continue
+                lanes.add(lane)
+                picked.append(dl)
+        return picked
+
+    def get_wait_time(self, downloaders):
+        """
+        Returns the seconds until one of the downloaders can be started, or MAX_WAIT if that only
+        depends on the downloads in progress, which set the event when they complete
+        """
+        now = time.time()
+        with self.lock:
+            if len(self.busy_lanes) >= self.max_concurrent:
+                return self.MAX_WAIT
+            start_times = [
+                max(self.paused_lanes.get(self.get_lane(dl), 0), dl.source.get_next_download_time())
+                for dl in downloaders
+                if self.get_lane(dl) not in self.busy_lanes
+            ]
+        if not start_times:
+            return self.MAX_WAIT
+        return min(self.MAX_WAIT, max(self.LANE_PAUSE, min(start_times) - now))
+
+    def run(self):
+        while self.running:
+            try:
+                downloaders = self.get_downloaders()
+                for dl in self.pick(downloaders):
+                    self._start(dl)
+
+                # wait for trigger_download, an options change, a download to complete,
+                # or a paused or throttled lane to become free
+                self.event.wait(self.get_wait_time(downloaders))
+                self.event.clear()
+            except Exception:
+                logger.exception(lambda: "Exception in the download engine:")
+                time.sleep(self.LANE_PAUSE)
+
+    def _start(self, downloader):
+        lane = self.get_lane(downloader)
+        with self.lock:
+            self.busy_lanes.add(lane)
+
+        def _download():
+            try:
+                self.download_fn(downloader)
+            except Exception:
+                logger.exception(lambda: "Could not download from %s" % downloader.config)
+            finally:
+                with self.lock:
+                    self.busy_lanes.discard(lane)
+                    self.paused_lanes[lane] = time.time() + self.LANE_PAUSE
+                self.event.set()
+
+        Util.start_daemon(_download)
+
+    def stop(self):
+        self.running = False
+        self.event.set()
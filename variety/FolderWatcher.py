@@ -0,0 +1,215 @@
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+import logging
+import os
+import queue
+
+from variety.Util import Util, on_gtk
+
+# fmt: off
+import gi  # isort:skip
+from gi.repository import Gio  # isort:skip
+# fmt: on
+
+logger = logging.getLogger("variety")
+
+
+class FolderWatcher:
+    """
+    Keeps the ImageCatalog up to date with the local source folders by listening to Gio file
+    monitors (inotify on Linux) on every folder and subfolder, so that new, deleted and renamed
+    images are picked up without rescanning the folders.
+
+    Monitors are created and their events delivered on the GTK main loop, everything that touches
+    the disk or the catalog is done in a worker thread. The subfolders to monitor are taken from
+    the catalog's last scan. Once they are monitored, the folder is quickly rescanned to pick up
+    what changed in between, and only then it is "live" - live folders need only infrequent
+    safety rescans.
+    """
+
+    # Stay well below the usual fs.inotify.max_user_watches limit,
+    # folders with more subfolders than that just rely on periodic rescans
+    MAX_MONITORS = 8192
+
+    def __init__(self, catalog, filter_func):
+        self.catalog = catalog
+        self.filter_func = filter_func
+        self.roots = set()
+        self.live = set()
+        self.monitors = {}
+        # roots that were never scanned, they are watched once the catalog has scanned them
+        self.waiting = set()
+        # (action, path) tuples for the worker thread
+        self.events = queue.Queue()
+        catalog.add_scan_listener(lambda folder: self.events.put(("scanned", folder)))
+        Util.start_daemon(self._process_events)
+
+    def get_live_folders(self):
+        return set(self.live)
+
+    @on_gtk
+    def watch(self, folders):
+        """
+        Starts watching the folders that are not watched yet and stops watching
+        the ones that are no longer in the list.
+        """
+        folders = set(os.path.normpath(f) for f in folders)
+        removed = self.roots - folders
+        added = folders - self.roots
+        self.roots = folders
+
+        for root in removed:
+            self.live.discard(root)
+            self._remove_monitors(root)
+
+        for root in added:
+            self.events.put(("watch", root))
+
+    def _process_events(self):
+        actions = {
+            "watch": self._watch_root,
+            "scanned": self._on_scanned,
+            "verify": self._verify,
+            "add": self._add_file,
+            "remove_file": self.catalog.remove_file,
+            "remove_folder": self.catalog.remove_folder,
+        }
+        while True:
+            action, path = self.events.get()
+            try:
+                actions[action](path)
+            except Exception:
+                logger.exception(lambda: "Folder watcher could not process %s %s" % (action, path))
+
+    def _watch_root(self, root):
+        if root not in self.roots:
+            return
+        subfolders = self.catalog.get_subfolders(root)
+        if not subfolders:
+            self.waiting.add(root)
+            return
+        self._start_watching(root, subfolders)
+
+    def _on_scanned(self, folder):
+        if folder in self.waiting:
+            self.waiting.discard(folder)
+            self._watch_root(folder)
+
+    def _verify(self, root):
+        if root not in self.roots:
+            return
+        # this scan starts after all known subfolders are monitored, so together with the
+        # monitors' events no added, removed or renamed image is missed from here on. Images
+        # overwritten in place before the monitors were set up are not seen by a quick scan, they
+        # are updated by the next full rescan (LIVE_RESCAN_INTERVAL).
+        subfolders = self.catalog.quick_scan_folder(root, self.filter_func)
+        self._set_live(root, subfolders)
+
+    @on_gtk
+    def _start_watching(self, root, subfolders):
+        if root in self.roots and self._add_monitors(root, subfolders):
+            self.events.put(("verify", root))
+
+    @on_gtk
+    def _set_live(self, root, subfolders):
+        # subfolders found by the verifying scan have to be monitored too
+        if root in self.roots and self._add_monitors(root, subfolders):
+            logger.info(lambda: "Watching %s (%d folders) for changes" % (root, len(subfolders)))
+            self.live.add(root)
+
+    @on_gtk
+    def _watch_subfolders(self, root, subfolders):
+        if root in self.roots:
+            self._add_monitors(root, subfolders)
+
+    def _add_monitors(self, root, subfolders):
+        """Returns whether all subfolders are monitored"""
+        new = [f for f in subfolders if f not in self.monitors]
+        if len(self.monitors) + len(new) > FolderWatcher.MAX_MONITORS:
+            logger.warning(
+                lambda: "Too many subfolders in %s to watch them for changes, "
+                "will rely on periodic rescans instead" % root
+            )
+            self.live.discard(root)
+            return False
+
+        for subfolder in new:
+            try:
+                monitor = Gio.File.new_for_path(subfolder).monitor_directory(
+                    Gio.FileMonitorFlags.WATCH_MOVES, None
+                )
+                monitor.connect("changed", self._on_changed)
+                self.monitors[subfolder] = monitor
+            except Exception:
+                logger.exception(lambda: "Could not watch folder %s for changes" % subfolder)
+                self.live.discard(root)
+                return False
+        return True
+
+    def _remove_monitors(self, folder):
+        prefix = os.path.join(folder, "")
+        for path in list(self.monitors.keys()):
+            if path != folder and not path.startswith(prefix):
+                continue
+            # keep the monitors of subfolders that also belong to another watched folder
+            if any(path == r or path.startswith(os.path.join(r, "")) for r in self.roots):
+                continue
+            self.monitors.pop(path).cancel()
+
+    def _root_of(self, path):
+        for root in self.roots:
+            if path == root or path.startswith(os.path.join(root, "")):
+                return root
+        return None
+
+    def _add_file(self, path):
+        if os.path.isdir(path):
+            root = self._root_of(path)
+            if root and path not in self.monitors:
+                # a whole new subfolder appeared in a watched folder
+                self._watch_subfolders(root, self.catalog.add_tree(path, self.filter_func))
+        elif self.filter_func(path):
+            self.catalog.add_file(path)
+
+    def _remove_file(self, path):
+        prefix = os.path.join(path, "")
+        monitored = [p for p in self.monitors if p == path or p.startswith(prefix)]
+        if monitored:
+            for p in monitored:
+                self.monitors.pop(p).cancel()
+            self.live.discard(path)
+            self.events.put(("remove_folder", path))
+        else:
+            self.events.put(("remove_file", path))
+
+    def _on_changed(self, monitor, file, other_file, event_type):
+        path = file.get_path()
+        if not path:
+            return
+
+        logger.debug(lambda: "Folder watcher: %s %s" % (event_type, path))
+        if event_type in (
+            Gio.FileMonitorEvent.CREATED,
+            Gio.FileMonitorEvent.MOVED_IN,
+            Gio.FileMonitorEvent.CHANGES_DONE_HINT,
+        ):
+            self.events.put(("add", path))
+        elif event_type in (Gio.FileMonitorEvent.DELETED, Gio.FileMonitorEvent.MOVED_OUT):
+            self._remove_file(path)
+        elif event_type == Gio.FileMonitorEvent.RENAMED:
+            self._remove_file(path)
+            if other_file and other_file.get_path():
+                self.events.put(("add", other_file.get_path()))
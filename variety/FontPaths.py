@@ -0,0 +1,88 @@
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+
+from variety.Util import Util
+
+logger = logging.getLogger("variety")
+
+
+class FontPaths:
+    """
+    Resolves fontconfig font names (e.g. "Serif:Bold") to font files with fc-match, remembering
+    the results in a JSON file in the profile folder, so that fc-match does not have to run again
+    on every start. Remembered paths are used for at most max_age seconds and only while the file
+    still exists, so newly installed fonts are eventually picked up.
+    """
+
+    def __init__(self, cache_file, max_age=7 * 24 * 3600):
+        self.cache_file = cache_file
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.paths = self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_file, encoding="utf8") as f:
+                return {k: tuple(v) for k, v in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+        except Exception:
+            logger.exception(lambda: "Could not load font paths from %s" % self.cache_file)
+            return {}
+
+    def _save(self):
+        tmp = "%s.%s.tmp" % (self.cache_file, Util.random_hash())
+        try:
+            with open(tmp, "w", encoding="utf8") as f:
+                json.dump(self.paths, f, indent=4, ensure_ascii=False, sort_keys=True)
+            os.replace(tmp, self.cache_file)
+        except Exception:
+            logger.exception(lambda: "Could not save font paths to %s" % self.cache_file)
+            Util.safe_unlink(tmp)
+
+    def resolve(self, font_name):
+        """Returns the font file for the font name, or an empty string if it was not found"""
+        with self.lock:
+            cached = self.paths.get(font_name)
+            if cached and time.time() - cached[1] < self.max_age and os.path.isfile(cached[0]):
+                return cached[0]
+
+            font_file = self._fc_match(font_name)
+            if font_file:
+                self.paths[font_name] = (font_file, time.time())
+                self._save()
+            return font_file
+
+    @staticmethod
+    def _fc_match(font_name):
+        cmd = ["fc-match", "-f", "%{file[0]}", font_name]
+        try:
+            result = subprocess.run(cmd, check=False, text=True, stdout=subprocess.PIPE)
+        except OSError:
+            logger.warning(lambda: "Could not run fc-match, is fontconfig installed?")
+            return ""
+        if result.returncode != 0:
+            logger.warning(
+                lambda: f"Could not find font {font_name!r}. Exit code: {result.returncode}"
+            )
+            return ""
+        return result.stdout
@@ -0,0 +1,149 @@
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from variety.Util import Util
+
+logger = logging.getLogger("variety")
+
+
+class HttpCache:
+    """
+    On-disk cache of GET responses for feeds and API calls, see the cache_ttl parameter of
+    Util.request. Within ttl seconds of being fetched or revalidated, the stored response is
+    returned without any request. After that it is revalidated with a conditional request
+    (If-None-Match/If-Modified-Since), so an unchanged response costs just a 304 Not Modified.
+
+    Every entry is a pair of files named by the hash of the URL: the body, and a JSON file with the
+    headers and the time of the last fetch. When there are more than max_entries, the least
+    recently fetched ones are evicted.
+    """
+
+    # response headers needed to rebuild the response and to revalidate it
+    KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+    def __init__(self, folder, max_entries=200):
+        self.folder = folder
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        Util.makedirs(folder)
+
+    def _paths(self, url):
+        name = hashlib.md5(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.folder, name + ".json"), os.path.join(self.folder, name + ".body")
+
+    def _load(self, url):
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, encoding="utf8") as f:
+                meta = json.load(f)
+            if meta["url"] != url:
+                return None
+            with open(body_path, "rb") as f:
+                return meta, f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save(self, url, meta, body=None):
+        meta_path, body_path = self._paths(url)
+        suffix = ".%s.tmp" % Util.random_hash()
+        try:
+            with self.lock:
+                if body is not None:
+                    with open(body_path + suffix, "wb") as f:
+                        f.write(body)
+                    os.replace(body_path + suffix, body_path)
+                with open(meta_path + suffix, "w", encoding="utf8") as f:
+                    json.dump(meta, f)
+                os.replace(meta_path + suffix, meta_path)
+                self._evict()
+        except OSError:
+            logger.exception(lambda: "Could not save the response of %s to the HTTP cache" % url)
+            Util.safe_unlink(body_path + suffix)
+            Util.safe_unlink(meta_path + suffix)
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.folder):
+            if name.endswith(".json"):
+                try:
+                    entries.append((os.path.getmtime(os.path.join(self.folder, name)), name))
+                except OSError:
+                    pass
+        for _, name in sorted(entries)[: max(0, len(entries) - self.max_entries)]:
+            Util.safe_unlink(os.path.join(self.folder, name))
+            Util.safe_unlink(os.path.join(self.folder, name[: -len(".json")] + ".body"))
+
+    @staticmethod
+    def _response(url, meta, body):
+        r = requests.Response()
+        r.status_code = 200
+        r.url = url
+        r.headers = CaseInsensitiveDict(meta["headers"])
+        r.encoding = meta.get("encoding")
+        r._content = body
+        return r
+
+    def request(self, url, ttl, send):
+        """
+        Returns the response for url, from the cache if possible. send(headers) should make the
+        actual GET request with the given extra headers and return the requests.Response.
+        """
+        cached = self._load(url)
+        if cached and time.time() - cached[0]["time"] < ttl:
+            logger.debug(lambda: "Using the cached response of %s" % url)
+            return self._response(url, *cached)
+
+        validators = {}
+        if cached:
+            headers = cached[0]["headers"]
+            if "ETag" in headers:
+                validators["If-None-Match"] = headers["ETag"]
+            if "Last-Modified" in headers:
+                validators["If-Modified-Since"] = headers["Last-Modified"]
+
+        r = send(validators)
+        if r.status_code == 304 and cached:
+            logger.info(lambda: "%s was not modified, using the cached response" % url)
+            meta = cached[0]
+            # a 304 may come with updated validators
+            meta["headers"].update({h: r.headers[h] for h in self.KEPT_HEADERS if h in r.headers})
+            meta["time"] = time.time()
+            self._save(url, meta)
+            return self._response(url, meta, cached[1])
+
+        if r.status_code == 200:
+            meta = {
+                "url": url,
+                "time": time.time(),
+                "encoding": r.encoding,
+                "headers": {h: r.headers[h] for h in self.KEPT_HEADERS if h in r.headers},
+            }
+            self._save(url, meta, r.content)
+        return r
+
+    def clear(self):
+        with self.lock:
+            for name in os.listdir(self.folder):
+                Util.safe_unlink(os.path.join(self.folder, name))
@@ -0,0 +1,138 @@
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+"""
+Process-wide HTTP connection pooling for Util.request: connections are kept alive and reused
+for later requests to the same host, from any thread, instead of doing a new TCP and TLS handshake
+for every request.
+
+Every thread gets its own requests.Session (sessions are not guaranteed to be thread-safe), but all
+of them share the same HTTPAdapter, i.e. the same urllib3 connection pools, which are.
+Like with plain requests.request, no cookies are kept between requests.
+"""
+
+import collections
+import http.cookiejar
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("variety")
+
+
+class PoolStatsAdapter(HTTPAdapter):
+    """HTTPAdapter that keeps count of the requests made and connections opened per host"""
+
+    def __init__(self, pool_connections=10, pool_maxsize=4, previous=None):
+        # counters of the pools that were already closed, (scheme, host) -> [requests, connections].
+        # They are shared with the previous adapter, whose pools still get disposed after it is
+        # replaced, so its lock is shared too.
+        if previous is not None:
+            self.totals, self.totals_lock = previous.totals, previous.totals_lock
+        else:
+            self.totals = collections.defaultdict(lambda: [0, 0])
+            self.totals_lock = threading.Lock()
+        super().__init__(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        # pools are closed when evicted (more than pool_connections hosts) or on close()
+        self.poolmanager.pools.dispose_func = self._dispose_pool
+
+    def _dispose_pool(self, pool):
+        with self.totals_lock:
+            counts = self.totals[(pool.scheme, pool.host)]
+            counts[0] += pool.num_requests
+            counts[1] += pool.num_connections
+        pool.close()
+
+    def get_counts(self):
+        with self.totals_lock:
+            counts = collections.defaultdict(lambda: [0, 0])
+            for key, (num_requests, num_connections) in self.totals.items():
+                counts[key][0] += num_requests
+                counts[key][1] += num_connections
+            pools = self.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    counts[(pool.scheme, pool.host)][0] += pool.num_requests
+                    counts[(pool.scheme, pool.host)][1] += pool.num_connections
+        return counts
+
+
+_lock = threading.Lock()
+_adapter = PoolStatsAdapter()
+_local = threading.local()
+
+
+def configure(pool_connections, pool_maxsize):
+    """
+    pool_connections is the number of hosts to keep connections to, pool_maxsize the number of
+    idle connections kept per host.
+    """
+    global _adapter
+    with _lock:
+        old = _adapter
+        if (old._pool_connections, old._pool_maxsize) == (pool_connections, pool_maxsize):
+            return
+        logger.info(
+            lambda: "HTTP connection pools: %d hosts, %d connections per host"
+            % (pool_connections, pool_maxsize)
+        )
+        _adapter = PoolStatsAdapter(pool_connections, pool_maxsize, previous=old)
+    # requests in progress on the old pools complete normally, their connections are then dropped
+    old.close()
+
+
+def get_session():
+    """Returns the requests.Session for the calling thread"""
+    session = getattr(_local, "session", None)
+    if session is None or _local.adapter is not _adapter:
+        adapter = _adapter
+        session = requests.Session()
+        session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _local.session = session
+        _local.adapter = adapter
+    return session
+
+
+def get_stats():
+    """
+    Returns the request and connection counts, in total and per host. Every new connection is a
+    TCP handshake - and a TLS one for HTTPS. hit_rate is the share of requests that reused an
+    already open connection.
+    """
+
+    def summary(num_requests, num_connections):
+        return {
+            "requests": num_requests,
+            "connections": num_connections,
+            "hit_rate": round(1 - num_connections / num_requests, 3) if num_requests else None,
+        }
+
+    counts = _adapter.get_counts()
+    total_requests = sum(c[0] for c in counts.values())
+    total_connections = sum(c[1] for c in counts.values())
+    stats = summary(total_requests, total_connections)
+    stats["tls_handshakes"] = sum(c[1] for key, c in counts.items() if key[0] == "https")
+    stats["hosts"] = {
+        "%s://%s" % key: summary(*c) for key, c in sorted(counts.items(), key=lambda kv: kv[0])
+    }
+    return stats
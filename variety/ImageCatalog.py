@@ -0,0 +1,497 @@
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+import collections
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger("variety")
+
+
+class ImageCatalog:
+    """
+    Persistent catalog of the images in the local source folders (folders, Favorites, Fetched and
+    the downloaders' target folders), stored in a single SQLite file in the profile folder.
+
+    Every source folder is walked once in a background thread and then only rescanned every
+    RESCAN_INTERVAL seconds, so picking random images becomes a database query instead of a
+    directory walk. Folders kept up to date by the FolderWatcher are only rescanned every
+    LIVE_RESCAN_INTERVAL seconds, as a safety net for changes the file monitors cannot see
+    (e.g. ones made on another machine on network shares).
+    Image dimensions are filled in lazily, the first time the size filter needs them.
+
+    The modification times of all subfolders are recorded too, so that after the first full walk
+    a rescan only needs to list the subfolders whose contents changed (see quick_scan_folder).
+    Every folder gets such a quick rescan on the first refresh after startup, to pick up the
+    images added, removed or renamed while Variety was not running - images overwritten in place
+    meanwhile are only picked up by the next full rescan.
+    """
+
+    RESCAN_INTERVAL = 30 * 60
+    LIVE_RESCAN_INTERVAL = 12 * 3600
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        self.refresh_thread = None
+        # folders scanned since startup
+        self.scanned_this_run = set()
+        # called as listener(folder) after every scan of a folder
+        self.scan_listeners = []
+        self.db = self._connect()
+
+    def _connect(self):
+        try:
+            db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._create_tables(db)
+            return db
+        except sqlite3.DatabaseError:
+            logger.exception(lambda: "Image catalog %s is corrupt, recreating it" % self.db_path)
+            try:
+                os.unlink(self.db_path)
+            except OSError:
+                pass
+            db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._create_tables(db)
+            return db
+
+    @staticmethod
+    def _create_tables(db):
+        with db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS folders (folder TEXT PRIMARY KEY, scanned_at REAL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS images ("
+                "folder TEXT NOT NULL, path TEXT NOT NULL, size INTEGER, mtime REAL, "
+                "width INTEGER, height INTEGER, PRIMARY KEY (folder, path))"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS images_path ON images (path)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS dirs ("
+                "folder TEXT NOT NULL, path TEXT NOT NULL, mtime REAL, PRIMARY KEY (folder, path))"
+            )
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def is_scanned(self, folders):
+        folders = set(os.path.normpath(f) for f in folders)
+        with self.lock:
+            scanned = set(f for (f,) in self.db.execute("SELECT folder FROM folders"))
+        return folders.issubset(scanned)
+
+    def add_scan_listener(self, listener):
+        self.scan_listeners.append(listener)
+
+    def refresh(self, folders, filter_func, live_folders=()):
+        """
+        Starts a background rescan of the folders that were not scanned since startup or have not
+        been scanned in the last RESCAN_INTERVAL (LIVE_RESCAN_INTERVAL for live_folders) seconds.
+        Does nothing if a rescan is already running.
+        """
+        live_folders = set(os.path.normpath(f) for f in live_folders)
+        with self.lock:
+            if self.refresh_thread and self.refresh_thread.is_alive():
+                return
+            scanned_at = dict(self.db.execute("SELECT folder, scanned_at FROM folders"))
+            now = time.time()
+            stale = []
+            for folder in set(os.path.normpath(f) for f in folders):
+                interval = (
+                    ImageCatalog.LIVE_RESCAN_INTERVAL
+                    if folder in live_folders
+                    else ImageCatalog.RESCAN_INTERVAL
+                )
+                if (
+                    folder not in self.scanned_this_run
+                    or scanned_at.get(folder, 0) < now - interval
+                ):
+                    stale.append(folder)
+            if not stale:
+                return
+
+            def _refresh():
+                for folder in stale:
+                    try:
+                        if folder in self.scanned_this_run:
+                            self.scan_folder(folder, filter_func)
+                        else:
+                            self.quick_scan_folder(folder, filter_func)
+                    except Exception:
+                        logger.exception(lambda: "Could not scan folder %s for catalog" % folder)
+
+            self.refresh_thread = threading.Thread(target=_refresh, name="ImageCatalog refresh")
+            self.refresh_thread.daemon = True
+            self.refresh_thread.start()
+
+    @staticmethod
+    def _range(prefix):
+        # bounds of the paths that start with prefix, for range queries on the primary key
+        return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+    def _list_dir(self, path, filter_func):
+        """
+        Returns the mtime of the folder path, its subfolders and the (size, mtime) of the images
+        directly in it. The folder is stat-ed before listing it, so that changes made while
+        listing it show up in the next scan.
+        """
+        st = self._stat(path)
+        if not st:
+            return None, [], {}
+        subfolders = []
+        images = {}
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            logger.debug(lambda: "Could not list %s, skipping it" % path)
+            return None, [], {}
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    subfolders.append(entry.path)
+                elif filter_func(entry.path):
+                    file_st = self._stat(entry.path)
+                    if file_st:
+                        images[entry.path] = (file_st.st_size, file_st.st_mtime)
+            except Exception:
+                logger.debug(lambda: "Could not check %s, skipping it" % entry.path)
+        return st.st_mtime, subfolders, images
+
+    def _walk(self, path, filter_func):
+        """Returns the mtimes of path and all of its subfolders, and the images in them"""
+        dirs = {}
+        images = {}
+        pending = [path]
+        while pending:
+            folder = pending.pop()
+            mtime, subfolders, folder_images = self._list_dir(folder, filter_func)
+            if mtime is None:
+                continue
+            dirs[folder] = mtime
+            images.update(folder_images)
+            pending.extend(subfolders)
+        return dirs, images
+
+    def _save_images(self, folder, known, found):
+        self.db.executemany(
+            "DELETE FROM images WHERE folder = ? AND path = ?",
+            ((folder, path) for path in known if path not in found),
+        )
+        self.db.executemany(
+            "INSERT OR REPLACE INTO images (folder, path, size, mtime) VALUES (?, ?, ?, ?)",
+            (
+                (folder, path, size, mtime)
+                for path, (size, mtime) in found.items()
+                if known.get(path) != (size, mtime)
+            ),
+        )
+
+    def _save_dirs(self, folder, dirs):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO dirs (folder, path, mtime) VALUES (?, ?, ?)",
+            ((folder, path, mtime) for path, mtime in dirs.items()),
+        )
+
+    def _scanned(self, folder, started):
+        self.db.execute(
+            "INSERT OR REPLACE INTO folders (folder, scanned_at) VALUES (?, ?)", (folder, started)
+        )
+        self.scanned_this_run.add(folder)
+
+    def _notify(self, folder):
+        for listener in self.scan_listeners:
+            try:
+                listener(folder)
+            except Exception:
+                logger.exception(lambda: "Error in image catalog scan listener")
+
+    def scan_folder(self, folder, filter_func):
+        """Walks the whole folder and updates its images. Returns the folder and its subfolders."""
+        folder = os.path.normpath(folder)
+        logger.info(lambda: "Scanning folder %s for the image catalog" % folder)
+        start = time.time()
+
+        dirs, found = self._walk(folder, filter_func) if os.path.isdir(folder) else ({}, {})
+
+        with self.lock, self.db:
+            known = {
+                path: (size, mtime)
+                for path, size, mtime in self.db.execute(
+                    "SELECT path, size, mtime FROM images WHERE folder = ?", (folder,)
+                )
+            }
+            self._save_images(folder, known, found)
+            self.db.execute("DELETE FROM dirs WHERE folder = ?", (folder,))
+            self._save_dirs(folder, dirs)
+            self._scanned(folder, start)
+
+        logger.info(
+            lambda: "Catalog scan of %s found %d images in %.1f seconds"
+            % (folder, len(found), time.time() - start)
+        )
+        self._notify(folder)
+        return list(dirs)
+
+    def quick_scan_folder(self, folder, filter_func):
+        """
+        Like scan_folder, but only lists the subfolders whose mtime changed since the last scan,
+        i.e. the ones where files were added, removed or renamed. Falls back to a full scan if the
+        folder was never scanned. Returns the folder and its subfolders.
+
+        Files overwritten in place do not change the mtime of their folder, so their recorded size
+        and mtime stay stale until the next full scan. Only list_images(by_mtime=True) relies on
+        these, everything cached per image (dimensions, verdicts, colors) checks the file itself.
+        """
+        folder = os.path.normpath(folder)
+        with self.lock:
+            known_dirs = dict(
+                self.db.execute("SELECT path, mtime FROM dirs WHERE folder = ?", (folder,))
+            )
+        if not known_dirs:
+            return self.scan_folder(folder, filter_func)
+
+        start = time.time()
+        removed = []
+        listed = {}
+        found = {}
+        new_dirs = []
+        for path, mtime in known_dirs.items():
+            st = self._stat(path)
+            if not st:
+                removed.append(path)
+            elif st.st_mtime != mtime:
+                listed[path], subfolders, images = self._list_dir(path, filter_func)
+                if listed[path] is None:
+                    del listed[path]
+                    removed.append(path)
+                    continue
+                found.update(images)
+                new_dirs.extend(f for f in subfolders if f not in known_dirs)
+        for path in new_dirs:
+            dirs, images = self._walk(path, filter_func)
+            listed.update(dirs)
+            found.update(images)
+
+        with self.lock, self.db:
+            for path in removed:
+                self.db.execute(
+                    "DELETE FROM images WHERE folder = ? AND path > ? AND path < ?",
+                    (folder, *self._range(os.path.join(path, ""))),
+                )
+                self.db.execute(
+                    "DELETE FROM dirs WHERE folder = ? AND (path = ? OR (path > ? AND path < ?))",
+                    (folder, path, *self._range(os.path.join(path, ""))),
+                )
+            known = {}
+            for path in listed:
+                known.update(
+                    (image, (size, mtime))
+                    for image, size, mtime in self.db.execute(
+                        "SELECT path, size, mtime FROM images "
+                        "WHERE folder = ? AND path > ? AND path < ?",
+                        (folder, *self._range(os.path.join(path, ""))),
+                    )
+                    if os.path.dirname(image) == path
+                )
+            self._save_images(folder, known, found)
+            self._save_dirs(folder, listed)
+            self._scanned(folder, start)
+            subfolders = [
+                path
+                for (path,) in self.db.execute("SELECT path FROM dirs WHERE folder = ?", (folder,))
+            ]
+
+        logger.info(
+            lambda: "Quick catalog scan of %s relisted %d of %d folders in %.1f seconds"
+            % (folder, len(listed), len(subfolders), time.time() - start)
+        )
+        self._notify(folder)
+        return subfolders
+
+    def get_subfolders(self, folder):
+        """Returns the folder and its subfolders as of the last scan"""
+        with self.lock:
+            return [
+                path
+                for (path,) in self.db.execute(
+                    "SELECT path FROM dirs WHERE folder = ?", (os.path.normpath(folder),)
+                )
+            ]
+
+    def add_tree(self, path, filter_func):
+        """
+        Adds a new subfolder of cataloged folders with all of its contents. Returns the subfolder
+        and its own subfolders.
+        """
+        path = os.path.normpath(path)
+        dirs, images = self._walk(path, filter_func)
+        with self.lock, self.db:
+            for folder in self._folders_of(path):
+                self._save_images(folder, {}, images)
+                self._save_dirs(folder, dirs)
+        return list(dirs)
+
+    def count(self, folders):
+        """Returns the number of distinct images in the folders, which may overlap"""
+        folders = list(set(os.path.normpath(f) for f in folders))
+        if not folders:
+            return 0
+        with self.lock:
+            return self.db.execute(
+                "SELECT COUNT(DISTINCT path) FROM images WHERE folder IN (%s)"
+                % ",".join("?" * len(folders)),
+                folders,
+            ).fetchone()[0]
+
+    def random_images(self, folders, count, max_files=10000):
+        """
+        Returns up to count distinct random images from the given folders. Just like
+        Util.list_files, every folder contributes at most an equal share of max_files images, so a
+        single huge folder does not crowd out the smaller ones.
+        """
+        folders = set(os.path.normpath(f) for f in folders)
+        if not folders or count <= 0:
+            return []
+
+        folder_quota = max(20, int(max_files / len(folders)))
+        with self.lock:
+            sizes = {}
+            weights = {}
+            for folder in folders:
+                n = self.db.execute(
+                    "SELECT COUNT(*) FROM images WHERE folder = ?", (folder,)
+                ).fetchone()[0]
+                if n:
+                    sizes[folder] = n
+                    weights[folder] = min(n, folder_quota)
+            if not weights:
+                return []
+
+            picks = collections.Counter(
+                random.choices(list(weights.keys()), weights=list(weights.values()), k=count)
+            )
+            # folders may overlap (e.g. a folder and one of its subfolders), and then the same
+            # image can be picked from both of them
+            images = {}
+            for folder, k in picks.items():
+                # random offsets walk the primary key index, ORDER BY RANDOM() would sort the
+                # whole folder
+                for offset in random.sample(range(sizes[folder]), min(k, sizes[folder])):
+                    row = self.db.execute(
+                        "SELECT path FROM images WHERE folder = ? ORDER BY path LIMIT 1 OFFSET ?",
+                        (folder, offset),
+                    ).fetchone()
+                    if row:
+                        images[row[0]] = None
+
+        images = list(images)
+        random.shuffle(images)
+        return images
+
+    def list_images(self, folder, by_mtime=False):
+        """Returns all cataloged images in the folder, sorted by path or by modification time."""
+        with self.lock:
+            return [
+                path
+                for (path,) in self.db.execute(
+                    "SELECT path FROM images WHERE folder = ? ORDER BY "
+                    + ("mtime, path" if by_mtime else "path"),
+                    (os.path.normpath(folder),),
+                )
+            ]
+
+    def _folders_of(self, path):
+        path = os.path.normpath(path)
+        with self.lock:
+            return [
+                folder
+                for (folder,) in self.db.execute("SELECT folder FROM folders")
+                if path.startswith(os.path.join(folder, ""))
+            ]
+
+    @staticmethod
+    def _stat(path):
+        try:
+            # SQLite cannot store file names that are not valid UTF-8, these are not cataloged
+            path.encode("utf-8")
+            return os.stat(path)
+        except (OSError, UnicodeEncodeError):
+            return None
+
+    def add_file(self, path):
+        st = self._stat(path)
+        if not st:
+            return
+        path = os.path.normpath(path)
+        with self.lock, self.db:
+            for folder in self._folders_of(path):
+                self.db.execute(
+                    "INSERT OR REPLACE INTO images (folder, path, size, mtime) VALUES (?, ?, ?, ?)",
+                    (folder, path, st.st_size, st.st_mtime),
+                )
+
+    def remove_file(self, path):
+        try:
+            with self.lock, self.db:
+                self.db.execute("DELETE FROM images WHERE path = ?", (os.path.normpath(path),))
+        except UnicodeEncodeError:
+            pass  # never cataloged
+
+    def remove_folder(self, folder):
+        folder = os.path.normpath(folder)
+        prefix = os.path.join(folder, "")
+        try:
+            with self.lock, self.db:
+                self.db.execute(
+                    "DELETE FROM images WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)
+                )
+                self.db.execute(
+                    "DELETE FROM dirs WHERE path = ? OR substr(path, 1, ?) = ?",
+                    (folder, len(prefix), prefix),
+                )
+        except UnicodeEncodeError:
+            pass  # never cataloged
+
+    def get_dimensions(self, path):
+        """
+        Returns the cached (width, height) of the image, or None if they are not known yet or
+        the file has changed since they were recorded.
+        """
+        st = self._stat(path)
+        if not st:
+            return None
+        with self.lock:
+            row = self.db.execute(
+                "SELECT width, height FROM images "
+                "WHERE path = ? AND size = ? AND mtime = ? AND width IS NOT NULL LIMIT 1",
+                (os.path.normpath(path), st.st_size, st.st_mtime),
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def set_dimensions(self, path, width, height):
+        st = self._stat(path)
+        if not st:
+            return
+        with self.lock, self.db:
+            self.db.execute(
+                "UPDATE images SET width = ?, height = ?, size = ?, mtime = ? WHERE path = ?",
+                (width, height, st.st_size, st.st_mtime, os.path.normpath(path)),
+            )
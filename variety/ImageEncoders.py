@@ -0,0 +1,113 @@
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+"""
+Encoders for the image files produced when rendering wallpapers.
+
+Intermediate files, which are only read back by ImageMagick or display mode plugins, are written
+as uncompressed BMPs - lossless and practically free to encode. The final wallpaper files are
+encoded as configured in the render_* options, and the benchmark below helps choose these for a
+given machine: run python3 -m variety.ImageEncoders [image].
+"""
+
+import io
+import sys
+import time
+import types
+
+from PIL import Image
+
+OUTPUT_FORMATS = ("jpeg", "png")
+JPEG_SUBSAMPLINGS = ("4:4:4", "4:2:2", "4:2:0")
+
+INTERMEDIATE_EXTENSION = ".bmp"
+INTERMEDIATE_PARAMS = {"format": "BMP"}
+
+# (description, output format, JPEG quality, JPEG subsampling, PNG compression)
+BENCHMARK_CANDIDATES = [
+    ("jpeg q95 4:2:0", "jpeg", 95, "4:2:0", None),
+    ("jpeg q90 4:2:0", "jpeg", 90, "4:2:0", None),
+    ("jpeg q85 4:2:0", "jpeg", 85, "4:2:0", None),
+    ("jpeg q95 4:4:4", "jpeg", 95, "4:4:4", None),
+    ("jpeg q100 4:4:4", "jpeg", 100, "4:4:4", None),
+    ("png level 0", "png", None, None, 0),
+    ("png level 1", "png", None, None, 1),
+    ("png level 6", "png", None, None, 6),
+]
+
+
+def get_output_encoder(options):
+    """Returns the (file extension, PIL save parameters) for rendered wallpapers"""
+    if options.render_output_format == "png":
+        return ".png", {"format": "PNG", "compress_level": options.render_png_compression}
+    return (
+        ".jpg",
+        {
+            "format": "JPEG",
+            "quality": options.render_jpeg_quality,
+            "subsampling": options.render_jpeg_subsampling,
+            "optimize": False,
+        },
+    )
+
+
+def benchmark(image, repeat=3):
+    """
+    Encodes and decodes the image with each of the BENCHMARK_CANDIDATES.
+    Yields (description, encode seconds, decode seconds, encoded bytes), best of repeat runs.
+    """
+    image = image.convert("RGB")
+    for description, output_format, quality, subsampling, compression in BENCHMARK_CANDIDATES:
+        options = types.SimpleNamespace(
+            render_output_format=output_format,
+            render_jpeg_quality=quality,
+            render_jpeg_subsampling=subsampling,
+            render_png_compression=compression,
+        )
+        _, params = get_output_encoder(options)
+
+        encode_times, decode_times = [], []
+        for _ in range(repeat):
+            buffer = io.BytesIO()
+            start = time.perf_counter()
+            image.save(buffer, **params)
+            encode_times.append(time.perf_counter() - start)
+
+            buffer.seek(0)
+            start = time.perf_counter()
+            with Image.open(buffer) as decoded:
+                decoded.load()
+            decode_times.append(time.perf_counter() - start)
+        yield description, min(encode_times), min(decode_times), len(buffer.getvalue())
+
+
+def main(args):
+    if args:
+        with Image.open(args[0]) as image:
+            image = image.convert("RGB")
+    else:
+        image = Image.effect_mandelbrot((3840, 2160), (-2.0, -1.1, 1.0, 1.1), 100).convert("RGB")
+
+    print("Encoding a %dx%d image:" % image.size)
+    print("%-20s %10s %10s %10s" % ("encoder", "encode ms", "decode ms", "size KB"))
+    for description, encode_time, decode_time, size in benchmark(image):
+        print(
+            "%-20s %10.1f %10.1f %10d"
+            % (description, encode_time * 1000, decode_time * 1000, size // 1024)
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
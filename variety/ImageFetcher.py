@@ -20,6 +20,8 @@ import urllib.parse
 from PIL import Image
 from requests.exceptions import HTTPError
 
+from variety import ResumableDownload
+from variety.ResumableDownload import DownloadInterrupted
 from variety.Util import Util, _
 
 logger = logging.getLogger("variety")
@@ -108,8 +110,12 @@ class ImageFetcher:
                 progress_reporter(_("Fetching"), url)
 
             local_filepath_partial = filename + ".partial"
-            with open(local_filepath_partial, "wb") as f:
-                Util.request_write_to(r, f)
+            try:
+                ResumableDownload.download(url, local_filepath_partial, response=r)
+            except DownloadInterrupted:
+                # fetches are not retried, so nothing would ever resume the download
+                ResumableDownload.discard(local_filepath_partial)
+                raise
 
             try:
                 img = Image.open(local_filepath_partial)
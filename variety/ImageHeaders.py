@@ -0,0 +1,253 @@
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+"""
+Pure-Python parsing of image file headers: determines the format and dimensions of JPEG, PNG, GIF,
+WebP, BMP and AVIF/HEIF files by reading only the few bytes where these are stored, without loading
+any image decoders. Format names match the GdkPixbuf loader names.
+"""
+
+import logging
+import struct
+
+logger = logging.getLogger("variety")
+
+# Start-of-frame markers, i.e. all 0xC0-0xCF except DHT (C4), JPG (C8) and DAC (CC)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# Markers without a length field
+_JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+
+_AVIF_BRANDS = {b"avif", b"avis"}
+_HEIF_BRANDS = {b"heic", b"heix", b"heim", b"heis", b"hevc", b"hevx", b"mif1", b"msf1"}
+
+# Bounds for the ISO-BMFF "meta" box we are willing to read when looking for the dimensions
+_MAX_META_BOX_SIZE = 1024 * 1024
+
+
+def get_image_info(filename):
+    """
+    Returns a (format, width, height) tuple, or None if the file is not in one of the supported
+    formats or its header could not be parsed. Never raises for bad files.
+    """
+    try:
+        with open(filename, "rb") as f:
+            head = f.read(32)
+            if head.startswith(b"\xff\xd8"):
+                info = _jpeg_info(f)
+            elif head.startswith(b"\x89PNG\r\n\x1a\n"):
+                info = _png_info(head)
+            elif head[:6] in (b"GIF87a", b"GIF89a"):
+                info = ("gif",) + struct.unpack("<HH", head[6:10])
+            elif head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+                info = _webp_info(head + f.read(32))
+            elif head[:2] == b"BM":
+                info = _bmp_info(head)
+            elif head[4:8] == b"ftyp":
+                info = _isobmff_info(f, head)
+            else:
+                info = None
+    except Exception:
+        logger.debug(lambda: "Could not parse image header of %s" % filename, exc_info=True)
+        return None
+
+    if info and info[1] > 0 and info[2] > 0:
+        return info
+    return None
+
+
+def _read_exact(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("Unexpected end of file")
+    return data
+
+
+def _jpeg_info(f):
+    f.seek(2)
+    while True:
+        byte = _read_exact(f, 1)
+        if byte != b"\xff":
+            return None  # not at a marker, corrupt file
+        marker = _read_exact(f, 1)[0]
+        while marker == 0xFF:  # fill bytes
+            marker = _read_exact(f, 1)[0]
+        if marker in _JPEG_STANDALONE_MARKERS:
+            continue
+        if marker in (0xD9, 0xDA):
+            return None  # end of image or start of scan before any frame header
+        (length,) = struct.unpack(">H", _read_exact(f, 2))
+        if marker in _JPEG_SOF_MARKERS:
+            _, height, width = struct.unpack(">BHH", _read_exact(f, 5))
+            return "jpeg", width, height
+        f.seek(length - 2, 1)
+
+
+def _png_info(head):
+    if head[12:16] != b"IHDR":
+        return None
+    width, height = struct.unpack(">II", head[16:24])
+    return "png", width, height
+
+
+def _webp_info(head):
+    chunk = head[12:16]
+    if chunk == b"VP8 ":
+        # lossy: frame tag (3 bytes), start code 9d 01 2a, then 14-bit dimensions
+        if head[23:26] != b"\x9d\x01\x2a":
+            return None
+        width, height = struct.unpack("<HH", head[26:30])
+        return "webp", width & 0x3FFF, height & 0x3FFF
+    elif chunk == b"VP8L":
+        # lossless: signature byte 0x2f, then 14-bit width-1 and height-1
+        if head[20] != 0x2F:
+            return None
+        (bits,) = struct.unpack("<I", head[21:25])
+        return "webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    elif chunk == b"VP8X":
+        # extended: 24-bit canvas width-1 and height-1
+        width = int.from_bytes(head[24:27], "little") + 1
+        height = int.from_bytes(head[27:30], "little") + 1
+        return "webp", width, height
+    return None
+
+
+def _bmp_info(head):
+    (header_size,) = struct.unpack("<I", head[14:18])
+    if header_size == 12:
+        width, height = struct.unpack("<HH", head[18:22])
+    elif header_size >= 40:
+        width, height = struct.unpack("<ii", head[18:26])
+    else:
+        return None
+    # the height is negative for top-down bitmaps
+    return "bmp", width, abs(height)
+
+
+def _iter_boxes(data, start=0, end=None):
+    """Yields (type, payload_start, payload_end) for the ISO-BMFF boxes in data[start:end]"""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack(">I4s", data[pos : pos + 8])
+        header = 8
+        if size == 1:
+            (size,) = struct.unpack(">Q", data[pos + 8 : pos + 16])
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield box_type, pos + header, min(pos + size, end)
+        pos += size
+
+
+def _isobmff_info(f, head):
+    (ftyp_size,) = struct.unpack(">I", head[:4])
+    if not 16 <= ftyp_size <= 4096:
+        return None
+    f.seek(0)
+    ftyp = _read_exact(f, ftyp_size)
+    brands = {ftyp[8:12]} | {ftyp[i : i + 4] for i in range(16, ftyp_size, 4)}
+    if brands & _AVIF_BRANDS:
+        format = "avif"
+    elif brands & _HEIF_BRANDS:
+        format = "heif"
+    else:
+        return None  # e.g. MP4 video
+
+    # find the top-level meta box, skipping over any others (e.g. mdat) without reading them
+    pos = ftyp_size
+    while True:
+        f.seek(pos)
+        header = f.read(16)
+        if len(header) < 8:
+            return None
+        size, box_type = struct.unpack(">I4s", header[:8])
+        header_size = 8
+        if size == 1:
+            (size,) = struct.unpack(">Q", header[8:16])
+            header_size = 16
+        if size < header_size:
+            return None
+        if box_type == b"meta":
+            if size > _MAX_META_BOX_SIZE:
+                return None
+            f.seek(pos + header_size)
+            meta = _read_exact(f, size - header_size)
+            break
+        pos += size
+
+    # meta is a full box (4 bytes version and flags), the dimensions are in meta/iprp/ipco/ispe
+    sizes = []
+    for box_type, start, end in _iter_boxes(meta, 4):
+        if box_type != b"iprp":
+            continue
+        for ipco_type, ipco_start, ipco_end in _iter_boxes(meta, start, end):
+            if ipco_type != b"ipco":
+                continue
+            for prop_type, prop_start, prop_end in _iter_boxes(meta, ipco_start, ipco_end):
+                if prop_type == b"ispe" and prop_end - prop_start >= 12:
+                    sizes.append(struct.unpack(">II", meta[prop_start + 4 : prop_start + 12]))
+    if not sizes:
+        return None
+
+    # there are separate ispe properties for thumbnails, alpha planes and grid tiles,
+    # the primary image is the biggest one
+    width, height = max(sizes, key=lambda s: s[0] * s[1])
+    return format, width, height
+
+
+def get_gif_frame_count(filename, max_frames=None):
+    """
+    Counts the frames of a GIF by walking its block structure, without decoding anything.
+    Stops as soon as max_frames frames are seen, so get_gif_frame_count(f, 2) > 1 tells whether
+    the GIF is animated after reading just past its first frame. Returns 0 for non-GIF files.
+    """
+    frames = 0
+    try:
+        with open(filename, "rb") as f:
+            head = f.read(13)
+            if len(head) < 13 or head[:6] not in (b"GIF87a", b"GIF89a"):
+                return 0
+            packed = head[10]
+            if packed & 0x80:  # global color table
+                f.seek(3 * 2 ** ((packed & 0x07) + 1), 1)
+
+            while max_frames is None or frames < max_frames:
+                block = f.read(1)
+                if block == b",":  # image descriptor
+                    descriptor = _read_exact(f, 9)
+                    if descriptor[8] & 0x80:  # local color table
+                        f.seek(3 * 2 ** ((descriptor[8] & 0x07) + 1), 1)
+                    _read_exact(f, 1)  # LZW minimum code size
+                    _skip_sub_blocks(f)
+                    frames += 1
+                elif block == b"!":  # extension
+                    _read_exact(f, 1)  # label
+                    _skip_sub_blocks(f)
+                else:
+                    break  # trailer, end of file or garbage
+    except Exception:
+        logger.debug(lambda: "Could not parse GIF %s" % filename, exc_info=True)
+    return frames
+
+
+def _skip_sub_blocks(f):
+    while True:
+        size = _read_exact(f, 1)[0]
+        if size == 0:
+            return
+        f.seek(size, 1)
@@ -0,0 +1,166 @@
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger("variety")
+
+
+class ImageInfoCache:
+    """
+    Persistent, size-bounded cache of values computed from image files (e.g. their dominant colors),
+    stored in an SQLite file in the profile folder.
+
+    Entries are keyed by path and are only returned while the file's size and mtime match the ones
+    it had when the value was stored. When there are more than max_entries, the least recently
+    used ones are evicted. Values must be JSON-serializable - tuples come back as lists.
+
+    Lookups are read-only: the access times they update are kept in memory and written together
+    with the next put or flush, or once MAX_PENDING_ACCESSES of them have accumulated.
+    """
+
+    MAX_PENDING_ACCESSES = 1000
+
+    def __init__(self, db_path, max_entries=50000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.puts_since_eviction = 0
+        # path -> time of the accesses not written to the database yet
+        self.accesses = {}
+        self.db = self._connect()
+
+    def _connect(self):
+        try:
+            db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._create_tables(db)
+            return db
+        except sqlite3.DatabaseError:
+            logger.exception(lambda: "Cache %s is corrupt, recreating it" % self.db_path)
+            try:
+                os.unlink(self.db_path)
+            except OSError:
+                pass
+            db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._create_tables(db)
+            return db
+
+    @staticmethod
+    def _create_tables(db):
+        db.execute("PRAGMA journal_mode = WAL")
+        db.execute("PRAGMA synchronous = NORMAL")
+        with db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime REAL, value TEXT, last_access REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+
+    def flush(self):
+        """Writes the pending access times"""
+        with self.lock, self.db:
+            self._flush_accesses()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.db.close()
+
+    def _flush_accesses(self):
+        self.db.executemany(
+            "UPDATE entries SET last_access = ? WHERE path = ?",
+            ((t, path) for path, t in self.accesses.items()),
+        )
+        self.accesses.clear()
+
+    @staticmethod
+    def _stat(path):
+        try:
+            # SQLite cannot store file names that are not valid UTF-8, these are just not cached
+            path.encode("utf-8")
+            return os.stat(path)
+        except (OSError, UnicodeEncodeError):
+            return None
+
+    def get(self, path):
+        st = self._stat(path)
+        if not st:
+            return None
+
+        with self.lock:
+            row = self.db.execute(
+                "SELECT size, mtime, value FROM entries WHERE path = ?", (path,)
+            ).fetchone()
+            if not row:
+                return None
+            if row[0] != st.st_size or row[1] != st.st_mtime:
+                with self.db:
+                    self.db.execute("DELETE FROM entries WHERE path = ?", (path,))
+                return None
+            self.accesses[path] = time.time()
+            if len(self.accesses) >= self.MAX_PENDING_ACCESSES:
+                with self.db:
+                    self._flush_accesses()
+
+        try:
+            return json.loads(row[2])
+        except ValueError:
+            logger.warning(lambda: "Invalid cached value for %s, ignoring it" % path)
+            return None
+
+    def put(self, path, value):
+        st = self._stat(path)
+        if not st:
+            return
+
+        with self.lock, self.db:
+            self._flush_accesses()
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries (path, size, mtime, value, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime, json.dumps(value), time.time()),
+            )
+            self.puts_since_eviction += 1
+            if self.puts_since_eviction >= max(1, self.max_entries // 100):
+                self.puts_since_eviction = 0
+                self._evict()
+
+    def _evict(self):
+        count = self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if count > self.max_entries:
+            # evict a bit more than needed, so that we don't have to do this on every put
+            to_delete = count - int(self.max_entries * 0.9)
+            logger.info(lambda: "Evicting %d entries from %s" % (to_delete, self.db_path))
+            self.db.execute(
+                "DELETE FROM entries WHERE path IN "
+                "(SELECT path FROM entries ORDER BY last_access LIMIT ?)",
+                (to_delete,),
+            )
+
+    def remove(self, path):
+        try:
+            with self.lock, self.db:
+                self.db.execute("DELETE FROM entries WHERE path = ?", (path,))
+        except UnicodeEncodeError:
+            pass  # never cached
+
+    def clear(self):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM entries")
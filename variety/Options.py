@@ -18,6 +18,7 @@ import logging
 import os
 
 from configobj import ConfigObj, DuplicateError
+from variety import ImageEncoders
 from variety.profile import get_profile_path
 from variety.Util import Util
 from variety_lib import varietyconfig
@@ -149,6 +150,26 @@ class Options:
             except Exception:
                 pass
 
+            try:
+                self.download_concurrency = max(1, min(16, int(config["download_concurrency"])))
+            except Exception:
+                pass
+
+            try:
+                self.download_bandwidth_limit = max(0, int(config["download_bandwidth_limit"]))
+            except Exception:
+                pass
+
+            try:
+                self.http_pool_hosts = max(1, int(config["http_pool_hosts"]))
+            except Exception:
+                pass
+
+            try:
+                self.http_pool_connections = max(1, int(config["http_pool_connections"]))
+            except Exception:
+                pass
+
             try:
                 self.wallhaven_api_key = str(config["wallhaven_api_key"]).strip()
             except Exception:
@@ -177,6 +198,35 @@ class Options:
             except Exception:
                 pass
 
+            try:
+                self.render_cache_size = max(0, int(config["render_cache_size"]))
+            except Exception:
+                pass
+
+            try:
+                render_output_format = config["render_output_format"].strip().lower()
+                if render_output_format in ImageEncoders.OUTPUT_FORMATS:
+                    self.render_output_format = render_output_format
+            except Exception:
+                pass
+
+            try:
+                self.render_jpeg_quality = max(1, min(100, int(config["render_jpeg_quality"])))
+            except Exception:
+                pass
+
+            try:
+                render_jpeg_subsampling = config["render_jpeg_subsampling"].strip()
+                if render_jpeg_subsampling in ImageEncoders.JPEG_SUBSAMPLINGS:
+                    self.render_jpeg_subsampling = render_jpeg_subsampling
+            except Exception:
+                pass
+
+            try:
+                self.render_png_compression = max(0, min(9, int(config["render_png_compression"])))
+            except Exception:
+                pass
+
             try:
                 self.fetched_folder = os.path.expanduser(config["fetched_folder"])
             except Exception:
@@ -268,6 +318,12 @@ class Options:
             except Exception:
                 pass
 
+            try:
+                self.filter_workers = int(config["filter_workers"])
+                self.filter_workers = max(0, min(64, self.filter_workers))
+            except Exception:
+                pass
+
             try:
                 self.smart_notice_shown = config["smart_notice_shown"].lower() in TRUTH_VALUES
             except Exception:
@@ -652,6 +708,10 @@ class Options:
         self.download_preference_ratio = 0.9
         self.quota_enabled = True
         self.quota_size = 1000
+        self.download_concurrency = 4
+        self.download_bandwidth_limit = 0
+        self.http_pool_hosts = 10
+        self.http_pool_connections = 4
         self.wallhaven_api_key = ""
 
         self.favorites_folder = os.path.join(get_profile_path(), "Favorites")
@@ -663,6 +723,11 @@ class Options:
 
         self.wallpaper_auto_rotate = True
         self.wallpaper_display_mode = "os"
+        self.render_cache_size = 200
+        self.render_output_format = "jpeg"
+        self.render_jpeg_quality = 95
+        self.render_jpeg_subsampling = "4:2:0"
+        self.render_png_compression = 1
 
         self.fetched_folder = os.path.join(get_profile_path(), "Fetched")
         self.clipboard_enabled = False
@@ -684,6 +749,7 @@ class Options:
         self.min_rating = 4
         self.name_regex_enabled = False
         self.name_regex = ".*"
+        self.filter_workers = 0
 
         self.smart_notice_shown = False
         self.smart_register_shown = False
@@ -770,6 +836,10 @@ class Options:
 
             config["quota_enabled"] = str(self.quota_enabled)
             config["quota_size"] = str(self.quota_size)
+            config["download_concurrency"] = str(self.download_concurrency)
+            config["download_bandwidth_limit"] = str(self.download_bandwidth_limit)
+            config["http_pool_hosts"] = str(self.http_pool_hosts)
+            config["http_pool_connections"] = str(self.http_pool_connections)
 
             config["wallhaven_api_key"] = str(self.wallhaven_api_key)
 
@@ -780,6 +850,11 @@ class Options:
 
             config["wallpaper_auto_rotate"] = str(self.wallpaper_auto_rotate)
             config["wallpaper_display_mode"] = str(self.wallpaper_display_mode)
+            config["render_cache_size"] = str(self.render_cache_size)
+            config["render_output_format"] = str(self.render_output_format)
+            config["render_jpeg_quality"] = str(self.render_jpeg_quality)
+            config["render_jpeg_subsampling"] = str(self.render_jpeg_subsampling)
+            config["render_png_compression"] = str(self.render_png_compression)
 
             config["fetched_folder"] = Util.collapseuser(self.fetched_folder)
             config["clipboard_enabled"] = str(self.clipboard_enabled)
@@ -801,6 +876,7 @@ class Options:
             config["min_rating"] = str(self.min_rating)
             config["name_regex_enabled"] = str(self.name_regex_enabled)
             config["name_regex"] = str(self.name_regex)
+            config["filter_workers"] = str(self.filter_workers)
 
             config["smart_notice_shown"] = str(self.smart_notice_shown)
             config["smart_register_shown"] = str(self.smart_register_shown)
@@ -19,79 +19,100 @@ import threading
 import cairo
 from PIL import Image
 
+from variety.ImageEncoders import get_output_encoder
 from variety.Util import Util
 
 # fmt: off
 import gi  # isort:skip
 gi.require_version("PangoCairo", "1.0")
-from gi.repository import Gdk, GdkPixbuf, GObject, Pango, PangoCairo  # isort:skip
+from gi.repository import Pango, PangoCairo  # isort:skip
 # fmt: on
 
 
 class QuoteWriter:
+    """
+    Draws quotes on images with Pango and Cairo. Everything here runs in the calling thread: the
+    images are plain Cairo image surfaces, and every thread lays out its text with its own Pango
+    font map, so no GTK objects are involved. The screen size, which needs GDK, is passed in by
+    the callers.
+    """
+
+    _thread_local = threading.local()
+
+    @staticmethod
+    def write_quote(quote, author, infile, outfile, options=None, screen_size=None):
+        """
+        Draws the quote on the image in infile, resized to cover the screen, and saves the result
+        to outfile in the format configured for rendered wallpapers (see get_output_encoder)
+        """
+        screen_size = screen_size or Util.get_primary_display_size(hidpi_scaled=True)
+        with Image.open(infile) as image:
+            image = image.convert("RGB")
+        w, h = image.size
+        scale = max(screen_size[0] / w, screen_size[1] / h)
+        image = image.resize((round(w * scale), round(h * scale)), Image.Resampling.LANCZOS)
+        image = QuoteWriter.write_quote_on_image(quote, author, image, options, screen_size)
+        _, save_params = get_output_encoder(options)
+        image.save(outfile, **save_params)
+
     @staticmethod
-    def write_quote(quote, author, infile, outfile, options=None):
-        done_event = threading.Event()
-        exception = [None]
-
-        def go():
-            try:
-                w, h = Util.get_scaled_size(infile)
-                surface = QuoteWriter.load_cairo_surface(infile, w, h)
-                QuoteWriter.write_quote_on_surface(surface, quote, author, options)
-                QuoteWriter.save_cairo_surface(surface, outfile)
-            except Exception as e:
-                exception[0] = e
-            finally:
-                done_event.set()
-
-        Util.add_mainloop_task(go)
-        done_event.wait()
-        if exception[0]:
-            raise exception[0]  # pylint: disable=raising-bad-type
+    def write_quote_on_image(quote, author, image, options=None, screen_size=None):
+        """
+        Draws the quote on a PIL image in RGB mode, without going through any files.
+        Returns the resulting image.
+        """
+        surface = QuoteWriter.image_to_cairo_surface(image)
+        QuoteWriter.write_quote_on_surface(surface, quote, author, options, screen_size=screen_size)
+        return QuoteWriter.cairo_surface_to_image(surface)
 
     @staticmethod
-    def load_cairo_surface(filename, w, h):
+    def create_layout(context):
+        """
+        Like PangoCairo.create_layout, but with a font map owned by the current thread, so that
+        layouts can be created outside of the GTK main loop
+        """
+        font_map = getattr(QuoteWriter._thread_local, "font_map", None)
+        if font_map is None:
+            font_map = PangoCairo.FontMap.new()
+            QuoteWriter._thread_local.font_map = font_map
+        pango_context = font_map.create_context()
+        PangoCairo.update_context(context, pango_context)
+        return Pango.Layout.new(pango_context)
+
+    @staticmethod
+    def image_to_cairo_surface(image):
+        # Cairo's RGB24 is 32 bits per pixel, native-endian, i.e. B, G, R, unused on little-endian
         # pylint: disable=no-member
-        pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(filename, w, h, False)
-        surface = cairo.ImageSurface(0, pixbuf.get_width(), pixbuf.get_height())
-        context = cairo.Context(surface)
-        Gdk.cairo_set_source_pixbuf(context, pixbuf, 0, 0)
-        context.paint()
-        return surface
+        w, h = image.size
+        stride = cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_RGB24, w)
+        data = bytearray(image.tobytes("raw", "BGRX", stride))
+        return cairo.ImageSurface.create_for_data(data, cairo.FORMAT_RGB24, w, h, stride)
 
     @staticmethod
-    def save_cairo_surface(surface, filename):
-        try:
-            # attempt faster method first
-            # the get_data() call will fail with Cairo version < 1.15.4-1 (e.g. on 16.04)
-            # https://bugs.debian.org/cgi-bin/bugreport.cgi?bug=809479
-            data = surface.get_data()
-            size = surface.get_width(), surface.get_height()
-            image = Image.frombuffer("RGBA", size, data.tobytes(), "raw", "BGRA", 0, 1).convert(
-                "RGB"
-            )
-            image.save(filename, quality=100)
-        except:
-            # fallback to slower method, but which works on 16.04
-            surface.write_to_png(filename)
+    def cairo_surface_to_image(surface):
+        surface.flush()
+        size = surface.get_width(), surface.get_height()
+        data = bytes(surface.get_data())
+        return Image.frombuffer("RGB", size, data, "raw", "BGRX", surface.get_stride(), 1)
 
     @staticmethod
-    def write_quote_on_surface(surface, quote, author=None, options=None, margin=30):
+    def write_quote_on_surface(
+        surface, quote, author=None, options=None, margin=30, screen_size=None
+    ):
         qcontext = cairo.Context(surface)  # pylint: disable=no-member
         acontext = cairo.Context(surface)  # pylint: disable=no-member
 
         iw = surface.get_width()
         ih = surface.get_height()
 
-        sw, sh = Util.get_primary_display_size(hidpi_scaled=True)
+        sw, sh = screen_size or Util.get_primary_display_size(hidpi_scaled=True)
         trimw, trimh = Util.compute_trimmed_offsets((iw, ih), (sw, sh))
 
         width = max(
             200, sw * options.quotes_width // 100
         )  # use quotes_width percent of the visible width
 
-        qlayout = PangoCairo.create_layout(qcontext)
+        qlayout = QuoteWriter.create_layout(qcontext)
         qlayout.set_width((width - 4 * margin) * Pango.SCALE)
         qlayout.set_alignment(Pango.Alignment.LEFT)
         qlayout.set_wrap(Pango.WrapMode.WORD)
@@ -106,7 +127,7 @@ class QuoteWriter:
         else:
             width = sw
 
-        alayout = PangoCairo.create_layout(acontext)
+        alayout = QuoteWriter.create_layout(acontext)
         aheight = 0
         if author:
             alayout.set_width(qwidth * Pango.SCALE)
@@ -160,9 +181,14 @@ class QuoteWriter:
 
 
 if __name__ == "__main__":
+    from variety.Options import Options
+
+    default_options = Options()
+    default_options.set_defaults()
     QuoteWriter.write_quote(
         '"I may be drunk, Miss, but in the morning I will be sober and you will still be ugly."',
         "Winston Churchill",
         "test.jpg",
-        "test_result.png",
+        "test_result" + get_output_encoder(default_options)[0],
+        default_options,
     )
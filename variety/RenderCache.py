@@ -0,0 +1,114 @@
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from variety.Util import Util
+
+logger = logging.getLogger("variety")
+
+
+class RenderCache:
+    """
+    Bounded on-disk cache of rendered images, e.g. source images with the display mode applied.
+    Every entry is a single file in the cache folder, named by the hash of its key. Keys must
+    capture everything the rendering depended on - typically the source path and mtime, and the
+    exact operations and target resolution.
+
+    Entries are evicted least recently used first (by file mtime, which is bumped on every hit)
+    when the total size goes over max_mb megabytes.
+    """
+
+    def __init__(self, folder, max_mb=200):
+        self.folder = folder
+        self.max_mb = max_mb
+        self.lock = threading.Lock()
+        Util.makedirs(folder)
+
+    @staticmethod
+    def _hash(key):
+        return hashlib.md5(repr(key).encode("utf-8", "surrogateescape")).hexdigest()
+
+    def _path(self, key, extension):
+        return os.path.join(self.folder, self._hash(key) + extension)
+
+    def contains_file(self, path):
+        return os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.folder)
+
+    def get(self, key, extension=".jpg"):
+        """Returns the path of the cached file, or None"""
+        if self.max_mb <= 0:
+            return None
+        path = self._path(key, extension)
+        with self.lock:
+            try:
+                os.utime(path)
+                return path
+            except OSError:
+                return None
+
+    def put(self, key, image, extension=".jpg", **save_params):
+        """Saves the PIL image as the entry for the key and returns its path"""
+        if self.max_mb <= 0:
+            return None
+        path = self._path(key, extension)
+        tmp = "%s.%s.tmp" % (path, Util.random_hash())
+        try:
+            image.save(tmp, **save_params)
+            with self.lock:
+                os.replace(tmp, path)
+                self._evict(keep=path)
+            return path
+        except Exception:
+            logger.exception(lambda: "Could not save %s to the render cache" % path)
+            Util.safe_unlink(tmp)
+            return None
+
+    def _evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if name.endswith(".tmp") and st.st_mtime > time.time() - 3600:
+                continue  # being written right now
+            entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(e[1] for e in entries)
+        max_bytes = self.max_mb * 1024 * 1024
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            if path == keep:
+                continue
+            logger.debug(lambda: "Evicting %s from the render cache" % path)
+            Util.safe_unlink(path)
+            total -= size
+
+    def set_max_mb(self, max_mb):
+        self.max_mb = max_mb
+        with self.lock:
+            self._evict()
+
+    def clear(self):
+        with self.lock:
+            for name in os.listdir(self.folder):
+                Util.safe_unlink(os.path.join(self.folder, name))
@@ -0,0 +1,115 @@
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+import logging
+import threading
+
+from variety.Util import Util
+
+logger = logging.getLogger("variety")
+
+
+class RenderScheduler:
+    """
+    Runs wallpaper renders one at a time in a single worker thread.
+
+    There is at most one pending request: requests that arrive while a render is in progress are
+    merged into it, so a burst of requests results in a single render. The merged request keeps
+    the lowest (i.e. most thorough) refresh level, and its file only changes for requests of the
+    same or a lower level, so e.g. a clock tick for the current wallpaper does not replace a
+    pending change to the next one - rendering that includes the clock anyway.
+
+    A request for another file, or for a lower refresh level of the same one, also cancels the
+    render in progress, as its result would be replaced right away. A request for another file at
+    a higher level than the render in progress is dropped: it is e.g. a clock tick still meant for
+    the wallpaper being replaced, and running it afterwards would bring that wallpaper back. render_fn is called as
+    render_fn(filename, refresh_level, cancelled) and should check the cancelled Event between
+    its stages.
+    """
+
+    def __init__(self, render_fn):
+        self.render_fn = render_fn
+        self.cond = threading.Condition()
+        # (filename, refresh_level)
+        self.pending = None
+        # (filename, refresh_level, cancelled Event)
+        self.in_flight = None
+        self.running = True
+        self.thread = Util.start_daemon(self._run)
+
+    @staticmethod
+    def merge(pending, request):
+        if pending is None:
+            return request
+        filename = request[0] if request[1] <= pending[1] else pending[0]
+        return filename, min(pending[1], request[1])
+
+    @staticmethod
+    def supersedes(request, in_flight):
+        filename, refresh_level = request
+        return refresh_level < in_flight[1] or (
+            refresh_level == in_flight[1] and filename != in_flight[0]
+        )
+
+    @staticmethod
+    def is_outdated(request, in_flight):
+        filename, refresh_level = request
+        return refresh_level > in_flight[1] and filename != in_flight[0]
+
+    def request(self, filename, refresh_level):
+        with self.cond:
+            if not self.running:
+                return
+            request = (filename, refresh_level)
+            if self.in_flight and self.is_outdated(request, self.in_flight):
+                logger.info(
+                    lambda: "Dropping the refresh of %s, %s is being rendered"
+                    % (filename, self.in_flight[0])
+                )
+                return
+            self.pending = self.merge(self.pending, request)
+            if self.in_flight and self.supersedes(request, self.in_flight):
+                logger.info(lambda: "Cancelling the render of %s" % self.in_flight[0])
+                self.in_flight[2].set()
+            self.cond.notify()
+
+    def stop(self):
+        """Drops the pending request and cancels the one in progress"""
+        with self.cond:
+            self.running = False
+            self.pending = None
+            if self.in_flight:
+                self.in_flight[2].set()
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and self.pending is None:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                filename, refresh_level = self.pending
+                self.pending = None
+                cancelled = threading.Event()
+                self.in_flight = (filename, refresh_level, cancelled)
+
+            try:
+                self.render_fn(filename, refresh_level, cancelled)
+            except Exception:
+                logger.exception(lambda: "Error while rendering %s" % filename)
+            finally:
+                with self.cond:
+                    self.in_flight = None
@@ -0,0 +1,130 @@
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+import collections
+import contextlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger("variety")
+
+
+class RenderTrace:
+    """
+    Timings of the stages of a single wallpaper change. Stages can be nested, e.g. decoding the
+    image happens within whichever stage first needs its pixels - the time of nested stages is
+    only counted for them, not for the enclosing stage.
+    """
+
+    def __init__(self, filename=None, refresh_level=None):
+        self.filename = filename
+        self.refresh_level = refresh_level
+        self.time = time.time()
+        self.start = time.perf_counter()
+        self.stages = collections.OrderedDict()
+        self._nested = []
+        # cancelled renders are not recorded, their timings would skew the stats
+        self.cancelled = False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        self._nested.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed - nested
+
+    def to_dict(self):
+        return {
+            "time": round(self.time, 3),
+            "file": self.filename,
+            "refresh_level": self.refresh_level,
+            "total": round(time.perf_counter() - self.start, 4),
+            "stages": {name: round(seconds, 4) for name, seconds in self.stages.items()},
+        }
+
+
+class RenderStats:
+    """
+    Keeps the traces of the last max_traces wallpaper changes in memory for --render-stats,
+    and appends every trace as a JSON line to log_file, for collecting them across machines.
+    The log file is rotated to log_file.1 when it grows over max_log_bytes.
+    """
+
+    def __init__(self, log_file, max_traces=500, max_log_bytes=5 * 1024 * 1024):
+        self.log_file = log_file
+        self.max_log_bytes = max_log_bytes
+        self.traces = collections.deque(maxlen=max_traces)
+        self.lock = threading.Lock()
+
+    def add(self, trace):
+        if not trace.stages or trace.cancelled:
+            return
+        data = trace.to_dict()
+        logger.info(lambda: "Wallpaper change timings: %s" % data)
+        with self.lock:
+            self.traces.append(data)
+            try:
+                if os.path.getsize(self.log_file) > self.max_log_bytes:
+                    os.replace(self.log_file, self.log_file + ".1")
+            except OSError:
+                pass
+            try:
+                with open(self.log_file, "a", encoding="utf8") as f:
+                    f.write(json.dumps(data, ensure_ascii=False) + "\n")
+            except Exception:
+                logger.exception(lambda: "Could not write render stats to %s" % self.log_file)
+
+    @staticmethod
+    def _percentile(sorted_values, percent):
+        # nearest-rank method
+        rank = math.ceil(percent / 100.0 * len(sorted_values))
+        return sorted_values[max(0, rank - 1)]
+
+    def get_summary(self):
+        """
+        Returns the number of recorded changes and the count, p50, p95 and max duration in
+        milliseconds of every stage, and of the changes in total, over the recent traces
+        """
+        with self.lock:
+            traces = list(self.traces)
+
+        durations = collections.OrderedDict()
+        for trace in traces:
+            for name, seconds in trace["stages"].items():
+                durations.setdefault(name, []).append(seconds)
+        durations["total"] = [trace["total"] for trace in traces]
+
+        stages = collections.OrderedDict()
+        for name, values in durations.items():
+            if not values:
+                continue
+            values.sort()
+            stages[name] = {
+                "count": len(values),
+                "p50_ms": round(self._percentile(values, 50) * 1000, 1),
+                "p95_ms": round(self._percentile(values, 95) * 1000, 1),
+                "max_ms": round(values[-1] * 1000, 1),
+            }
+        return {"changes": len(traces), "stages": stages}
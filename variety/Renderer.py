@@ -0,0 +1,967 @@
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+import collections
+import concurrent.futures
+import functools
+import io
+import logging
+import os
+import random
+import re
+import shlex
+import shutil
+import subprocess
+import threading
+import time
+
+from PIL import Image, ImageColor, ImageDraw, ImageFilter, ImageFont, ImageOps
+
+from variety.ImageEncoders import INTERMEDIATE_EXTENSION, INTERMEDIATE_PARAMS, get_output_encoder
+from variety.plugins.IDisplayModesPlugin import DisplayModeData
+from variety.QuoteWriter import QuoteWriter
+from variety.RenderStats import RenderTrace
+from variety.Util import Util
+
+logger = logging.getLogger("variety")
+
+EXIF_ORIENTATION = 0x0112
+
+# EXIF orientations that swap the width and height of the image
+TRANSPOSING_ORIENTATIONS = (5, 6, 7, 8)
+
+# Options that affect rendering, besides all quotes_, clock_ and render_ ones
+RENDERING_OPTIONS = ("filters", "wallpaper_auto_rotate", "wallpaper_display_mode")
+
+Staged = collections.namedtuple("Staged", "key image display_mode_param filtered file")
+
+# PIL text anchor and position of the anchor point for every ImageMagick gravity,
+# as functions of the image size and the annotation offsets
+_GRAVITIES = {
+    "northwest": ("la", lambda w, h, x, y: (x, y)),
+    "north": ("ma", lambda w, h, x, y: (w // 2 + x, y)),
+    "northeast": ("ra", lambda w, h, x, y: (w - x, y)),
+    "west": ("lm", lambda w, h, x, y: (x, h // 2 + y)),
+    "center": ("mm", lambda w, h, x, y: (w // 2 + x, h // 2 + y)),
+    "east": ("rm", lambda w, h, x, y: (w - x, h // 2 + y)),
+    "southwest": ("ld", lambda w, h, x, y: (x, h - y)),
+    "south": ("md", lambda w, h, x, y: (w // 2 + x, h - y)),
+    "southeast": ("rd", lambda w, h, x, y: (w - x, h - y)),
+    # without a gravity ImageMagick places the text baseline at the offset
+    "undefined": ("ls", lambda w, h, x, y: (x, y)),
+}
+
+# annotation offsets, either fixed or relative to the trimmed image offsets, e.g. +[%HOFFSET+60]
+_COORDINATE = r"([+-])(?:(\d+)|\[%{}\+(\d+)\])"
+_ANNOTATE_GEOMETRY = re.compile(
+    r"^(?:0x0|0)?" + _COORDINATE.format("HOFFSET") + _COORDINATE.format("VOFFSET") + "$"
+)
+_OFFSET_PLACEHOLDER = re.compile(r"\[%(HOFFSET|VOFFSET)\+(\d+)\]")
+
+CompiledFilter = collections.namedtuple("CompiledFilter", "ops args")
+
+
+def cover_size(size, screen_size):
+    """The size to which an image is scaled so that it fully covers the screen, keeping its ratio"""
+    iw, ih = size
+    sw, sh = screen_size
+    if float(sw) / sh > float(iw) / ih:
+        return sw, max(1, int(round(ih * float(sw) / iw)))
+    else:
+        return max(1, int(round(iw * float(sh) / ih))), sh
+
+
+def fit_size(size, screen_size):
+    """The size to which an image is scaled so that it fully fits within the screen"""
+    iw, ih = size
+    sw, sh = screen_size
+    scale = min(float(sw) / iw, float(sh) / ih)
+    return max(1, int(round(iw * scale))), max(1, int(round(ih * scale)))
+
+
+def resize(image, size):
+    if image.size == tuple(size):
+        return image
+    return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def _zoom(image, w, h):
+    # ImageMagick's -scale WxH^ - the image covers the screen, cropping is left to the OS
+    return resize(image, cover_size(image.size, (w, h)))
+
+
+def _fit_with_black(image, w, h):
+    fitted = resize(image, fit_size(image.size, (w, h)))
+    canvas = Image.new("RGB", (w, h))
+    canvas.paste(fitted, ((w - fitted.width) // 2, (h - fitted.height) // 2))
+    return canvas
+
+
+def _fit_with_blur(image, w, h):
+    # the background is the image zoomed and cropped to the screen, at 10% scale, blurred
+    iw, ih = image.size
+    scale = max(float(w) / iw, float(h) / ih)
+    cw, ch = w / scale, h / scale
+    box = ((iw - cw) / 2, (ih - ch) / 2, (iw + cw) / 2, (ih + ch) / 2)
+    small = image.resize(
+        (max(1, w // 10), max(1, h // 10)), Image.Resampling.BILINEAR, box=box, reducing_gap=3.0
+    )
+    canvas = small.filter(ImageFilter.GaussianBlur(3)).resize((w, h), Image.Resampling.BILINEAR)
+
+    fitted = resize(image, fit_size(image.size, (w, h)))
+    canvas.paste(fitted, ((w - fitted.width) // 2, (h - fitted.height) // 2))
+    return canvas
+
+
+def _tile(image, w, h):
+    canvas = Image.new("RGB", (w, h))
+    for x in range(0, w, image.width):
+        for y in range(0, h, image.height):
+            canvas.paste(image, (x, y))
+    return canvas
+
+
+def _cover_crop(image, w, h):
+    image = resize(image, cover_size(image.size, (w, h)))
+    left, top = (image.width - w) // 2, (image.height - h) // 2
+    return image.crop((left, top, left + w, top + h))
+
+
+def _fit_to_monitor(image, w, h):
+    """Like the smart display mode, but for a single monitor and cropping instead of the OS"""
+    if image.width * image.height * 10 < w * h:
+        return _tile(image, w, h)
+    image_ratio = image.width / image.height
+    monitor_ratio = w / h
+    if 2 * abs(image_ratio - monitor_ratio) / (image_ratio + monitor_ratio) < 0.2:
+        return _cover_crop(image, w, h)
+    return _fit_with_blur(image, w, h)
+
+
+# PIL releases the GIL while resizing, so monitors are really rendered in parallel
+_MONITOR_POOL = concurrent.futures.ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix="render_monitor"
+)
+
+
+def render_per_monitor(image, canvas_size, rects):
+    """
+    Renders the image fitted to each of the (x, y, w, h) monitor rectangles concurrently,
+    and stitches the results into one canvas, to be set as a spanned wallpaper
+    """
+    image.load()
+    canvas = Image.new("RGB", canvas_size)
+    parts = _MONITOR_POOL.map(lambda rect: _fit_to_monitor(image, rect[2], rect[3]), rects)
+    for rect, part in zip(rects, parts):
+        canvas.paste(part, rect[:2])
+    return canvas
+
+
+def _per_monitor(image, w, h):
+    canvas_size, rects, _ = Util.get_monitor_layout()
+    return render_per_monitor(image, canvas_size, rects)
+
+
+NATIVE_OPS = {
+    "zoom": _zoom,
+    "fit-with-black": _fit_with_black,
+    "fit-with-blur": _fit_with_blur,
+    "tile": _tile,
+    "per-monitor": _per_monitor,
+}
+
+
+def _percent_resize(method, percent):
+    def op(image):
+        size = tuple(max(1, int(round(d * percent / 100.0))) for d in image.size)
+        if method == "scale":
+            # ImageMagick's -scale averages pixels when shrinking and replicates them when enlarging
+            resample = Image.Resampling.BOX if size[0] < image.width else Image.Resampling.NEAREST
+        elif method == "sample":
+            resample = Image.Resampling.NEAREST
+        else:
+            resample = Image.Resampling.LANCZOS
+        return image.resize(size, resample)
+
+    return op
+
+
+def translate_filter(filter_str):
+    """
+    Translates an ImageMagick filter into a list of functions over PIL images.
+    Only the operations used by the stock filters and a few other simple ones are supported,
+    returns None if the filter uses anything else, so that it is run through ImageMagick.
+    """
+    try:
+        args = shlex.split(filter_str)
+    except ValueError:
+        return None
+
+    ops = []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        value = args[i + 1] if i + 1 < len(args) else None
+        if arg == "-type" and value and value.lower() == "grayscale":
+            ops.append(lambda im: im.convert("L").convert("RGB"))
+            i += 2
+        elif arg == "-colorspace" and value and value.lower() == "gray":
+            ops.append(lambda im: im.convert("L").convert("RGB"))
+            i += 2
+        elif (
+            arg in ("-scale", "-resize", "-sample") and value and re.match(r"^\d+(\.\d+)?%$", value)
+        ):
+            ops.append(_percent_resize(arg[1:], float(value[:-1])))
+            i += 2
+        elif arg == "-blur" and value and re.match(r"^\d+(\.\d+)?x\d+(\.\d+)?$", value):
+            sigma = float(value.split("x")[1])
+            ops.append(lambda im, sigma=sigma: im.filter(ImageFilter.GaussianBlur(sigma)))
+            i += 2
+        elif arg == "-negate":
+            ops.append(ImageOps.invert)
+            i += 1
+        elif arg == "-flip":
+            ops.append(ImageOps.flip)
+            i += 1
+        elif arg == "-flop":
+            ops.append(ImageOps.mirror)
+            i += 1
+        else:
+            return None
+    return ops
+
+
+@functools.lru_cache(maxsize=64)
+def compile_filter(filter_str):
+    """
+    Compiles a filter once: into PIL operations when possible (see translate_filter), otherwise
+    into ImageMagick arguments, in which only %FILEPATH% and %FILENAME% remain to be replaced.
+    Raises ValueError if the filter cannot be parsed.
+    """
+    ops = translate_filter(filter_str)
+    if ops is not None:
+        return CompiledFilter(tuple(ops), None)
+    return CompiledFilter(None, tuple(shlex.split(filter_str)))
+
+
+def _parse_coordinate(sign, value, offset_value):
+    """Returns (sign, value, whether the trimmed image offset is to be added to the value)"""
+    if offset_value is not None:
+        return (-1 if sign == "-" else 1), int(offset_value), True
+    return (-1 if sign == "-" else 1), int(value), False
+
+
+def _coordinate(coordinate, offset):
+    sign, value, relative = coordinate
+    return sign * (value + offset if relative else value)
+
+
+class ClockFilter:
+    """
+    A clock filter with its fonts already replaced, parsed once. Rendering it only substitutes the
+    time and the trimmed image offsets, either into the text annotations it was translated to, or
+    into its ImageMagick arguments if it could not be translated.
+    """
+
+    def __init__(self, clock_filter):
+        self.args = shlex.split(clock_filter)  # raises ValueError
+        self.annotations = self._translate(self.args)
+
+    @staticmethod
+    def _translate(args):
+        """
+        Translates the filter into text annotations: (font file, font size in pixels, gravity,
+        fill color, x, y, text) tuples, with x and y as returned by _parse_coordinate and the text
+        still to be passed through strftime. Supports -density, -font, -pointsize, -gravity, -fill
+        and -annotate without rotation, which is what the stock clock filter uses.
+        Returns None if the filter uses anything else.
+        """
+        density = 72.0
+        font = None
+        pointsize = 12.0
+        gravity = "undefined"
+        fill = "black"
+        annotations = []
+        i = 0
+        try:
+            while i < len(args):
+                arg, value = args[i], args[i + 1]
+                if arg == "-density":
+                    density = float(value.split("x")[0])
+                elif arg == "-font":
+                    font = value
+                elif arg == "-pointsize":
+                    pointsize = float(value)
+                elif arg == "-gravity":
+                    gravity = value.lower()
+                    if gravity not in _GRAVITIES:
+                        return None
+                elif arg == "-fill":
+                    fill = value
+                elif arg == "-annotate":
+                    m = _ANNOTATE_GEOMETRY.match(value)
+                    text = args[i + 2]
+                    if not m or not font or not os.path.isfile(font) or "\\" in text:
+                        return None
+                    size = int(round(pointsize * density / 72.0))
+                    # make sure PIL can handle the font and the color, these raise otherwise
+                    _load_font(font, size)
+                    ImageColor.getrgb(fill)
+                    x = _parse_coordinate(*m.group(1, 2, 3))
+                    y = _parse_coordinate(*m.group(4, 5, 6))
+                    annotations.append((font, size, gravity, fill, x, y, text))
+                    i += 1
+                else:
+                    return None
+                i += 2
+        except (IndexError, ValueError, OSError):
+            return None
+        return annotations
+
+    def get_annotations(self, hoffset, voffset, now):
+        """
+        Returns the annotations to draw at the given time (a time.struct_time), or None if the
+        filter has to run through ImageMagick
+        """
+        if self.annotations is None:
+            return None
+        result = []
+        for font, size, gravity, fill, x, y, text in self.annotations:
+            text = time.strftime(text, now)
+            if "%" in text:
+                return None  # an ImageMagick escape, e.g. %[EXIF:*]
+            x, y = _coordinate(x, hoffset), _coordinate(y, voffset)
+            result.append((font, size, gravity, fill, x, y, text))
+        return result
+
+    def get_args(self, hoffset, voffset, now):
+        """Returns the ImageMagick arguments to run at the given time"""
+
+        def replace_offset(m):
+            return str((hoffset if m.group(1) == "HOFFSET" else voffset) + int(m.group(2)))
+
+        return [
+            time.strftime(_OFFSET_PLACEHOLDER.sub(replace_offset, arg), now) for arg in self.args
+        ]
+
+
+@functools.lru_cache(maxsize=32)
+def _load_font(font_file, size):
+    return ImageFont.truetype(font_file, size)
+
+
+def draw_annotations(image, annotations):
+    """
+    Draws the annotations on a copy of the image and returns it. Each annotation is drawn on a
+    transparent overlay covering just its text which is then composited on the image, so that
+    semi-transparent fills blend with what is below, like in ImageMagick.
+    """
+    image = image.copy()
+    w, h = image.size
+    measure = ImageDraw.Draw(image)
+    for font_file, size, gravity, fill, x, y, text in annotations:
+        anchor, position = _GRAVITIES[gravity]
+        font = _load_font(font_file, size)
+        px, py = position(w, h, x, y)
+        left, top, right, bottom = measure.textbbox((px, py), text, font=font, anchor=anchor)
+        box = (
+            max(0, int(left)),
+            max(0, int(top)),
+            min(w, int(right) + 1),
+            min(h, int(bottom) + 1),
+        )
+        if box[2] <= box[0] or box[3] <= box[1]:
+            continue
+        region = image.crop(box).convert("RGBA")
+        overlay = Image.new("RGBA", region.size, (0, 0, 0, 0))
+        ImageDraw.Draw(overlay).text(
+            (px - box[0], py - box[1]), text, fill=fill, font=font, anchor=anchor
+        )
+        region.alpha_composite(overlay)
+        image.paste(region.convert("RGB"), box[:2])
+    return image
+
+
+def _draw_in_rect(image, rect, draw):
+    """
+    Applies draw, a function taking and returning an image, to the (x, y, w, h) rectangle of the
+    image, or to the whole image if rect is None. Returns the result, leaving the image unchanged.
+    """
+    if rect is None:
+        return draw(image)
+    x, y, w, h = rect
+    result = image.copy()
+    result.paste(draw(image.crop((x, y, x + w, y + h))), (x, y))
+    return result
+
+
+class RenderCancelled(Exception):
+    """Raised when a render is superseded by a newer request before it is done"""
+
+
+def _check_cancelled(cancelled):
+    if cancelled is not None and cancelled.is_set():
+        raise RenderCancelled()
+
+
+class _Frame:
+    """
+    The image being rendered. Starts as a path to a file and is only decoded once some stage needs
+    its pixels - at a reduced size when that is all that is needed.
+    """
+
+    def __init__(self, path, auto_rotate, image=None, trace=None):
+        self.path = path
+        self.image = None
+        self.trace = trace or RenderTrace()
+        if image is not None:
+            self.orientation = 1
+            self.set(image)
+            return
+        with Image.open(path) as image:
+            self.orientation = image.getexif().get(EXIF_ORIENTATION, 1) if auto_rotate else 1
+            w, h = image.size
+        self.size = (h, w) if self.orientation in TRANSPOSING_ORIENTATIONS else (w, h)
+
+    @property
+    def modified(self):
+        return self.image is not None or self.orientation != 1
+
+    def get(self, min_size=None):
+        """
+        Returns the frame as an RGB PIL image. min_size is a hint that the caller will scale the
+        image down to at least that size anyway, so JPEGs may be decoded at a reduced scale.
+        """
+        if self.image is None:
+            with self.trace.stage("decode"), Image.open(self.path) as image:
+                if min_size:
+                    if self.orientation in TRANSPOSING_ORIENTATIONS:
+                        min_size = min_size[::-1]
+                    image.draft("RGB", min_size)
+                image.load()
+                if self.orientation != 1:
+                    with self.trace.stage("auto_rotate"):
+                        image = ImageOps.exif_transpose(image)
+                self.set(image.convert("RGB"))
+        return self.image
+
+    def set(self, image):
+        self.image = image
+        self.size = image.size
+
+
+class Renderer:
+    """
+    Renders the image that do_set_wp sets as wallpaper: auto-rotation, filters, display mode,
+    quote and clock. The source file is decoded at most once, and only if some of these actually
+    changes its pixels, then all of them work on the same in-memory image, which is encoded once.
+
+    Filters and clock filters that cannot be translated to PIL operations and display modes without
+    a native equivalent run through ImageMagick, piping the image in and out instead of going
+    through intermediate files.
+    """
+
+    def __init__(self, parent, render_cache):
+        self.parent = parent
+        self.render_cache = render_cache
+        # (source file, filtered image or None) - quote and clock refreshes reuse the last filter
+        self.filtered = None
+        # (key, image, display mode param) - the last frame rendered up to the clock, so clock
+        # refreshes only have to draw the time on it
+        self.base_frame = None
+        # the pre-rendered likely next wallpaper, see prerender
+        self.staged = None
+        self.staging_lock = threading.RLock()
+        # (options it was compiled for, ClockFilter)
+        self.clock_filter = None
+        self.compile_lock = threading.Lock()
+
+    def render(self, filename, refresh_level, apply_effects, trace=None, cancelled=None):
+        """
+        Returns the file to set as wallpaper and the display mode parameter for the set_wallpaper
+        script. The returned file is the original one when nothing needed to be changed.
+        The time taken by each stage is recorded in trace, a RenderTrace.
+        Raises RenderCancelled if the cancelled Event gets set before the image is saved.
+        """
+        trace = trace or RenderTrace()
+        _check_cancelled(cancelled)
+        options = self.parent.options
+        clock_enabled = bool(
+            apply_effects and options.clock_enabled and options.clock_filter.strip()
+        )
+        if (
+            refresh_level == self.parent.RefreshLevel.CLOCK_ONLY
+            and clock_enabled
+            and self.base_frame
+            and self.base_frame[0] == self.get_base_frame_key(filename)
+        ):
+            # just the time changed, draw it on the frame that was rendered up to the clock
+            _, image, display_mode_param = self.base_frame
+            frame = _Frame(filename, False, image=image, trace=trace)
+            with trace.stage("clock"):
+                self.apply_clock(frame)
+            with trace.stage("encode"):
+                return self.save(frame, filename, display_mode_param)
+
+        if refresh_level == self.parent.RefreshLevel.ALL and apply_effects:
+            staged = self.take_staged(filename)
+            if staged:
+                logger.info(lambda: "Using the pre-rendered %s" % filename)
+                self.filtered = (filename, staged.filtered)
+                self.base_frame = None
+                if staged.file:
+                    with trace.stage("encode"):
+                        return self.publish_staged_file(staged), staged.display_mode_param
+                frame = _Frame(filename, False, image=staged.image, trace=trace)
+                return self.finish(
+                    frame, filename, staged.display_mode_param, clock_enabled, cancelled=cancelled
+                )
+
+        try:
+            frame = _Frame(filename, options.wallpaper_auto_rotate, trace=trace)
+        except Exception:
+            logger.exception(lambda: "Could not open %s for rendering" % filename)
+            self.base_frame = None
+            return filename, self.get_display_mode_param(filename)
+
+        if apply_effects:
+            with trace.stage("filter"):
+                self.apply_filters(frame, filename, refresh_level)
+
+        _check_cancelled(cancelled)
+        with trace.stage("display_mode"):
+            frame, display_mode_param = self.apply_display_mode(frame)
+
+        return self.finish(
+            frame,
+            filename,
+            display_mode_param,
+            clock_enabled,
+            apply_quote=apply_effects,
+            cancelled=cancelled,
+        )
+
+    def finish(
+        self, frame, filename, display_mode_param, clock_enabled, apply_quote=True, cancelled=None
+    ):
+        """Draws the quote and the clock on the frame and saves it"""
+        self.base_frame = None
+        trace = frame.trace
+        _check_cancelled(cancelled)
+        if apply_quote:
+            with trace.stage("quote"):
+                self.apply_quote(frame)
+
+        if clock_enabled:
+            with trace.stage("clock"):
+                try:
+                    size, _ = self.get_screen_layout()
+                    frame.set(resize(frame.get(size), cover_size(frame.size, size)))
+                    base_frame_key = self.get_base_frame_key(filename)
+                    self.base_frame = (base_frame_key, frame.get(), display_mode_param)
+                except Exception:
+                    logger.exception(lambda: "Could not prepare the frame for the clock:")
+                self.apply_clock(frame)
+
+        _check_cancelled(cancelled)
+        with trace.stage("encode"):
+            return self.save(frame, filename, display_mode_param)
+
+    def get_staging_key(self, filename):
+        """
+        Pre-rendered images are only used for the same file, unchanged, with the same screen
+        geometry and the same rendering options.
+        """
+        options = self.parent.options
+        rendering_options = sorted(
+            (k, repr(v))
+            for k, v in vars(options).items()
+            if k in RENDERING_OPTIONS or k.startswith(("quotes_", "clock_", "render_"))
+        )
+        return self.get_base_frame_key(filename), rendering_options
+
+    def prerender(self, filename):
+        """
+        Renders the image up to the quote (which is only chosen when the wallpaper changes) and
+        keeps the result, so that setting the image as wallpaper later takes just the quote and
+        clock drawing, or nothing at all when these are disabled.
+        """
+        key = self.get_staging_key(filename)
+        with self.staging_lock:
+            if self.staged and self.staged.key == key:
+                return
+
+        options = self.parent.options
+        texts_enabled = options.quotes_enabled or (
+            options.clock_enabled and options.clock_filter.strip()
+        )
+        logger.info(lambda: "Pre-rendering %s" % filename)
+
+        frame = _Frame(filename, options.wallpaper_auto_rotate)
+        filtered = self.filter_image(frame, filename) if self.parent.filters else None
+        frame, display_mode_param = self.apply_display_mode(frame)
+
+        staged_file = None
+        image = None
+        if texts_enabled:
+            size, _ = self.get_screen_layout()
+            image = resize(frame.get(size), cover_size(frame.size, size))
+        elif frame.modified:
+            extension, save_params = get_output_encoder(options)
+            staged_file = os.path.join(
+                self.parent.wallpaper_folder,
+                "staged-wallpaper-%s%s" % (Util.random_hash(), extension),
+            )
+            frame.get().save(staged_file, **save_params)
+        else:
+            return  # nothing to do, the file will be set as it is
+
+        with self.staging_lock:
+            self.discard_staged()
+            self.staged = Staged(key, image, display_mode_param, filtered, staged_file)
+
+    def take_staged(self, filename):
+        """Returns the pre-rendered filename, if there is one and it is still valid"""
+        with self.staging_lock:
+            staged = self.staged
+            if not staged or staged.key[0][0] != filename:
+                return None
+            if staged.key != self.get_staging_key(filename):
+                logger.info(lambda: "Pre-rendered %s is outdated" % filename)
+                self.discard_staged()
+                return None
+            self.staged = None
+            return staged
+
+    def discard_staged(self):
+        with self.staging_lock:
+            if self.staged and self.staged.file:
+                Util.safe_unlink(self.staged.file)
+            self.staged = None
+
+    def publish_staged_file(self, staged):
+        target_file = self.get_rendered_path(os.path.splitext(staged.file)[1])
+        os.replace(staged.file, target_file)
+        return target_file
+
+    def get_rendered_path(self, extension):
+        return os.path.join(
+            self.parent.wallpaper_folder,
+            "wallpaper-rendered-%s%s" % (Util.random_hash(), extension),
+        )
+
+    @staticmethod
+    def get_screen_key(mode):
+        """The screen geometry that renders in the given display mode depend on"""
+        return (
+            Util.get_primary_display_size(),
+            # per-monitor renders depend on the whole arrangement of the monitors
+            Util.get_monitor_layout() if mode and mode.per_monitor else None,
+        )
+
+    def get_base_frame_key(self, filename):
+        """The base frame is reused only for the same file, unchanged, and the same screen"""
+        try:
+            mtime = os.path.getmtime(filename)
+        except OSError:
+            mtime = None
+        return filename, mtime, self.get_screen_key(self.get_display_mode())
+
+    def save(self, frame, filename, display_mode_param):
+        if not frame.modified and not self.render_cache.contains_file(frame.path):
+            return frame.path, display_mode_param
+
+        try:
+            if not frame.modified:
+                # a cached render, link it so that it is unaffected by cache evictions
+                target_file = self.get_rendered_path(os.path.splitext(frame.path)[1])
+                try:
+                    os.link(frame.path, target_file)
+                except OSError:
+                    shutil.copyfile(frame.path, target_file)
+                return target_file, display_mode_param
+
+            extension, save_params = get_output_encoder(self.parent.options)
+            target_file = self.get_rendered_path(extension)
+            frame.get().save(target_file, **save_params)
+            return target_file, display_mode_param
+        except Exception:
+            logger.exception(lambda: "Could not save rendered wallpaper:")
+            return filename, display_mode_param
+
+    def run_imagemagick(self, image, args):
+        """
+        Runs the ImageMagick arguments over the image, which is piped in and out in memory.
+        Returns the result, or None if ImageMagick failed.
+        """
+        cmd = [self.parent.get_magick_cmd(), "ppm:-", *args, "ppm:-"]
+        logger.info(lambda: f"ImageMagick args: {cmd}")
+        buffer = io.BytesIO()
+        image.save(buffer, "PPM")
+        result = subprocess.run(cmd, input=buffer.getvalue(), stdout=subprocess.PIPE, check=False)
+        if result.returncode != 0:
+            logger.warning(
+                lambda: "Could not execute magick command. Missing ImageMagick or bad filter "
+                f"defined? Exit code: {result.returncode}"
+            )
+            return None
+        return Image.open(io.BytesIO(result.stdout)).convert("RGB")
+
+    def apply_filters(self, frame, filename, refresh_level):
+        try:
+            if not self.parent.filters:
+                return
+
+            # don't run the filter again when the refresh level is clock or quotes only,
+            # use the previous filtered image otherwise
+            refresh_levels = self.parent.RefreshLevel
+            if (
+                refresh_level not in [refresh_levels.ALL, refresh_levels.FILTERS_AND_TEXTS]
+                and self.filtered
+                and self.filtered[0] == filename
+            ):
+                if self.filtered[1] is not None:
+                    frame.set(self.filtered[1])
+                return
+
+            self.filtered = (filename, self.filter_image(frame, filename))
+        except Exception:
+            logger.exception(lambda: "Could not apply filters:")
+
+    def filter_image(self, frame, filename):
+        """Applies a random one of the enabled filters to the frame, returns the filtered image"""
+        filter_str = random.choice(self.parent.filters).strip()
+        if not filter_str:
+            return None
+
+        logger.info(lambda: f"Applying filter: {filter_str}")
+        compiled = compile_filter(filter_str)
+        size, _ = self.get_screen_layout()
+        image = resize(frame.get(size), cover_size(frame.size, size))
+        if compiled.ops is not None:
+            for op in compiled.ops:
+                image = op(image)
+        else:
+            args = [
+                arg.replace("%FILEPATH%", filename).replace(
+                    "%FILENAME%", os.path.basename(filename)
+                )
+                for arg in compiled.args
+            ]
+            image = self.run_imagemagick(image, args)
+            if image is None:
+                return None
+
+        frame.set(image)
+        return image
+
+    def get_display_mode(self):
+        modes = [
+            x
+            for x in self.parent.get_display_modes()
+            if x.id == self.parent.options.wallpaper_display_mode
+        ]
+        return modes[0] if modes else None
+
+    def get_screen_layout(self):
+        """
+        Returns the size rendered images are to cover and the (x, y, w, h) rectangle of them where
+        the quote and the clock go, None meaning the whole image. Normally this is the size of the
+        primary monitor, for per-monitor display modes it is a canvas spanning all monitors.
+        """
+        mode = self.get_display_mode()
+        if mode and mode.per_monitor:
+            canvas_size, rects, primary = Util.get_monitor_layout()
+            if len(rects) > 1:
+                return canvas_size, rects[primary]
+        return Util.get_primary_display_size(), None
+
+    def get_display_mode_param(self, filename):
+        try:
+            mode = self.get_display_mode()
+            return mode.fn(filename).set_wallpaper_param if mode else "os"
+        except Exception:
+            logger.exception(lambda: "Could not apply display mode logic:")
+            return "os"
+
+    def apply_display_mode(self, frame):
+        """
+        Returns the frame to continue with and the display mode parameter. When the source file
+        was not decoded yet (e.g. no filters were applied), the result is looked up in and saved
+        to the render cache.
+        """
+        try:
+            mode = self.get_display_mode()
+            if not mode:
+                return frame, "os"
+
+            if mode.size_fn:
+                mode_data: DisplayModeData = mode.size_fn(*frame.size)
+            elif frame.modified:
+                # the mode needs a file with the image as it is now
+                path = os.path.join(
+                    self.parent.wallpaper_folder,
+                    "wallpaper-rendering-%s%s" % (Util.random_hash(), INTERMEDIATE_EXTENSION),
+                )
+                frame.get().save(path, **INTERMEDIATE_PARAMS)
+                mode_data = mode.fn(path)
+            else:
+                mode_data = mode.fn(frame.path)
+
+            if mode_data.fixed_image_path:
+                fixed_frame = _Frame(mode_data.fixed_image_path, False, trace=frame.trace)
+                return fixed_frame, mode_data.set_wallpaper_param
+
+            if frame.image is not None:
+                return self.apply_display_mode_data(frame, mode_data)
+
+            extension, save_params = get_output_encoder(self.parent.options)
+            key = self.get_render_cache_key(frame, mode, mode_data, save_params)
+            cached = self.render_cache.get(key, extension)
+            if cached:
+                logger.info(lambda: "Using cached render %s of %s" % (cached, frame.path))
+                cached_frame = _Frame(cached, False, trace=frame.trace)
+                if mode_data.native_op or mode_data.imagemagick_cmd:
+                    return cached_frame, self.get_processed_param(mode_data)
+                return cached_frame, mode_data.set_wallpaper_param
+
+            frame, param = self.apply_display_mode_data(frame, mode_data)
+            if frame.image is not None:
+                self.render_cache.put(key, frame.image, extension, **save_params)
+            return frame, param
+        except Exception:
+            logger.exception(lambda: "Could not apply display mode logic:")
+            return frame, "os"
+
+    def apply_display_mode_data(self, frame, mode_data):
+        if mode_data.native_op and mode_data.native_op[0] in NATIVE_OPS:
+            op, w, h = mode_data.native_op
+            logger.info(lambda: f"Display mode operation: {op} {w}x{h}")
+            frame.set(NATIVE_OPS[op](frame.get((w, h)), w, h))
+            return frame, self.get_processed_param(mode_data)
+
+        if mode_data.imagemagick_cmd:
+            image = self.run_imagemagick(frame.get(), shlex.split(mode_data.imagemagick_cmd))
+            if image is not None:
+                frame.set(image)
+            return frame, "os"
+
+        return frame, mode_data.set_wallpaper_param
+
+    @staticmethod
+    def get_processed_param(mode_data):
+        """
+        The set_wallpaper parameter for images already resized for the screen: per-monitor
+        canvases must be spanned over all monitors, the rest are left to the OS setting
+        """
+        if mode_data.native_op and mode_data.native_op[0] == "per-monitor":
+            return "spanned"
+        return "os"
+
+    def get_render_cache_key(self, frame, mode, mode_data, save_params):
+        st = os.stat(frame.path)
+        return (
+            frame.path,
+            st.st_mtime,
+            st.st_size,
+            frame.orientation,
+            mode.id,
+            self.get_screen_key(mode),
+            mode_data.native_op,
+            mode_data.imagemagick_cmd,
+            sorted(save_params.items()),
+        )
+
+    def apply_quote(self, frame):
+        try:
+            quote = self.parent.quote
+            if self.parent.options.quotes_enabled and quote:
+                size, rect = self.get_screen_layout()
+                image = resize(frame.get(size), cover_size(frame.size, size))
+                frame.set(
+                    _draw_in_rect(
+                        image,
+                        rect,
+                        lambda region: QuoteWriter.write_quote_on_image(
+                            quote["quote"],
+                            quote.get("author", None),
+                            region,
+                            self.parent.options,
+                            screen_size=rect[2:] if rect else size,
+                        ),
+                    )
+                )
+        except Exception:
+            logger.exception(lambda: "Could not apply quote:")
+
+    def get_clock_filter(self):
+        """Returns the ClockFilter for the current options, compiling it when they change"""
+        options = self.parent.options
+        key = (options.clock_filter, options.clock_font, options.clock_date_font)
+        with self.compile_lock:
+            if not self.clock_filter or self.clock_filter[0] != key:
+                clock_filter = self.parent.replace_clock_filter_fonts(options.clock_filter)
+                self.clock_filter = (key, ClockFilter(clock_filter))
+            return self.clock_filter[1]
+
+    def compile_filters(self):
+        """
+        Compiles the enabled filters and the clock filter ahead of the first render -
+        the clock filter fonts may need resolving with fc-match, which takes a while
+        """
+        try:
+            for filter_str in self.parent.filters:
+                if filter_str.strip():
+                    compile_filter(filter_str.strip())
+            options = self.parent.options
+            if options.clock_enabled and options.clock_filter.strip():
+                self.get_clock_filter()
+        except Exception:
+            logger.exception(lambda: "Could not compile filters:")
+
+    def apply_clock(self, frame):
+        try:
+            options = self.parent.options
+            if not (options.clock_enabled and options.clock_filter.strip()):
+                return
+
+            clock_filter = self.get_clock_filter()
+            size, rect = self.get_screen_layout()
+            if rect:
+                hoffset = voffset = 0  # drawn on the primary monitor's part of the canvas
+            else:
+                hoffset, voffset = Util.compute_trimmed_offsets(frame.size, size)
+            image = resize(frame.get(size), cover_size(frame.size, size))
+
+            # this should always be called last to keep the clock as close as possible to real time
+            now = time.localtime()
+            annotations = clock_filter.get_annotations(hoffset, voffset, now)
+            if annotations is not None:
+                logger.info(lambda: f"Drawing clock: {annotations}")
+                image = _draw_in_rect(
+                    image, rect, lambda region: draw_annotations(region, annotations)
+                )
+            else:
+                args = clock_filter.get_args(hoffset, voffset, now)
+                logger.info(lambda: f"Applying clock filter: {args}")
+
+                def run(region):
+                    result = self.run_imagemagick(region, args)
+                    return region if result is None else result
+
+                image = _draw_in_rect(image, rect, run)
+            frame.set(image)
+        except Exception:
+            logger.exception(lambda: "Could not apply clock:")
@@ -0,0 +1,206 @@
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+### BEGIN LICENSE
+# Copyright (c) 2012, Peter Levi <peterlevi@peterlevi.com>
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+### END LICENSE
+"""
+Downloads to ".partial" files that can be resumed with HTTP Range requests after an interruption.
+
+While a download is in progress, a ".resume" file next to the partial file records the URL, the
+validator of the response (its strong ETag, or else its Last-Modified date) and the expected size.
+When the same URL is downloaded to the same partial file again, only the missing bytes are
+requested, with an If-Range header so that the server sends the whole file if it changed since.
+The .resume file also counts the attempts to download the URL, whether resumed or started over,
+so that a download that keeps getting interrupted is eventually given up.
+"""
+
+import json
+import logging
+import os
+
+from requests import HTTPError
+
+from variety.Util import Util
+
+logger = logging.getLogger("variety")
+
+# a URL is attempted at most this many times before an interrupted download is given up
+MAX_ATTEMPTS = 5
+
+
+class DownloadInterrupted(Exception):
+    """
+    Raised when a download failed midway, but what was downloaded is kept and the download can be
+    resumed by downloading the same URL to the same partial file again.
+    """
+
+
+def _resume_file(partial_path):
+    return partial_path + ".resume"
+
+
+def discard(partial_path):
+    """Deletes a partial file and its resume information"""
+    Util.safe_unlink(partial_path)
+    Util.safe_unlink(_resume_file(partial_path))
+
+
+def _load_resume_info(url, partial_path):
+    """
+    Returns the resume information of an earlier download of url to partial_path, or None, and the
+    offset to resume it from, 0 if it cannot be resumed
+    """
+    try:
+        with open(_resume_file(partial_path), encoding="utf8") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None, 0
+    if not isinstance(info, dict) or info.get("url") != url:
+        return None, 0
+    try:
+        size = os.path.getsize(partial_path)
+    except OSError:
+        return info, 0
+    if not info.get("validator") or (info.get("length") and size >= info["length"]):
+        return info, 0
+    return info, size
+
+
+def _save_resume_info(partial_path, info):
+    with open(_resume_file(partial_path), "w", encoding="utf8") as f:
+        json.dump(info, f)
+
+
+def _can_retry(info):
+    return info is not None and info.get("attempts", 0) < MAX_ATTEMPTS
+
+
+def _get_validator(r):
+    etag = r.headers.get("ETag")
+    if etag and not etag.startswith("W/"):  # weak ETags cannot be used with If-Range
+        return etag
+    return r.headers.get("Last-Modified")
+
+
+def _is_encoded(r):
+    # the body is decoded while streaming, so sizes and offsets would not match
+    return r.headers.get("Content-Encoding", "identity").lower() != "identity"
+
+
+def _is_resumable(r):
+    return (
+        _get_validator(r) is not None
+        and r.headers.get("Accept-Ranges", "bytes").lower() != "none"
+        and not _is_encoded(r)
+    )
+
+
+def _content_length(r):
+    try:
+        return None if _is_encoded(r) else int(r.headers["Content-Length"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _request_rest(url, partial_path, offset, info, headers, request_kwargs):
+    """
+    Requests the bytes from offset on. Returns the response and whether it has just these bytes,
+    i.e. whether the download is resumed. The response is None if the range is not satisfiable.
+    """
+    range_headers = {"Range": "bytes=%d-" % offset, "If-Range": info["validator"]}
+    try:
+        r = Util.request(url, stream=True, headers={**headers, **range_headers}, **request_kwargs)
+    except HTTPError as e:
+        if e.response is not None and e.response.status_code == 416:  # range not satisfiable
+            return None, False
+        discard(partial_path)
+        raise
+    except Exception as e:
+        if _can_retry(info):
+            raise DownloadInterrupted(str(e)) from e
+        discard(partial_path)
+        raise
+
+    content_range = r.headers.get("Content-Range", "")
+    return r, r.status_code == 206 and content_range.startswith("bytes %d-" % offset)
+
+
+def download(url, partial_path, response=None, headers=None, **request_kwargs):
+    """
+    Downloads url to partial_path, resuming an earlier interrupted download of the same URL to the
+    same path where possible. response may be an already made streaming GET request for url, it is
+    used unless the download is resumed. The size of the result is checked against the expected
+    one - verifying the contents is up to the caller, which then renames or discards the file.
+
+    Raises DownloadInterrupted if the download failed, but can be resumed later, and other
+    exceptions when it cannot or the URL was already attempted MAX_ATTEMPTS times - the partial
+    file is then deleted.
+    """
+    headers = headers or {}
+    info, offset = _load_resume_info(url, partial_path)
+    # every attempt counts, resumed or not, and it is recorded before it is made
+    attempts = (info.get("attempts", 0) if info else 0) + 1
+    r, resumed = None, False
+    if offset:
+        info["attempts"] = attempts
+        _save_resume_info(partial_path, info)
+        if response is not None:
+            response.close()
+            response = None
+        r, resumed = _request_rest(url, partial_path, offset, info, headers, request_kwargs)
+        if resumed:
+            logger.info(lambda: "Resuming the download of %s from byte %d" % (url, offset))
+        else:
+            logger.info(lambda: "Could not resume the download of %s, starting over" % url)
+
+    if r is None:
+        r = response or Util.request(url, stream=True, headers=headers, **request_kwargs)
+
+    if not resumed:
+        if _is_resumable(r):
+            length = _content_length(r)
+            info = {
+                "url": url,
+                "validator": _get_validator(r),
+                "length": length,
+                "attempts": attempts,
+            }
+        else:
+            info = None
+            Util.safe_unlink(_resume_file(partial_path))
+
+    try:
+        if info:
+            _save_resume_info(partial_path, info)
+        with open(partial_path, "ab" if resumed else "wb") as f:
+            Util.request_write_to(r, f)
+    except Exception as e:
+        if _can_retry(info) and os.path.exists(partial_path) and os.path.getsize(partial_path) > 0:
+            logger.info(
+                lambda: "Download of %s interrupted at byte %d, it can be resumed"
+                % (url, os.path.getsize(partial_path))
+            )
+            raise DownloadInterrupted(str(e)) from e
+        if info and not _can_retry(info):
+            logger.warning(lambda: "Download of %s failed %d times, giving up" % (url, attempts))
+        discard(partial_path)
+        raise
+
+    size = os.path.getsize(partial_path)
+    expected = info.get("length") if info else _content_length(r)
+    if expected is not None and size != expected:
+        if _can_retry(info) and size < expected:
+            raise DownloadInterrupted("Got %d of %d bytes of %s" % (size, expected, url))
+        discard(partial_path)
+        raise ValueError("Downloaded %d bytes of %s, expected %d" % (size, url, expected))
+    Util.safe_unlink(_resume_file(partial_path))
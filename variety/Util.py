@@ -36,8 +36,8 @@ from itertools import cycle
 
 import bs4
 import requests
-from PIL import Image
 
+from variety import HttpSession, ImageHeaders
 from variety_lib import get_version
 
 # fmt: off
@@ -336,6 +336,10 @@ class InternetDisabledError(Exception):
 
 class Util:
     internet_enabled = True
+    # shared by all image downloads, see DownloadEngine.BandwidthLimiter
+    bandwidth_limiter = None
+    # for requests with a cache_ttl, see HttpCache
+    http_cache = None
 
     @staticmethod
     def sanitize_filename(filename):
@@ -398,6 +402,9 @@ class Util:
         if not check_contents:
             return ext in (".jpg", ".jpeg", ".gif", ".png", ".tiff", ".svg", ".bmp", ".avif", ".webp")
         else:
+            info = ImageHeaders.get_image_info(filename)
+            if info:
+                return info[0] in _PIXBUF_SUPPORTED_FORMATS
             format, image_width, image_height = GdkPixbuf.Pixbuf.get_file_info(filename)
             return bool(format)
 
@@ -406,13 +413,17 @@ class Util:
         if not filename.lower().endswith(".gif"):
             return False
 
-        gif = Image.open(filename)
         try:
-            gif.seek(1)
-        except EOFError:
+            st = os.stat(filename)
+        except OSError:
             return False
-        else:
-            return True
+        return Util._is_animated_gif(filename, st.st_size, st.st_mtime)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=100000)
+    def _is_animated_gif(filename, size, mtime):
+        # size and mtime are part of the cache key, so that changed files are checked again
+        return ImageHeaders.get_gif_frame_count(filename, max_frames=2) > 1
 
     @staticmethod
     def list_files(
@@ -622,6 +633,11 @@ class Util:
 
     @staticmethod
     def get_size(image):
+        # parse the header ourselves if we can, this is way cheaper than GdkPixbuf's loaders
+        info = ImageHeaders.get_image_info(image)
+        if info:
+            return info[1], info[2]
+
         format, image_width, image_height = GdkPixbuf.Pixbuf.get_file_info(image)
         if not format:
             raise Exception("Not an image or unsupported image format")
@@ -647,6 +663,49 @@ class Util:
         screen = Gdk.Screen.get_default()
         return screen.get_width(), screen.get_height()
 
+    @staticmethod
+    def get_monitors():
+        """Returns (x, y, width, height, scale factor, is primary) for all monitors"""
+        display = Gdk.Display.get_default()
+        monitors = []
+        for i in range(display.get_n_monitors()):
+            monitor = display.get_monitor(i)
+            geometry = monitor.get_geometry()
+            monitors.append(
+                (
+                    geometry.x,
+                    geometry.y,
+                    geometry.width,
+                    geometry.height,
+                    monitor.get_scale_factor(),
+                    monitor.is_primary(),
+                )
+            )
+        return monitors
+
+    @staticmethod
+    def layout_monitors(monitors):
+        """
+        Lays out the monitors, as returned by get_monitors, on a single canvas spanning all of them,
+        in device pixels at the highest scale factor among them.
+        Returns the canvas size, the (x, y, width, height) rectangles of the monitors on it and
+        the index of the primary monitor (the first one if none is marked as primary).
+        """
+        scale = max(m[4] for m in monitors)
+        left = min(m[0] for m in monitors)
+        top = min(m[1] for m in monitors)
+        rects = [
+            ((x - left) * scale, (y - top) * scale, w * scale, h * scale)
+            for x, y, w, h, _, _ in monitors
+        ]
+        canvas_size = max(r[0] + r[2] for r in rects), max(r[1] + r[3] for r in rects)
+        primary = next((i for i, m in enumerate(monitors) if m[5]), 0)
+        return canvas_size, rects, primary
+
+    @staticmethod
+    def get_monitor_layout():
+        return Util.layout_monitors(Util.get_monitors())
+
     @staticmethod
     def find_unique_name(filename):
         index = filename.rfind(".")
@@ -662,7 +721,13 @@ class Util:
         return f
 
     @staticmethod
-    def request(url, data=None, stream=False, method=None, timeout=30, headers=None):
+    def request(
+        url, data=None, stream=False, method=None, timeout=30, headers=None, cache_ttl=None
+    ):
+        """
+        cache_ttl - for feeds and API calls: GET responses are kept in Util.http_cache and reused
+        for cache_ttl seconds, then revalidated with a conditional request, see HttpCache
+        """
         if not Util.internet_enabled:
             raise InternetDisabledError("Internet access in Variety is currently disabled")
 
@@ -670,28 +735,45 @@ class Util:
 
         if url.startswith("//"):
             url = "http:" + url
-        headers = headers or {}
-        headers = {"User-Agent": USER_AGENT, "Cache-Control": "max-age=0", **headers}
         method = method if method else "POST" if data else "GET"
-        try:
-            r = requests.request(
+        cached = (
+            cache_ttl is not None and Util.http_cache and method == "GET" and not data and not stream
+        )
+        headers = {
+            "User-Agent": USER_AGENT,
+            # let caches along the way answer the conditional requests of cached responses
+            **({} if cached else {"Cache-Control": "max-age=0"}),
+            **(headers or {}),
+        }
+
+        def send(extra_headers):
+            # pooled keep-alive connections, see HttpSession
+            r = HttpSession.get_session().request(
                 method=method,
                 url=url,
                 data=data,
-                headers=headers,
+                headers={**headers, **extra_headers},
                 stream=stream,
                 allow_redirects=True,
                 timeout=timeout,
             )
             r.raise_for_status()
             return r
+
+        try:
+            if cached:
+                return Util.http_cache.request(url, cache_ttl, send)
+            return send({})
         except requests.exceptions.SSLError:
             logger.exception("SSL Error for url %s:" % url)
             raise
 
     @staticmethod
     def request_write_to(r, f):
+        limiter = Util.bandwidth_limiter
         for chunk in r.iter_content(1024):
+            if limiter:
+                limiter.consume(len(chunk))
             f.write(chunk)
 
     @staticmethod
@@ -116,6 +116,28 @@ To set a specific wallpaper: %prog --set /some/local/image.jpg
         ),
     )
 
+    parser.add_option(
+        "--render-stats",
+        action="store_true",
+        dest="render_stats",
+        help=_(
+            "Print how long the stages of the recent wallpaper changes took (median, 95th "
+            "percentile and maximum, in milliseconds) as JSON. The timings of every change are "
+            "also logged to render_stats.jsonl in the profile folder. "
+            "Used only when the application is already running."
+        ),
+    )
+
+    parser.add_option(
+        "--http-stats",
+        action="store_true",
+        dest="http_stats",
+        help=_(
+            "Print the number of HTTP requests made and connections opened, in total and per host, "
+            "as JSON. Used only when the application is already running."
+        ),
+    )
+
     parser.add_option(
         "--set",
         "--set-wallpaper",
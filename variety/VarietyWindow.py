@@ -14,13 +14,14 @@
 # You should have received a copy of the GNU General Public License along
 # with this program.  If not, see <http://www.gnu.org/licenses/>.
 ### END LICENSE
+import concurrent.futures
+import contextlib
 import functools
 import json
 import logging
 import os
 import random
 import re
-import shlex
 import shutil
 import stat
 import subprocess
@@ -34,10 +35,16 @@ from typing import List
 from PIL import Image as PILImage
 
 from jumble.Jumble import Jumble
-from variety import indicator
+from variety import HttpSession, ResumableDownload, indicator
 from variety.AboutVarietyDialog import AboutVarietyDialog
 from variety.DominantColors import DominantColors
+from variety.DownloadEngine import DownloadEngine
+from variety.FolderWatcher import FolderWatcher
+from variety.FontPaths import FontPaths
+from variety.HttpCache import HttpCache
+from variety.ImageCatalog import ImageCatalog
 from variety.ImageFetcher import ImageFetcher
+from variety.ImageInfoCache import ImageInfoCache
 from variety.Options import Options
 from variety.plugins.downloaders.ConfigurableImageSource import ConfigurableImageSource
 from variety.plugins.downloaders.DefaultDownloader import SAFE_MODE_BLACKLIST
@@ -57,9 +64,12 @@ from variety.profile import (
     is_default_profile,
 )
 from variety.QuotesEngine import QuotesEngine
-from variety.QuoteWriter import QuoteWriter
+from variety.RenderCache import RenderCache
+from variety.Renderer import RenderCancelled, Renderer
+from variety.RenderScheduler import RenderScheduler
+from variety.RenderStats import RenderStats, RenderTrace
 from variety.ThumbsManager import ThumbsManager
-from variety.Util import Util, _, debounce, on_gtk, throttle
+from variety.Util import Util, _, debounce, on_gtk
 from variety.VarietyOptionParser import parse_options
 from variety.WelcomeDialog import WelcomeDialog
 from variety_lib import varietyconfig
@@ -92,6 +102,9 @@ class VarietyWindow(Gtk.Window):
     # How many unseen_downloads max to for every downloader.
     MAX_UNSEEN_PER_DOWNLOADER = 10
 
+    # Seconds to wait after a wallpaper change before pre-rendering the next one
+    PRERENDER_DELAY = 5
+
     @classmethod
     def get_instance(cls):
         return VarietyWindow.instance
@@ -143,6 +156,7 @@ class VarietyWindow(Gtk.Window):
         self.register_clipboard()
 
         self.do_set_wp_lock = threading.Lock()
+        self.prerender_lock = threading.Lock()
         self.auto_changed = True
 
         self.process_command(cmdoptions, initial_run=True)
@@ -150,7 +164,14 @@ class VarietyWindow(Gtk.Window):
         # load config
         self.options = None
         self.server_options = {}
-        self.post_filter_filename = None
+        self.render_cache = RenderCache(os.path.join(self.config_folder, "render_cache"))
+        self.renderer = Renderer(self, self.render_cache)
+        self.render_stats = RenderStats(os.path.join(self.config_folder, "render_stats.jsonl"))
+        self.render_scheduler = RenderScheduler(self.do_set_wp)
+        self.download_engine = DownloadEngine(self._available_downloaders, self.download_one_from)
+        self.register_download_lock = threading.Lock()
+        Util.bandwidth_limiter = self.download_engine.bandwidth_limiter
+        Util.http_cache = HttpCache(os.path.join(self.config_folder, "http_cache"))
 
         self.jumble = Jumble(
             [os.path.join(os.path.dirname(__file__), "plugins", "builtin"), self.plugins_folder]
@@ -160,7 +181,15 @@ class VarietyWindow(Gtk.Window):
         self.jumble.load()
 
         self.image_count = -1
-        self.image_colors_cache = {}
+        self.image_colors_cache = ImageInfoCache(
+            os.path.join(self.config_folder, "image_colors.db")
+        )
+        self.image_verdicts_cache = ImageInfoCache(
+            os.path.join(self.config_folder, "image_verdicts.db")
+        )
+        self.font_paths = FontPaths(os.path.join(self.config_folder, "font_paths.json"))
+        self.image_catalog = ImageCatalog(os.path.join(self.config_folder, "image_catalog.db"))
+        self.folder_watcher = FolderWatcher(self.image_catalog, Util.is_image)
 
         self.load_downloader_plugins()
         self.create_downloaders_cache()
@@ -303,6 +332,10 @@ class VarietyWindow(Gtk.Window):
 
         self.wallpaper_folder = os.path.join(self.config_folder, "wallpaper")
         Util.makedirs(self.wallpaper_folder)
+        # pre-rendered images are only kept in memory, any left in the folder are stale
+        for name in os.listdir(self.wallpaper_folder):
+            if name.startswith("staged-wallpaper-"):
+                Util.safe_unlink(os.path.join(self.wallpaper_folder, name))
 
         self.create_desktop_entry()
 
@@ -406,6 +439,12 @@ class VarietyWindow(Gtk.Window):
         Util.makedirs(self.options.favorites_folder)
         Util.makedirs(self.options.fetched_folder)
 
+        self.render_cache.set_max_mb(self.options.render_cache_size)
+        self.download_engine.configure(
+            self.options.download_concurrency, self.options.download_bandwidth_limit
+        )
+        HttpSession.configure(self.options.http_pool_hosts, self.options.http_pool_connections)
+
         self.individual_images = [
             os.path.expanduser(s[2])
             for s in self.options.sources
@@ -428,6 +467,7 @@ class VarietyWindow(Gtk.Window):
         self.download_folder_size = None
 
         self.albums = []
+        self.album_folders = []
 
         if self.size_options_changed():
             logger.info(lambda: "Size/landscape settings changed - purging downloaders cache")
@@ -441,13 +481,23 @@ class VarietyWindow(Gtk.Window):
 
             # prepare a cache for albums to avoid walking those folders on every change
             if type in (Options.SourceType.ALBUM_FILENAME, Options.SourceType.ALBUM_DATE):
-                images = Util.list_files(folders=(location,), filter_func=Util.is_image)
-                if type == Options.SourceType.ALBUM_FILENAME:
-                    images = sorted(images)
-                elif type == Options.SourceType.ALBUM_DATE:
-                    images = sorted(images, key=os.path.getmtime)
+                self.album_folders.append(location)
+                if self.image_catalog.is_scanned([location]):
+                    # the catalog is kept up to date by the folder watcher, no need to walk
+                    images = self.image_catalog.list_images(
+                        location, by_mtime=type == Options.SourceType.ALBUM_DATE
+                    )
                 else:
-                    raise Exception("Unsupported album type")
+                    images = [
+                        os.path.normpath(f)
+                        for f in Util.list_files(folders=(location,), filter_func=Util.is_image)
+                    ]
+                    if type == Options.SourceType.ALBUM_FILENAME:
+                        images = sorted(images)
+                    elif type == Options.SourceType.ALBUM_DATE:
+                        images = sorted(images, key=os.path.getmtime)
+                    else:
+                        raise Exception("Unsupported album type")
 
                 if images:
                     self.albums.append({"path": os.path.normpath(location), "images": images})
@@ -482,7 +532,10 @@ class VarietyWindow(Gtk.Window):
             Util.makedirs(downloader.target_folder)
             self.folders.append(downloader.target_folder)
 
+        self.folder_watcher.watch(self.folders + self.album_folders)
+
         self.filters = [f[2] for f in self.options.filters if f[0]]
+        Util.start_daemon(self.renderer.compile_filters)
 
         self.min_width = 0
         self.min_height = 0
@@ -490,6 +543,8 @@ class VarietyWindow(Gtk.Window):
             self.min_width = Gdk.Screen.get_default().get_width() * self.options.min_size // 100
             self.min_height = Gdk.Screen.get_default().get_height() * self.options.min_size // 100
 
+        self.filtering_fingerprint = self.get_filtering_fingerprint()
+
         self.log_options()
 
         # clean prepared - they are outdated
@@ -582,6 +637,32 @@ class VarietyWindow(Gtk.Window):
             return True
         return False
 
+    def get_filtering_fingerprint(self):
+        """
+        Returns a hash of everything except the image itself that image_ok's verdict depends on:
+        the options compared in filtering_options_changed and the resulting minimum size.
+        """
+        return Util.md5(
+            json.dumps(
+                [
+                    self.options.min_size_enabled,
+                    self.options.min_size,
+                    self.min_width,
+                    self.min_height,
+                    self.options.use_landscape_enabled,
+                    self.options.safe_mode,
+                    self.options.desired_color_enabled,
+                    self.options.desired_color,
+                    self.options.lightness_enabled,
+                    self.options.lightness_mode,
+                    self.options.min_rating_enabled,
+                    self.options.min_rating,
+                    self.options.name_regex_enabled,
+                    self.options.name_regex,
+                ]
+            )
+        )
+
     def size_options_changed(self):
         return self.previous_options and (
             self.previous_options.min_size_enabled != self.options.min_size_enabled
@@ -674,8 +755,8 @@ class VarietyWindow(Gtk.Window):
         prep_thread.daemon = True
         prep_thread.start()
 
-        self.dl_event = threading.Event()
-        dl_thread = threading.Thread(target=self.download_thread)
+        self.dl_event = self.download_engine.event
+        dl_thread = threading.Thread(target=self.download_engine.run)
         dl_thread.daemon = True
         dl_thread.start()
 
@@ -978,26 +1059,36 @@ class VarietyWindow(Gtk.Window):
 
     def find_images(self):
         self.prepared_cleared = False
+        self.image_catalog.refresh(
+            self.folders + self.album_folders,
+            Util.is_image,
+            live_folders=self.folder_watcher.get_live_folders(),
+        )
         images = self.select_random_images(100 if not self.options.safe_mode else 30)
 
-        found = set()
-        for fuzziness in range(0, 5):
-            if len(found) > 10 or len(found) >= len(images):
-                break
-            for img in images:
+        min_fuzziness = {}
+        with contextlib.closing(self.evaluate_images(images)) as evaluations:
+            for img, fuzziness in evaluations:
                 if not self.running or self.prepared_cleared:
                     # abandon this search
                     return
 
-                try:
-                    if not img in found and self.image_ok(img, fuzziness):
-                        # print "OK at fz %d: %s" % (fuzziness, img)
-                        found.add(img)
-                        if len(self.prepared) < 3 and not self.prepared_cleared:
-                            with self.prepared_lock:
-                                self.prepared.append(img)
-                except Exception:
-                    logger.exception(lambda: "Excepion while testing image_ok on file " + img)
+                if fuzziness is None:
+                    continue
+                min_fuzziness[img] = fuzziness
+                if fuzziness == 0 and len(self.prepared) < 3:
+                    with self.prepared_lock:
+                        if not self.prepared_cleared:
+                            self.prepared.append(img)
+
+        # rank by score and relax the filters only as much as needed to have more than 10 images
+        found = set()
+        previous = 0
+        for img in sorted(min_fuzziness, key=min_fuzziness.get):
+            if len(found) > 10 and min_fuzziness[img] > previous:
+                break
+            found.add(img)
+            previous = min_fuzziness[img]
 
         with self.prepared_lock:
             if self.prepared_cleared:
@@ -1037,6 +1128,31 @@ class VarietyWindow(Gtk.Window):
                     ),
                 )
 
+    def evaluate_images(self, images):
+        """
+        Yields (image, min_fuzziness) for each of the images, in the order their evaluations
+        complete. Evaluations run in a pool of filter_workers threads - decoding, resizing and color
+        analysis release the GIL, so these overlap. Closing the generator cancels the evaluations
+        that have not started yet.
+        """
+        workers = self.options.filter_workers or min(8, os.cpu_count() or 1)
+        workers = min(workers, len(images))
+        if workers <= 1:
+            for img in images:
+                yield img, self.get_min_fuzziness(img)
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="image_ok"
+        ) as executor:
+            futures = {executor.submit(self.get_min_fuzziness, img): img for img in images}
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    yield futures[future], future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
     def prepare_thread(self):
         logger.info(lambda: "Prepare thread running")
         while self.running:
@@ -1098,45 +1214,24 @@ class VarietyWindow(Gtk.Window):
     def _unseen_downloads(self, state):
         return [f for f in state.get("unseen_downloads", []) if os.path.exists(f)]
 
-    def download_thread(self):
-        while self.running:
-            try:
-                available_downloaders = self._available_downloaders()
-
-                if not available_downloaders:
-                    self.dl_event.wait(180)
-                    self.dl_event.clear()
-                    continue
-
-                # download from the downloader with the smallest unseen queue
-                downloader = sorted(
-                    available_downloaders, key=lambda dl: len(self._unseen_downloads(dl.state))
-                )[0]
-                self.download_one_from(downloader)
-
-                # Also refresh the images for all refreshers that haven't downloaded recently -
-                # these need to be updated regularly
-                for dl in available_downloaders:
-                    if dl.is_refresher() and dl != downloader:
-                        dl.download_one()
-
-                # give some breathing room between downloads
-                time.sleep(1)
-            except Exception:
-                logger.exception(lambda: "Exception in download_thread:")
-
     def _available_downloaders(self):
+        """
+        Returns the downloaders the download engine should download from, those with the smallest
+        unseen queue first. Refreshers are included whenever they haven't downloaded recently -
+        these need to be updated regularly.
+        """
         if not self.options.internet_enabled:
             return []
 
         now = time.time()
-        return [
+        available = [
             dl
             for dl in self.downloaders
             if dl.state.get("last_download_failure", 0) < now - 60
             and (not dl.is_refresher() or dl.state.get("last_download_success", 0) < now - 60)
             and len(self._unseen_downloads(dl.state)) <= VarietyWindow.MAX_UNSEEN_PER_DOWNLOADER
         ]
+        return sorted(available, key=lambda dl: len(self._unseen_downloads(dl.state)))
 
     def trigger_download(self):
         logger.info(lambda: "Triggering download thread to check if download needed and possible")
@@ -1145,13 +1240,19 @@ class VarietyWindow(Gtk.Window):
 
     def register_downloaded_file(self, file):
         self.refresh_thumbs_downloads(file)
+        self.image_catalog.add_file(file)
 
-        if file.startswith(self.options.download_folder) and self.download_folder_size is not None:
-            self.download_folder_size += os.path.getsize(file)
+        # downloads complete concurrently, see DownloadEngine
+        with self.register_download_lock:
+            if (
+                file.startswith(self.options.download_folder)
+                and self.download_folder_size is not None
+            ):
+                self.download_folder_size += os.path.getsize(file)
 
-        # every once in a while, check the Downloaded folder against the allowed quota
-        if random.random() < 0.05:
-            self.purge_downloaded()
+            # every once in a while, check the Downloaded folder against the allowed quota
+            if random.random() < 0.05:
+                self.purge_downloaded()
 
     def download_one_from(self, downloader):
         try:
@@ -1222,6 +1323,9 @@ class VarietyWindow(Gtk.Window):
                         Util.safe_unlink(file)
                         self.download_folder_size -= files[i][1]
                         Util.safe_unlink(file + ".metadata.json")
+                        if file.endswith(".partial"):
+                            # an interrupted download, see ResumableDownload
+                            ResumableDownload.discard(file)
                     except Exception:
                         logger.exception(
                             lambda: "Could not delete some file while purging download folder: {}".format(
@@ -1243,11 +1347,7 @@ class VarietyWindow(Gtk.Window):
             return
 
         self.thumbs_manager.mark_active(file=filename, position=self.position)
-
-        def _do_set_wp():
-            self.do_set_wp(filename, refresh_level)
-
-        threading.Timer(0, _do_set_wp).start()
+        self.render_scheduler.request(filename, refresh_level)
 
     @staticmethod
     @functools.cache
@@ -1257,88 +1357,17 @@ class VarietyWindow(Gtk.Window):
             return cmd
         return "convert"
 
-    def build_imagemagick_filter_cmd(self, filename, target_file):
-        if not self.filters:
-            return None
-
-        filter_str = random.choice(self.filters).strip()
-        if not filter_str:
-            return None
-
-        w, h = Util.get_primary_display_size()
-        args = [self.get_magick_cmd(), filename, "-scale", f"{w}x{h}^"]
-
-        logger.info(lambda: f"Applying filter: {filter_str}")
-        # Replace placeholders BEFORE splitting into a list
-        filter_str = filter_str.replace("%FILEPATH%", filename)
-        filter_str = filter_str.replace("%FILENAME%", os.path.basename(filename))
-        args.extend(shlex.split(filter_str))
-
-        args.append(target_file)
-
-        logger.info(lambda: f"ImageMagick args: {args}")
-        return args
-
-    def build_imagemagick_clock_cmd(self, filename, target_file):
-        if not (self.options.clock_enabled and self.options.clock_filter.strip()):
-            return None
-
-        w, h = Util.get_primary_display_size()
-
-        cmd = [self.get_magick_cmd(), filename, "-scale", f"{w}x{h}^"]
-
-        hoffset, voffset = Util.compute_trimmed_offsets(Util.get_size(filename), (w, h))
-        clock_filter = self.options.clock_filter
-        clock_filter = VarietyWindow.replace_clock_filter_offsets(clock_filter, hoffset, voffset)
-        clock_filter = self.replace_clock_filter_fonts(clock_filter)
-        # this should always be called last to keep the clock as close as possible to real time
-        clock_filter = time.strftime(clock_filter, time.localtime())
-
-        logger.info(lambda: f"Applying clock filter: {clock_filter}")
-        cmd.extend(shlex.split(clock_filter))
-        cmd.append(target_file)
-
-        logger.info(lambda: f"ImageMagick clock args: {cmd}")
-        return cmd
-
-    @staticmethod
-    @functools.cache
-    def resolve_font_path(font_name):
-        cmd = ['fc-match', '-f', '%{file[0]}', font_name]
-        result = subprocess.run(cmd, check=False, text=True, stdout=subprocess.PIPE)
-        font_file = ""
-        if result.returncode == 0:
-            font_file = result.stdout
-        else:
-            logger.warning(
-                lambda: f"Could not find font {font_name!r}. "
-                f"Exit code: {result.returncode}"
-            )
-        return font_file
-
     def replace_clock_filter_fonts(self, clock_filter):
         clock_font_name, clock_font_size = Util.gtk_to_fcmatch_font(self.options.clock_font)
-        clock_font_file = self.resolve_font_path(clock_font_name)
+        clock_font_file = self.font_paths.resolve(clock_font_name)
         date_font_name, date_font_size = Util.gtk_to_fcmatch_font(self.options.clock_date_font)
-        date_font_file = self.resolve_font_path(date_font_name)
+        date_font_file = self.font_paths.resolve(date_font_name)
         clock_filter = clock_filter.replace("%CLOCK_FONT_FILE", clock_font_file)
         clock_filter = clock_filter.replace("%CLOCK_FONT_SIZE", clock_font_size)
         clock_filter = clock_filter.replace("%DATE_FONT_FILE", date_font_file)
         clock_filter = clock_filter.replace("%DATE_FONT_SIZE", date_font_size)
         return clock_filter
 
-    @staticmethod
-    def replace_clock_filter_offsets(filter, hoffset, voffset):
-        def hrepl(m):
-            return str(hoffset + int(m.group(1)))
-
-        def vrepl(m):
-            return str(voffset + int(m.group(1)))
-
-        filter = re.sub(r"\[\%HOFFSET\+(\d+)\]", hrepl, filter)
-        filter = re.sub(r"\[\%VOFFSET\+(\d+)\]", vrepl, filter)
-        return filter
-
     def refresh_wallpaper(self):
         self.set_wp_throttled(
             self.current, refresh_level=VarietyWindow.RefreshLevel.FILTERS_AND_TEXTS
@@ -1361,65 +1390,6 @@ class VarietyWindow(Gtk.Window):
         except Exception:
             logger.exception(lambda: "Cannot write wallpaper.jpg.txt")
 
-    def apply_filters(self, to_set, refresh_level):
-        try:
-            if self.filters:
-                # don't run the filter command when the refresh level is clock or quotes only,
-                # use the previous filtered image otherwise
-                if (
-                    refresh_level
-                    in [
-                        VarietyWindow.RefreshLevel.ALL,
-                        VarietyWindow.RefreshLevel.FILTERS_AND_TEXTS,
-                    ]
-                    or not self.post_filter_filename
-                ):
-                    self.post_filter_filename = to_set
-                    target_file = os.path.join(
-                        self.wallpaper_folder, f"wallpaper-filter-{Util.random_hash()}.jpg"
-                    )
-
-                    cmd = self.build_imagemagick_filter_cmd(to_set, target_file)
-                    if cmd:
-                        result = subprocess.run(cmd, check=False)
-                        if result.returncode == 0:
-                            to_set = target_file
-                            self.post_filter_filename = to_set
-                        else:
-                            logger.warning(
-                                lambda: "Could not execute filter magick command. "
-                                f"Missing ImageMagick or bad filter defined? Exit code: {result.returncode}"
-                            )
-
-                else:
-                    to_set = self.post_filter_filename
-            return to_set
-        except Exception:
-            logger.exception(lambda: "Could not apply filters:")
-            return to_set
-
-    def apply_auto_rotate(self, to_set):
-        try:
-            if self.options.wallpaper_auto_rotate:
-                target_file = os.path.join(
-                    self.wallpaper_folder, "wallpaper-auto-rotated-%s.jpg" % Util.random_hash()
-                )
-                cmd = [self.get_magick_cmd(), to_set, "-auto-orient", target_file]
-                logger.info(lambda: f"ImageMagick auto-rotate cmd: {cmd}")
-
-                result = subprocess.run(cmd, check=False)
-                if result.returncode == 0:
-                    to_set = target_file
-                else:
-                    logger.warning(
-                        lambda: "Could not execute auto-orient magick command. "
-                        f"Missing ImageMagick? Exit code: {result.returncode}"
-                    )
-            return to_set
-        except Exception:
-            logger.exception(lambda: "Could not apply auto-orient:")
-            return to_set
-
     def get_display_modes(self) -> List[DisplayMode]:
         if not hasattr(self, "display_modes_cache"):
             modes = []
@@ -1430,76 +1400,6 @@ class VarietyWindow(Gtk.Window):
             self.display_modes_cache = [m[0] for m in modes]
         return getattr(self, "display_modes_cache")
 
-    def apply_display_mode(self, to_set):
-        try:
-            mode = "os"
-            modes = [
-                x for x in self.get_display_modes() if x.id == self.options.wallpaper_display_mode
-            ]
-            if modes:
-                mode_data = modes[0].fn(to_set)
-                if mode_data.fixed_image_path:
-                    return mode_data.fixed_image_path, mode_data.set_wallpaper_param
-                if not mode_data.imagemagick_cmd:
-                    return to_set, mode_data.set_wallpaper_param
-                target_file = os.path.join(
-                    self.wallpaper_folder, "wallpaper-zoomed-%s.jpg" % Util.random_hash()
-                )
-                cmd = [self.get_magick_cmd(), to_set, *shlex.split(mode_data.imagemagick_cmd), target_file]
-                logger.info(lambda: f"ImageMagick display mode cmd: {cmd}")
-
-                result = subprocess.run(cmd, check=False)
-                if result.returncode == 0:
-                    return target_file, mode
-                logger.warning(
-                    lambda: "Could not execute auto-orient magick command. "
-                    f"Missing ImageMagick? Exit code: {result.returncode}"
-                )
-                return to_set, "os"
-            return to_set, mode
-        except Exception:
-            logger.exception(lambda: "Could not apply display mode logic:")
-            return to_set
-
-    def apply_quote(self, to_set):
-        try:
-            if self.options.quotes_enabled and self.quote:
-                quote_outfile = os.path.join(
-                    self.wallpaper_folder, "wallpaper-quote-%s.jpg" % Util.random_hash()
-                )
-                QuoteWriter.write_quote(
-                    self.quote["quote"],
-                    self.quote.get("author", None),
-                    to_set,
-                    quote_outfile,
-                    self.options,
-                )
-                to_set = quote_outfile
-            return to_set
-        except Exception:
-            logger.exception(lambda: "Could not apply quote:")
-            return to_set
-
-    def apply_clock(self, to_set):
-        try:
-            if self.options.clock_enabled:
-                target_file = os.path.join(
-                    self.wallpaper_folder, "wallpaper-clock-%s.jpg" % Util.random_hash()
-                )
-                cmd = self.build_imagemagick_clock_cmd(to_set, target_file)
-                result = subprocess.run(cmd, check=False)
-                if result.returncode == 0:
-                    to_set = target_file
-                else:
-                    logger.warning(
-                        lambda: "Could not execute clock magick command. "
-                        f"Missing ImageMagick or bad filter defined? Exit code: {result.returncode}"
-                    )
-            return to_set
-        except Exception:
-            logger.exception(lambda: "Could not apply clock:")
-            return to_set
-
     def apply_copyto_operation(self, to_set):
         if self.options.copyto_enabled:
             folder = self.get_actual_copyto_folder()
@@ -1534,10 +1434,10 @@ class VarietyWindow(Gtk.Window):
         else:
             return os.path.normpath(option)
 
-    @throttle(seconds=1, trailing_call=True)
-    def do_set_wp(self, filename, refresh_level=RefreshLevel.ALL):
+    def do_set_wp(self, filename, refresh_level=RefreshLevel.ALL, cancelled=None):
         logger.info(lambda: "Calling do_set_wp with %s, time: %s" % (filename, time.time()))
         with self.do_set_wp_lock:
+            trace = RenderTrace(filename, refresh_level)
             try:
                 if not os.access(filename, os.R_OK):
                     logger.info(
@@ -1553,30 +1453,27 @@ class VarietyWindow(Gtk.Window):
                 else:
                     should_apply_effects = False
 
-                to_set = filename
-                to_set = self.apply_auto_rotate(to_set)
-
-                if should_apply_effects:
-                    to_set = self.apply_filters(to_set, refresh_level)
-
-                to_set, display_mode_param = self.apply_display_mode(to_set)
-
-                if should_apply_effects:
-                    to_set = self.apply_quote(to_set)
-                    to_set = self.apply_clock(to_set)
-
-                to_set = self.apply_copyto_operation(to_set)
+                to_set, display_mode_param = self.renderer.render(
+                    filename, refresh_level, should_apply_effects, trace=trace, cancelled=cancelled
+                )
+                with trace.stage("copyto"):
+                    to_set = self.apply_copyto_operation(to_set)
 
-                self.cleanup_old_wallpapers(self.wallpaper_folder, "wallpaper-", to_set)
+                with trace.stage("cleanup"):
+                    self.cleanup_old_wallpapers(self.wallpaper_folder, "wallpaper-", to_set)
 
                 def _update_inidicator():
                     self.update_indicator(filename)
 
                 Util.add_mainloop_task(_update_inidicator)
 
-                self.set_desktop_wallpaper(to_set, filename, refresh_level, display_mode_param)
+                with trace.stage("set_wallpaper"):
+                    self.set_desktop_wallpaper(to_set, filename, refresh_level, display_mode_param)
                 if self.options.change_lock_screen:
-                    self.set_desktop_wallpaper(to_set, filename, refresh_level, display_mode_param, lock_screen=True)
+                    with trace.stage("lock_screen"):
+                        self.set_desktop_wallpaper(
+                            to_set, filename, refresh_level, display_mode_param, lock_screen=True
+                        )
                 self.current = filename
 
                 if self.options.icon == "Current" and self.current:
@@ -1591,23 +1488,52 @@ class VarietyWindow(Gtk.Window):
                     self.last_change_time = time.time()
                     self.save_last_change_time()
                     self.save_history()
+                if refresh_level != VarietyWindow.RefreshLevel.CLOCK_ONLY:
+                    # also after option changes, which make the pre-rendered image outdated
+                    self.schedule_prerender()
+            except RenderCancelled:
+                logger.info(lambda: "Rendering %s was cancelled by a newer request" % filename)
+                trace.cancelled = True
             except Exception:
                 logger.exception(lambda: "Error while setting wallpaper")
+            finally:
+                self.render_stats.add(trace)
 
     def select_random_images(self, count):
-        all_images = list(
-            Util.list_files(self.individual_images, self.folders, Util.is_image, max_files=10000)
+        if not self.image_catalog.is_scanned(self.folders):
+            # the catalog is still being built, walk the folders this time
+            all_images = list(
+                Util.list_files(
+                    self.individual_images, self.folders, Util.is_image, max_files=10000
+                )
+            )
+            self.image_count = len(all_images)
+
+            # add just the first image of each album to the selection,
+            # otherwise albums will get an enormous part of the screentime, as they act as
+            # "black holes" - once we start them, we stay there until done
+            for album in self.albums:
+                all_images.append(album["images"][0])
+
+            random.shuffle(all_images)
+            return all_images[:count]
+
+        individual_images = list(Util.list_files(self.individual_images, (), Util.is_image))
+        self.image_count = min(
+            10000, len(individual_images) + self.image_catalog.count(self.folders)
         )
-        self.image_count = len(all_images)
 
-        # add just the first image of each album to the selection,
-        # otherwise albums will get an enormous part of the screentime, as they act as
-        # "black holes" - once we start them, we stay there until done
-        for album in self.albums:
-            all_images.append(album["images"][0])
+        # individual images and the first image of each album compete with the folder images
+        # for the selection just like they would in a full listing
+        extras = individual_images + [album["images"][0] for album in self.albums]
+        chance = count / max(1, self.image_count + len(self.albums))
+        selected = [f for f in extras if random.random() < chance]
+        selected.extend(
+            self.image_catalog.random_images(self.folders, count - len(selected), max_files=10000)
+        )
 
-        random.shuffle(all_images)
-        return all_images[:count]
+        random.shuffle(selected)
+        return selected[:count]
 
     def on_indicator_scroll(self, indicator, steps, direction):
         if direction in (Gdk.ScrollDirection.DOWN, Gdk.ScrollDirection.UP):
@@ -1700,16 +1626,8 @@ class VarietyWindow(Gtk.Window):
 
     def change_wallpaper(self, widget=None, keep_quote=False):
         try:
-            img = None
-
             # check if current is part of an album, and show next image in the album
-            if self.current:
-                for album in self.albums:
-                    if os.path.normpath(self.current).startswith(album["path"]):
-                        index = album["images"].index(self.current)
-                        if 0 <= index < len(album["images"]) - 1:
-                            img = album["images"][index + 1]
-                            break
+            img = self.get_next_album_image()
 
             if not img:
                 with self.prepared_lock:
@@ -1756,6 +1674,48 @@ class VarietyWindow(Gtk.Window):
         except Exception:
             logger.exception(lambda: "Could not change wallpaper")
 
+    def get_next_album_image(self):
+        if self.current:
+            current = os.path.normpath(self.current)
+            for album in self.albums:
+                if current.startswith(album["path"]) and current in album["images"]:
+                    index = album["images"].index(current)
+                    if 0 <= index < len(album["images"]) - 1:
+                        return album["images"][index + 1]
+        return None
+
+    def get_likely_next_image(self):
+        """The image that next_wallpaper will most likely show, unless it picks an unseen download"""
+        if self.position > 0:
+            return self.used[self.position - 1]
+        img = self.get_next_album_image()
+        if img:
+            return img
+        with self.prepared_lock:
+            for prep in self.prepared:
+                if prep != self.current and os.access(prep, os.R_OK):
+                    return prep
+        return None
+
+    def schedule_prerender(self):
+        """Pre-renders the likely next wallpaper a bit after the current change is done"""
+
+        def _prerender():
+            if not self.running or not self.prerender_lock.acquire(blocking=False):
+                return
+            try:
+                img = self.get_likely_next_image()
+                if img and img != self.current and img != self.no_effects_on:
+                    self.renderer.prerender(img)
+            except Exception:
+                logger.exception(lambda: "Could not pre-render the next wallpaper")
+            finally:
+                self.prerender_lock.release()
+
+        timer = threading.Timer(VarietyWindow.PRERENDER_DELAY, _prerender)
+        timer.daemon = True
+        timer.start()
+
     def _enabled_unseen_downloads(self):
         # collect the unseen_downloads from the currently enabled downloaders:
         enabled_unseen_downloads = set()
@@ -1848,83 +1808,111 @@ class VarietyWindow(Gtk.Window):
             add_timer.start()
 
     def on_rating_changed(self, file):
+        self.image_verdicts_cache.remove(file)
         with self.prepared_lock:
             self.prepared = [f for f in self.prepared if f != file]
         self.prepare_event.set()
         self.update_indicator(auto_changed=False)
 
     def image_ok(self, img, fuzziness):
+        min_fuzziness = self.get_min_fuzziness(img)
+        return min_fuzziness is not None and min_fuzziness <= fuzziness
+
+    def get_min_fuzziness(self, img):
+        """
+        Returns the smallest fuzziness (0 to 4) at which the image passes the filters,
+        or None if it does not pass at all. Verdicts are cached per image and filtering options,
+        and are persisted between runs.
+        """
+        fingerprint = self.filtering_fingerprint
+        cached = self.image_verdicts_cache.get(img)
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+
         try:
-            if Util.is_animated_gif(img):
-                return False
-
-            if self.options.min_rating_enabled:
-                rating = Util.get_rating(img)
-                if rating is None or rating <= 0 or rating < self.options.min_rating:
-                    return False
-
-            if self.options.name_regex_enabled:
-                if re.fullmatch(self.options.name_regex, os.path.basename(img)) is None:
-                    return False
-
-            if self.options.use_landscape_enabled or self.options.min_size_enabled:
-                if img in self.image_colors_cache:
-                    width = self.image_colors_cache[img][3]
-                    height = self.image_colors_cache[img][4]
-                else:
-                    width, height = Util.get_size(img)
+            min_fuzziness = self._compute_min_fuzziness(img)
+        except Exception:
+            # do not remember the verdict, the error might be temporary
+            logger.warning(lambda: "Error in image_ok for file %s" % img)
+            logger.info(lambda: "Debug details:", exc_info=True)
+            return None
 
-                if not self.size_ok(width, height, fuzziness):
-                    return False
-
-            if self.options.desired_color_enabled or self.options.lightness_enabled:
-                if not img in self.image_colors_cache:
-                    dom = DominantColors(img, False)
-                    self.image_colors_cache[img] = dom.get_dominant_colors()
-                colors = self.image_colors_cache[img]
-
-                if self.options.lightness_enabled:
-                    lightness = colors[2]
-                    if self.options.lightness_mode == Options.LightnessMode.DARK:
-                        if lightness >= 75 + fuzziness * 6:
-                            return False
-                    elif self.options.lightness_mode == Options.LightnessMode.LIGHT:
-                        if lightness <= 180 - fuzziness * 6:
-                            return False
-                    else:
-                        logger.warning(
-                            lambda: "Unknown lightness mode: %d", self.options.lightness_mode
-                        )
+        self.image_verdicts_cache.put(img, [fingerprint, min_fuzziness])
+        return min_fuzziness
 
-                if (
-                    self.options.desired_color_enabled
-                    and self.options.desired_color
-                    and not DominantColors.contains_color(
-                        colors, self.options.desired_color, fuzziness + 2
-                    )
-                ):
-                    return False
+    def _compute_min_fuzziness(self, img):
+        """
+        Scores the image in a single pass: reads whatever each enabled filter needs from the image
+        just once, then finds the least fuzziness each filter's thresholds accept.
+        """
+        if Util.is_animated_gif(img):
+            return None
 
-            if self.options.safe_mode:
-                try:
-                    info = Util.read_metadata(img)
-                    if info.get("sfwRating", 100) < 100:
-                        return False
+        if self.options.min_rating_enabled:
+            rating = Util.get_rating(img)
+            if rating is None or rating <= 0 or rating < self.options.min_rating:
+                return None
 
-                    blacklisted = (
-                        set(k.lower() for k in info.get("keywords", [])) & SAFE_MODE_BLACKLIST
-                    )
-                    if len(blacklisted) > 0:
-                        return False
-                except Exception:
-                    pass
+        if self.options.name_regex_enabled:
+            if re.fullmatch(self.options.name_regex, os.path.basename(img)) is None:
+                return None
 
-            return True
+        if self.options.safe_mode:
+            try:
+                info = Util.read_metadata(img)
+                if info.get("sfwRating", 100) < 100:
+                    return None
 
-        except Exception:
-            logger.warning(lambda: "Error in image_ok for file %s" % img)
-            logger.info(lambda: "Debug details:", exc_info=True)
-            return False
+                blacklisted = set(k.lower() for k in info.get("keywords", [])) & SAFE_MODE_BLACKLIST
+                if len(blacklisted) > 0:
+                    return None
+            except Exception:
+                pass
+
+        # fuzziness-dependent checks, each one passes for all fuzziness values above some minimum
+        checks = []
+
+        if self.options.use_landscape_enabled or self.options.min_size_enabled:
+            size = self.image_catalog.get_dimensions(img)
+            if size:
+                width, height = size
+            else:
+                colors = self.image_colors_cache.get(img)
+                if colors:
+                    width, height = colors[3], colors[4]
+                else:
+                    width, height = Util.get_size(img)
+                self.image_catalog.set_dimensions(img, width, height)
+            checks.append(lambda f: self.size_ok(width, height, f))
+
+        if self.options.desired_color_enabled or self.options.lightness_enabled:
+            colors = self.image_colors_cache.get(img)
+            if colors is None:
+                colors = DominantColors(img, False).get_dominant_colors()
+                self.image_colors_cache.put(img, colors)
+
+            if self.options.lightness_enabled:
+                checks.append(lambda f: self.lightness_ok(colors[2], f))
+
+            if self.options.desired_color_enabled and self.options.desired_color:
+                desired_color = self.options.desired_color
+                checks.append(lambda f: DominantColors.contains_color(colors, desired_color, f + 2))
+
+        min_fuzziness = 0
+        for check in checks:
+            min_fuzziness = next((f for f in range(min_fuzziness, 5) if check(f)), None)
+            if min_fuzziness is None:
+                return None
+        return min_fuzziness
+
+    def lightness_ok(self, lightness, fuzziness=0):
+        if self.options.lightness_mode == Options.LightnessMode.DARK:
+            return lightness < 75 + fuzziness * 6
+        elif self.options.lightness_mode == Options.LightnessMode.LIGHT:
+            return lightness > 180 - fuzziness * 6
+        else:
+            logger.warning(lambda: "Unknown lightness mode: %d" % self.options.lightness_mode)
+            return True
 
     def size_ok(self, width, height, fuzziness=0):
         ok = True
@@ -2130,6 +2118,7 @@ class VarietyWindow(Gtk.Window):
         self._remove_from_unseen(file)
         with self.prepared_lock:
             self.prepared = [f for f in self.prepared if f != file]
+        self.image_catalog.remove_file(file)
 
     def remove_folder_from_queues(self, folder):
         self.position = max(
@@ -2138,6 +2127,7 @@ class VarietyWindow(Gtk.Window):
         self.used = [f for f in self.used if not Util.file_in(f, folder)]
         with self.prepared_lock:
             self.prepared = [f for f in self.prepared if not Util.file_in(f, folder)]
+        self.image_catalog.remove_folder(folder)
 
     def copy_to_favorites(self, widget=None, file=None):
         try:
@@ -2149,6 +2139,9 @@ class VarietyWindow(Gtk.Window):
                 self.move_or_copy_file(
                     file, self.options.favorites_folder, "favorites", shutil.copy
                 )
+                self.image_catalog.add_file(
+                    os.path.join(self.options.favorites_folder, os.path.basename(file))
+                )
                 self.update_indicator(auto_changed=False)
                 self.report_image_favorited(file)
         except Exception:
@@ -2167,6 +2160,9 @@ class VarietyWindow(Gtk.Window):
                 )
                 if ok:
                     new_file = os.path.join(self.options.favorites_folder, os.path.basename(file))
+                    if not os.path.exists(file):
+                        self.image_catalog.remove_file(file)
+                    self.image_catalog.add_file(new_file)
                     self.used = [(new_file if f == file else f) for f in self.used]
                     with self.prepared_lock:
                         self.prepared = [(new_file if f == file else f) for f in self.prepared]
@@ -2247,6 +2243,10 @@ class VarietyWindow(Gtk.Window):
             except Exception:
                 logger.exception(lambda: "Could not stop quotes engine")
 
+            self.render_scheduler.stop()
+            self.download_engine.stop()
+            self.image_colors_cache.flush()
+            self.image_verdicts_cache.flush()
             if self.options.clock_enabled or self.options.quotes_enabled:
                 self.options.clock_enabled = False
                 self.options.quotes_enabled = False
@@ -2552,6 +2552,12 @@ class VarietyWindow(Gtk.Window):
 
             GObject.timeout_add(3000 if initial_run else 1, _process_command)
 
+            if options.render_stats:
+                return json.dumps(self.render_stats.get_summary(), indent=4)
+
+            if options.http_stats:
+                return json.dumps(HttpSession.get_stats(), indent=4)
+
             if options.show_meta:
                 try:
                     return json.dumps(Util.read_metadata(self.current))
@@ -2769,7 +2775,6 @@ class VarietyWindow(Gtk.Window):
                 if (
                     file != current_wallpaper
                     and file != new_wallpaper
-                    and file != self.post_filter_filename
                     and name.startswith(prefix)
                     and Util.is_image(name)
                 ):
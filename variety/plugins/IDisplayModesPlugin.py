@@ -14,7 +14,7 @@
 # with this program.  If not, see <http://www.gnu.org/licenses/>.
 ### END LICENSE
 import abc
-from typing import Callable, List, Optional
+from typing import Callable, List, Optional, Tuple
 
 from variety.Util import Util
 
@@ -27,17 +27,23 @@ class DisplayModeData:
     set_wallpaper_param - what do we send to the set_wallpaper script, affects OS background options
     imagemagick_cmd - optional, what command do we run over the image in order to resize it
     fixed_image_path - optional, if more complex logic needed, generate the image and give its path
+    native_op - optional, (operation, width, height) equivalent of imagemagick_cmd that Variety can
+    run in-process without ImageMagick. Operation is one of NATIVE_OPS.
     """
 
+    NATIVE_OPS = ("zoom", "fit-with-black", "fit-with-blur", "tile", "per-monitor")
+
     def __init__(
         self,
         set_wallpaper_param: str,
         imagemagick_cmd: Optional[str] = None,
         fixed_image_path: Optional[str] = None,
+        native_op: Optional[Tuple[str, int, int]] = None,
     ):
         self.set_wallpaper_param = set_wallpaper_param
         self.imagemagick_cmd = imagemagick_cmd
         self.fixed_image_path = fixed_image_path
+        self.native_op = native_op
 
 
 class DisplayMode:
@@ -46,20 +52,35 @@ class DisplayMode:
     Needs a unique id, title to show in the combobox, description to show below the combo when
     selected, and callable that implements the logic.
     The callable takes a file path and returns a DisplayModeData object.
+    Modes that only look at the image dimensions can also provide size_fn, taking the width and
+    height of the image - this spares writing the image to disk when it has been modified in memory
+    (e.g. rotated or filtered) before the display mode is applied.
+    Per-monitor modes render onto a canvas spanning all monitors - the quote and the clock are then
+    drawn on the primary monitor's part of it.
     """
 
-    def __init__(self, id: str, title: str, description: str, fn: Callable[[str], DisplayModeData]):
+    def __init__(
+        self,
+        id: str,
+        title: str,
+        description: str,
+        fn: Callable[[str], DisplayModeData],
+        size_fn: Optional[Callable[[int, int], DisplayModeData]] = None,
+        per_monitor: bool = False,
+    ):
         self.id = id
         self.title = title
         self.description = description
         self.fn = fn
+        self.size_fn = size_fn
+        self.per_monitor = per_monitor
 
 
 class StaticDisplayMode(DisplayMode):
     """
     A DisplayMode that does not care about the specific file, but implements a uses
     either a static ImageMagick command, or does no resizing at all and works simply via the
-    set_wallpaper parameter.
+    set_wallpaper parameter. native_op names the in-process equivalent of the ImageMagick command.
     """
 
     def __init__(
@@ -69,18 +90,24 @@ class StaticDisplayMode(DisplayMode):
         description: str,
         set_wallpaper_param: str,
         imagemagick_cmd: Optional[str] = None,
+        native_op: Optional[str] = None,
     ):
-        def fn(filename: str):
+        def size_fn(image_w: int, image_h: int):
             w, h = Util.get_primary_display_size()
             if imagemagick_cmd:
                 final_cmd = imagemagick_cmd.replace("%W", str(w)).replace("%H", str(h))
             else:
                 final_cmd = None
             return DisplayModeData(
-                set_wallpaper_param=set_wallpaper_param, imagemagick_cmd=final_cmd
+                set_wallpaper_param=set_wallpaper_param,
+                imagemagick_cmd=final_cmd,
+                native_op=(native_op, w, h) if native_op else None,
             )
 
-        super().__init__(id, title, description, fn)
+        def fn(filename: str):
+            return size_fn(0, 0)
+
+        super().__init__(id, title, description, fn, size_fn)
 
 
 class IDisplayModesPlugin(IVarietyPlugin):
@@ -21,6 +21,13 @@ IMAGEMAGICK_TILE = "-write mpr:x -delete -1 -size %Wx%H tile:mpr:x "
 def _smart_fn(filename):
     try:
         image_w, image_h = Util.get_size(filename)
+    except:
+        return DisplayModeData(set_wallpaper_param="zoom")
+    return _smart_size_fn(image_w, image_h)
+
+
+def _smart_size_fn(image_w, image_h):
+    try:
         primary_w, primary_h = Util.get_primary_display_size(hidpi_scaled=True)
         total_w, total_h = Util.get_multimonitor_display_size()
         if image_w * image_h * 10 < primary_w * primary_h:
@@ -28,7 +35,11 @@ def _smart_fn(filename):
             cmd = IMAGEMAGICK_TILE.replace("%W", str(primary_w)).replace(
                     "%H", str(primary_h)
             )
-            return DisplayModeData(set_wallpaper_param="zoom", imagemagick_cmd=cmd)
+            return DisplayModeData(
+                set_wallpaper_param="zoom",
+                imagemagick_cmd=cmd,
+                native_op=("tile", primary_w, primary_h),
+            )
         else:
             image_ratio = image_w / image_h
             primary_ratio = primary_w / primary_h
@@ -44,11 +55,35 @@ def _smart_fn(filename):
                 cmd = IMAGEMAGICK_FIT_WITH_BLUR.replace("%W", str(primary_w)).replace(
                     "%H", str(primary_h)
                 )
-                return DisplayModeData(set_wallpaper_param="zoom", imagemagick_cmd=cmd)
+                return DisplayModeData(
+                    set_wallpaper_param="zoom",
+                    imagemagick_cmd=cmd,
+                    native_op=("fit-with-blur", primary_w, primary_h),
+                )
     except:
         return DisplayModeData(set_wallpaper_param="zoom")
 
 
+def _per_monitor_size_fn(image_w, image_h):
+    try:
+        (canvas_w, canvas_h), rects, _ = Util.get_monitor_layout()
+        if len(rects) < 2:
+            return _smart_size_fn(image_w, image_h)
+        return DisplayModeData(
+            set_wallpaper_param="spanned", native_op=("per-monitor", canvas_w, canvas_h)
+        )
+    except:
+        return DisplayModeData(set_wallpaper_param="zoom")
+
+
+def _per_monitor_fn(filename):
+    try:
+        image_w, image_h = Util.get_size(filename)
+    except:
+        return DisplayModeData(set_wallpaper_param="zoom")
+    return _per_monitor_size_fn(image_w, image_h)
+
+
 class ResizingDisplayModesPlugin(IDisplayModesPlugin):
     @classmethod
     def get_info(cls):
@@ -72,6 +107,20 @@ class ResizingDisplayModesPlugin(IDisplayModesPlugin):
                     "look bad resized."
                 ),
                 fn=_smart_fn,
+                size_fn=_smart_size_fn,
+            ),
+            DisplayMode(
+                id="per-monitor",
+                title=_("Multi-monitor: Variety fits the image on every monitor separately"),
+                description=_(
+                    "The image is zoomed to fill each of your monitors, or fitted with a blurred "
+                    "background when its proportions are too different, taking into account their "
+                    "resolution and scaling. Set as a single wallpaper spanning all monitors. "
+                    "With a single monitor this is the same as Smart."
+                ),
+                fn=_per_monitor_fn,
+                size_fn=_per_monitor_size_fn,
+                per_monitor=True,
             ),
             StaticDisplayMode(
                 id="zoom",
@@ -83,6 +132,7 @@ class ResizingDisplayModesPlugin(IDisplayModesPlugin):
                 ),
                 set_wallpaper_param="zoom",
                 imagemagick_cmd=IMAGEMAGICK_ZOOM,
+                native_op="zoom",
             ),
             StaticDisplayMode(
                 id="fill-with-black",
@@ -94,6 +144,7 @@ class ResizingDisplayModesPlugin(IDisplayModesPlugin):
                 ),
                 set_wallpaper_param="zoom",
                 imagemagick_cmd=IMAGEMAGICK_FIT_WITH_BLACK,
+                native_op="fit-with-black",
             ),
             StaticDisplayMode(
                 id="fill-with-blur",
@@ -104,6 +155,7 @@ class ResizingDisplayModesPlugin(IDisplayModesPlugin):
                 ),
                 set_wallpaper_param="zoom",
                 imagemagick_cmd=IMAGEMAGICK_FIT_WITH_BLUR,
+                native_op="fit-with-blur",
             ),
         ]
 
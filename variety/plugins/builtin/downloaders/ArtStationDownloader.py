@@ -32,7 +32,7 @@ class ArtStationDownloader(DefaultDownloader):
         queue = []
         # json_url = ArtStationDownloader.build_json_url(self.config)
         url = self.config
-        s = Util.html_soup(url)
+        s = Util.html_soup(url, cache_ttl=self.source.get_cache_ttl())
         author = s.find("channel").find("title").get_text().strip()
         author_url = s.find("channel").find("link").next.strip()
         items = s.findAll("item")
@@ -53,12 +53,16 @@ class BingDownloader(SimpleDownloader):
     def get_source_location(self):
         return "https://www.bing.com/gallery/"
 
+    def get_cache_ttl(self):
+        # there is a new image once a day
+        return 3600
+
     def get_local_filename(self, url):
         return parse_qs(urlparse(url).query)["id"][0]
 
     def fill_queue(self):
         queue = []
-        s = Util.fetch_json(BingDownloader.BING_JSON_URL)
+        s = Util.fetch_json(BingDownloader.BING_JSON_URL, cache_ttl=self.get_cache_ttl())
         for item in s["images"]:
             try:
                 if not item["wp"]:
@@ -54,10 +54,14 @@ class EarthviewDownloader(SimpleDownloader):
         return self.ROOT_URL
 
     def fill_queue(self):
-        queue = Util.fetch_json(DATA_URL)
+        queue = Util.fetch_json(DATA_URL, cache_ttl=self.get_cache_ttl())
         random.shuffle(queue)
         return queue
 
+    def get_cache_ttl(self):
+        # the list of all photos changes very rarely
+        return 24 * 3600
+
     def get_default_throttling(self):
         # throttle this source, as otherwise maps "overpower" all other types of images
         # with Variety's default settings, and we have no other way to control source "weights"
@@ -35,8 +35,8 @@ class MediaRSSDownloader(DefaultDownloader):
         DefaultDownloader.__init__(self, source=source, config=url)
 
     @staticmethod
-    def fetch(url):
-        content = Util.fetch_bytes(url)
+    def fetch(url, cache_ttl=None):
+        content = Util.fetch_bytes(url, cache_ttl=cache_ttl)
         return ET.fromstring(content)
 
     @staticmethod
@@ -87,7 +87,7 @@ class MediaRSSDownloader(DefaultDownloader):
     def fill_queue(self):
         queue = []
         logger.info(lambda: "MediaRSS URL: " + self.config)
-        s = self.fetch(self.config)
+        s = self.fetch(self.config, cache_ttl=self.source.get_cache_ttl())
 
         for item in s.findall(".//item"):
             try:
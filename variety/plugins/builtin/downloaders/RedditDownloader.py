@@ -49,7 +49,7 @@ class RedditDownloader(DefaultDownloader):
 
         queue = []
         json_url = RedditDownloader.build_json_url(self.config)
-        s = Util.fetch_json(json_url)
+        s = Util.fetch_json(json_url, cache_ttl=self.source.get_cache_ttl())
         for item in s["data"]["children"]:
             try:
                 data = item["data"]
@@ -15,10 +15,14 @@
 ### END LICENSE
 import abc
 import collections
+import json
 import logging
 import os
+import time
 
+from variety import ResumableDownload
 from variety.plugins.downloaders.Downloader import Downloader
+from variety.ResumableDownload import DownloadInterrupted
 from variety.Util import Util
 
 logger = logging.getLogger("variety")
@@ -77,9 +81,15 @@ SAFE_MODE_BLACKLIST = {
 
 
 class DefaultDownloader(Downloader, metaclass=abc.ABCMeta):
+    # queue items older than this are not reused after a restart, as image URLs may expire
+    MAX_QUEUE_AGE = 24 * 3600
+
     def __init__(self, source, config=None):
         super().__init__(source, config)
         self.queue = []
+        self.queue_filled_at = None
+        # problems saving the queue are logged once, not on every download
+        self.queue_save_warned = False
 
     @abc.abstractmethod
     def fill_queue(self):
@@ -141,6 +151,7 @@ class DefaultDownloader(Downloader, metaclass=abc.ABCMeta):
             items = self.fill_queue()
             for item in items:
                 self.queue.append(item)
+            self.queue_filled_at = time.time()
 
         if not self.queue:
             logger.info(lambda: "%s: Queue still empty after fill request" % name)
@@ -150,7 +161,95 @@ class DefaultDownloader(Downloader, metaclass=abc.ABCMeta):
 
         self.source.register_download()
         queue_item = self.queue.pop()
-        return self.download_queue_item(queue_item)
+        self.save_queue()
+        try:
+            return self.download_queue_item(queue_item)
+        except DownloadInterrupted:
+            # try it again after the rest of the queue, the download will be resumed then.
+            # It is given up after ResumableDownload.MAX_ATTEMPTS attempts.
+            self.queue.insert(0, queue_item)
+            self.save_queue()
+            raise
+
+    def update_download_folder(self, global_download_folder):
+        target_folder = super().update_download_folder(global_download_folder)
+        if not self.queue:
+            self._load_queue()
+        return target_folder
+
+    def _queue_file(self):
+        return os.path.join(self.target_folder, "queue.json")
+
+    def _load_queue(self):
+        """
+        Restores the queue saved by save_queue, so that restarts don't spend a queue fill
+        (see ImageSource.get_throttling). Items are stored as JSON, so tuples (and QueueItems)
+        come back as plain tuples.
+        """
+        try:
+            with open(self._queue_file(), encoding="utf8") as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception:
+            logger.exception(lambda: "Could not load the saved queue of %s" % self.config)
+            return
+
+        try:
+            filled_at = float(saved["filled_at"])
+            items = saved["items"]
+            if saved["config"] != self.config or not isinstance(items, list):
+                raise ValueError("Saved queue is for another config")
+        except (KeyError, TypeError, ValueError):
+            logger.warning(lambda: "Ignoring invalid saved queue of %s" % self.config)
+            return
+        if not 0 <= time.time() - filled_at < self.MAX_QUEUE_AGE:
+            logger.info(lambda: "Saved queue of %s is outdated, ignoring it" % self.config)
+            return
+
+        self.queue = [tuple(item) if isinstance(item, list) else item for item in items]
+        self.queue_filled_at = filled_at
+        logger.info(
+            lambda: "%s: Restored a queue of %d URLs" % (self.get_source_name(), len(self.queue))
+        )
+
+    def _warn_queue_save(self, message):
+        if not self.queue_save_warned:
+            self.queue_save_warned = True
+            logger.warning(lambda: "%s: %s" % (self.config, message))
+
+    def save_queue(self):
+        """
+        Persists the queue as JSON next to state.json, see _load_queue. Items that are not
+        JSON-serializable are left out.
+        """
+        if self.target_folder is None:
+            return
+        items = []
+        for item in self.queue:
+            try:
+                json.dumps(item)
+                items.append(item)
+            except (TypeError, ValueError):
+                pass
+        if len(items) < len(self.queue):
+            self._warn_queue_save("Queue items that are not JSON-serializable are not saved")
+
+        path = self._queue_file()
+        if not items:
+            Util.safe_unlink(path)
+            return
+        tmp = "%s.%s.tmp" % (path, Util.random_hash())
+        try:
+            with open(tmp, "w", encoding="utf8") as f:
+                json.dump(
+                    {"config": self.config, "filled_at": self.queue_filled_at, "items": items}, f
+                )
+            # the previously saved queue is only replaced once the new one is complete
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError) as e:
+            self._warn_queue_save("Could not save the queue: %s" % e)
+            Util.safe_unlink(tmp)
 
     def is_in_downloaded(self, image_url):
         return os.path.exists(self._local_filepath(url=image_url))
@@ -230,17 +329,15 @@ class DefaultDownloader(Downloader, metaclass=abc.ABCMeta):
             return None
 
         try:
-            r = Util.request(
-                image_url, stream=True, headers=request_headers, **(request_kwargs or {})
+            # an interrupted download is kept and resumed on the next try
+            ResumableDownload.download(
+                image_url, local_filepath_partial, headers=request_headers, **(request_kwargs or {})
             )
-            with open(local_filepath_partial, "wb") as f:
-                Util.request_write_to(r, f)
         except Exception as e:
             logger.info(
                 lambda: "Download failed from image URL: %s (source location: %s) "
                 % (image_url, source_location)
             )
-            Util.safe_unlink(local_filepath_partial)
             raise e
 
         if not Util.is_image(local_filepath_partial, check_contents=True):
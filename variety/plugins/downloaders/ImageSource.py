@@ -110,6 +110,16 @@ class ImageSource(IVarietyPlugin, metaclass=abc.ABCMeta):
         """
         return Throttling(max_downloads_per_hour=None, max_queue_fills_per_hour=None)
 
+    def get_cache_ttl(self):
+        """
+        Feeds and API responses that downloaders fetch with the cache_ttl parameter of Util.request
+        are reused without any request for this many seconds after they were fetched, and are
+        revalidated with a conditional request after that. The default of 0 revalidates them on
+        every fetch. Sources whose listings change rarely can return a longer time.
+        :return: time in seconds
+        """
+        return 0
+
     def get_server_options_key(self):
         """
         Key under the the server-side throttling options where the configs for this source reside.
@@ -174,6 +184,18 @@ class ImageSource(IVarietyPlugin, metaclass=abc.ABCMeta):
             or self._count_last_hour_downloads() < max_downloads_per_hour
         )
 
+    def get_next_download_time(self):
+        """
+        Returns the time from which is_download_allowed will return True again, if nothing else is
+        downloaded from this source until then.
+        """
+        max_downloads_per_hour, _ = self.get_throttling()
+        excess = self._count_last_hour_downloads() - (max_downloads_per_hour or 0)
+        if max_downloads_per_hour is None or excess < 0:
+            return time.time()
+        # the oldest downloads have to drop out of the last hour first
+        return sorted(self._last_download_times)[excess] + 3600
+
     def register_download(self):
         self._last_download_times.append(time.time())
 